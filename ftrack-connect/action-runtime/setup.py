@@ -0,0 +1,28 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2019 c.arlt@unexpected.de
+# :license: GPL-3.0
+
+'''
+Installs the shared runtime of the actions (`pip install ./action-runtime`)
+
+Not needed for ftrack-connect, as every hook finds the runtime next to it.
+Install it to use the runtime in other actions, events or scripts.
+'''
+
+from setuptools import setup
+
+
+setup(
+    name='unex-runtime',
+    version='0.1.0',
+    description='Shared runtime for the unexpected ftrack-connect actions',
+    author='unexpected',
+    author_email='c.arlt@unexpected.de',
+    license='GPL-3.0',
+    packages=['unex_runtime'],
+    install_requires=[
+        'ftrack-python-api',
+        'ftrack-action-handler',
+        'requests'
+    ]
+)
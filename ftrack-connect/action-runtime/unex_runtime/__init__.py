@@ -0,0 +1,5 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2019 c.arlt@unexpected.de
+# :license: GPL-3.0
+
+'''Shared runtime for the unexpected ftrack-connect actions'''
@@ -0,0 +1,421 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2019 c.arlt@unexpected.de
+# :license: GPL-3.0
+
+'''
+Everything an action needs besides its own discover and launch
+
+Every `hook/action.py` used to carry its own copy of these. An action now
+derives from `UnexAction` and its module just needs:
+
+    def register(session, **kw):
+        register_actions(session, unexMyAction)
+
+    def main(arguments=None):
+        return listen(register, arguments)
+
+Jobs take their session from `JOB_SESSIONS` instead of creating a new one
+each time, which saves connecting and loading the schema on every launch:
+
+    with JOB_SESSIONS.session() as session:
+        ...
+'''
+
+import contextlib
+import logging
+import threading
+
+import ftrack_api
+
+from ftrack_action_handler.action import BaseAction
+
+from unex_runtime.discovery import BudgetedReply, DiscoverCache
+from unex_runtime.dispatch import Dispatcher
+from unex_runtime.lazy import lazy_import
+from unex_runtime.metrics import serve_metrics
+
+# Not every action exports something, so these are imported once needed
+argparse = lazy_import('argparse')
+export = lazy_import('unex_runtime.export')
+
+
+#: Sessions kept open for the next job
+POOL_SIZE = 2
+
+#: Ids per query when resolving a selection
+RESOLVE_CHUNK_SIZE = 250
+
+
+def getRealEntityFromTypedContext(session, entity):
+    '''
+    This one will return you a real entity behind a TypedContext-entity
+
+    *session* is a `ftrack_api.Session` instance
+
+    *entity* should be a tuple containing the entity type of `TypedContext`
+    and (more important) the entity id.
+    '''
+    return session.get(entity[0], entity[1])
+
+
+def getRealEntitiesFromTypedContext(session, entities, projections=None, chunkSize=RESOLVE_CHUNK_SIZE):
+    '''
+    Returns the real entities behind a whole selection (in the same order)
+
+    Instead of a `session.get` per selected entity, the selection is grouped
+    by entity type and each group is fetched with one `where id in (...)`
+    query per *chunkSize* ids. Entities which do not exist (anymore) are
+    returned as None, like `getRealEntityFromTypedContext` does.
+
+    *session* is a `ftrack_api.Session` instance
+
+    *entities* is a list of tuples each containing the entity type and the entity id.
+
+    *projections* may map an entity type to the attributes to fetch along with the
+    entities, e.g. `{'TypedContext': ['name', 'status.name']}`, so accessing these
+    does not cost a round trip each later on.
+    '''
+    groups = {}
+    seen = set()
+    for entity in entities:
+        if (entity[0], entity[1]) not in seen:
+            seen.add((entity[0], entity[1]))
+            groups.setdefault(entity[0], []).append(entity[1])
+
+    found = {}
+    for entityType, ids in groups.items():
+        attributes = (projections or {}).get(entityType)
+        select = u''
+        if attributes:
+            select = u'select {0} from '.format(', '.join(['id'] + [name for name in attributes if name != 'id']))
+
+        for start in range(0, len(ids), chunkSize):
+            for realEntity in session.query(
+                u'{0}{1} where id in ({2})'.format(select, entityType, get_filter_string(ids[start:start + chunkSize]))
+            ):
+                found[(entityType, realEntity['id'])] = realEntity
+
+    return [found.get((entity[0], entity[1])) for entity in entities]
+
+
+def get_filter_string(entity_ids):
+    '''Return a comma separated string of quoted ids from *entity_ids* list.'''
+    return ', '.join(
+        '"{0}"'.format(entity_id) for entity_id in entity_ids
+    )
+
+
+def run_async(fn):
+    '''Run *fn* asynchronously.'''
+    def wrapper(*args, **kwargs):
+        thread = threading.Thread(target=fn, args=args, kwargs=kwargs)
+        thread.start()
+    return wrapper
+
+
+def job_session():
+    '''Returns a new session for running a job (without events)'''
+    return ftrack_api.Session(
+        auto_connect_event_hub=False
+    )
+
+
+def reset_session(session):
+    '''Clears the cache of *session* and drops anything not committed'''
+    session.reset()
+    vars(session).pop(export.LOCATION_KEY, None)
+
+
+def clear_session(session):
+    '''
+    Clears the cache of *session* and drops anything not committed
+
+    Unlike `reset_session`, the locations are not configured again, which
+    makes this cheap enough to run after every event. The ftrack.server
+    location looked up before stays configured, so it is kept.
+    '''
+    session.recorded_operations.clear()
+    session.cache.clear()
+
+
+class SessionPool(object):
+    '''
+    Sessions for jobs, kept open between them
+
+    A session is only used by one job at a time. When it is given back, it
+    forgets everything it fetched (so the next job sees fresh data) and is
+    kept for the next job, unless there are *size* idle sessions already.
+    '''
+
+    def __init__(self, size=POOL_SIZE, factory=job_session):
+        self.size = size
+        self.factory = factory
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+
+        return self.factory()
+
+    def release(self, session, reusable=True):
+        '''Gives *session* back, it is closed if it is not *reusable* or not needed'''
+        if reusable:
+            try:
+                reset_session(session)
+            except Exception:
+                logging.getLogger(__name__).exception('Could not reset a session of the pool')
+                reusable = False
+
+        with self.lock:
+            if (reusable and len(self.idle) < self.size):
+                self.idle.append(session)
+                return
+
+        session.close()
+
+    @contextlib.contextmanager
+    def session(self):
+        '''A session for the `with` block (not reused, if the block raised)'''
+        session = self.acquire()
+        reusable = False
+        try:
+            yield session
+            reusable = True
+        finally:
+            self.release(session, reusable)
+
+    def close(self):
+        '''Closes all idle sessions'''
+        with self.lock:
+            idle, self.idle = self.idle, []
+
+        for session in idle:
+            session.close()
+
+
+#: Sessions of the jobs of all actions of this process
+JOB_SESSIONS = SessionPool()
+
+#: Runs the discover and launch callbacks of all actions of this process
+DISPATCHER = Dispatcher(job_session, clear_session)
+
+
+class UnexAction(BaseAction):
+    '''
+    Base of all actions in here
+
+    Adds the `variant` to the items shown in the Actions Panel and looks up
+    the ftrack.server location only once.
+
+    Discover and launch run on the workers of `DISPATCHER`, so a slow action
+    does not hold up the others. There, `session` is the worker's own session,
+    which launch gets without any data of earlier callbacks.
+
+    If discover takes longer than `discoverBudget`, its last decision for the
+    same selection is replied instead (or `discoverFallback`, if there is
+    none). Launching such a selection checks it with discover first.
+    '''
+
+    #: Discover or launch callbacks of this action running at the same time (each)
+    concurrency = 2
+
+    #: Seconds until the Actions Panel does not need the reply of a discover anymore
+    discoverTimeout = 10.0
+
+    #: Seconds until a launch is not answered anymore
+    launchTimeout = 60.0
+
+    #: Seconds the Actions Panel waits for the decision of discover at most
+    discoverBudget = 0.3
+
+    #: Show the action if discover takes too long and did not decide on the selection before
+    discoverFallback = True
+
+    def __init__(self, session):
+        super(UnexAction, self).__init__(session)
+        self.discoverCache = DiscoverCache()
+
+    @property
+    def session(self):
+        '''Return the session of this event worker, or the one of the event hub.'''
+        return DISPATCHER.session() or self._session
+
+    def subscribe(self, subscription, callback, timeout, budget=None, fallback=None, reset=True):
+        '''
+        Subscribes to *subscription*, *callback* runs on a worker and its result is sent as reply
+
+        With a *budget*, the result of *fallback* is sent instead, if *callback*
+        did not finish within *budget* seconds after the event arrived.
+
+        Without *reset*, *callback* may see what the worker fetched shortly
+        before (see `Dispatcher.submit`).
+        '''
+        hub = self._session.event_hub
+        key = u'{0} ({1})'.format(self.identifier, callback.__name__.strip('_'))
+
+        def dispatch(event):
+            def reply(data):
+                hub.publish_reply(event, data)
+
+            if budget is None:
+                DISPATCHER.submit(key, self.concurrency, timeout, lambda: callback(event), reply, reset)
+                return
+
+            budgeted = BudgetedReply(reply, budget, lambda: fallback(event))
+
+            def answer():
+                budgeted.send(callback(event))
+
+            DISPATCHER.submit(key, self.concurrency, timeout, answer, reply, reset)
+
+        hub.subscribe(subscription, dispatch)
+
+    def register(self):
+        '''Registers the action for the user running it'''
+        self.subscribe(
+            'topic=ftrack.action.discover and source.user.username={0}'.format(
+                self._session.api_user
+            ),
+            self._discover,
+            self.discoverTimeout,
+            self.discoverBudget,
+            self.guessDiscover,
+            reset=False
+        )
+
+        self.subscribe(
+            'topic=ftrack.action.launch and data.actionIdentifier={0} and source.user.username={1}'.format(
+                self.identifier, self._session.api_user
+            ),
+            self._launch,
+            self.launchTimeout
+        )
+
+    @property
+    def ftrack_server_location(self):
+        '''Return the ftrack.server location.'''
+        return export.server_location(self.session)
+
+    def discoverKey(self, event):
+        '''Returns the user and the selection of *event*, which the decision of discover depends on'''
+        return (
+            event['source'].get('user', {}).get('id'),
+            tuple((item.get('entityType'), item.get('entityId')) for item in event['data'].get('selection', []))
+        )
+
+    def decide(self, event):
+        '''Returns if the action is shown for the selection of *event* (and remembers that)'''
+        args = self._translate_event(
+            self.session, event
+        )
+
+        accepts = bool(self.discover(
+            self.session, *args
+        ))
+        self.discoverCache.set(self.discoverKey(event), accepts)
+
+        return accepts
+
+    def guessDiscover(self, event):
+        '''Returns the reply, if discover takes too long: its last decision or `discoverFallback`'''
+        accepts = self.discoverCache.get(self.discoverKey(event))
+        self.logger.debug(u'Discover of {0} took too long, answering with {1}'.format(
+            self.identifier, 'the last decision' if accepts is not None else 'the fallback'
+        ))
+
+        return self.discoverItems(self.discoverFallback if accepts is None else accepts)
+
+    def _discover(self, event):
+        '''Returns the parameters to show the interaction icon in the Actions Panel'''
+        return self.discoverItems(self.decide(event))
+
+    def _launch(self, event):
+        '''Launches the action, after checking the selection if discover did not decide on it yet'''
+        accepts = self.discoverCache.get(self.discoverKey(event))
+        if accepts is None:
+            accepts = self.decide(event)
+
+        if not accepts:
+            return {
+                'success': False,
+                'message': '{0} is not available for this selection.'.format(self.label)
+            }
+
+        return super(UnexAction, self)._launch(event)
+
+    def discoverItems(self, accepts):
+        '''Returns the parameters to show the interaction icon, if the action *accepts* the selection'''
+        if accepts:
+            return {
+                'items': [{
+                    'label': self.label,
+                    'variant': self.variant,
+                    'description': self.description,
+                    'actionIdentifier': self.identifier,
+                    'icon': self.icon,
+                }]
+            }
+
+
+def register_actions(session, *actions):
+    '''
+    Registers an instance of each class in *actions* with *session*
+
+    Returns False, if *session* is not a `ftrack_api.Session` (e.g. ftrack-connect
+    calling with an old or incompatible API), so nothing is registered.
+    '''
+    if not isinstance(session, ftrack_api.session.Session):
+        return False
+
+    # The workers connect their sessions while ftrack-connect goes on
+    DISPATCHER.start()
+
+    for action in actions:
+        action(session).register()
+
+    # Only serves the metrics, if UNEX_METRICS_PORT is set
+    serve_metrics()
+    return True
+
+
+def argument_parser(**kwargs):
+    '''Returns an `argparse.ArgumentParser` with the option `--verbosity`'''
+    parser = argparse.ArgumentParser(**kwargs)
+
+    parser.add_argument(
+        '-v', '--verbosity',
+        help='Set the logging output verbosity.',
+        choices=[logging.getLevelName(level).lower() for level in (
+            logging.NOTSET, logging.DEBUG, logging.INFO, logging.WARNING,
+            logging.ERROR, logging.CRITICAL
+        )],
+        default='info'
+    )
+
+    return parser
+
+
+def setup_logging(namespace):
+    '''Set up basic logging with the verbosity of the parsed *namespace*'''
+    logging.basicConfig(level=getattr(logging, namespace.verbosity.upper()))
+
+
+def wait(session):
+    '''Waits for events of *session* until Ctrl-C'''
+    logging.info(
+        'Registered actions and listening for events. Use Ctrl-C to abort.'
+    )
+    session.event_hub.wait()
+
+
+def listen(register, arguments=None):
+    '''Set up logging, *register* the actions of a hook and wait for events.'''
+    namespace = argument_parser().parse_args(arguments or [])
+    setup_logging(namespace)
+
+    session = ftrack_api.Session()
+    register(session)
+    wait(session)
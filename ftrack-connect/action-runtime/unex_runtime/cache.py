@@ -0,0 +1,80 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2019 c.arlt@unexpected.de
+# :license: GPL-3.0
+
+'''
+Reuse of previous exports
+
+Each exported component is tagged with a key in its metadata. The key is
+built from the action, the selection, the settings and a version of the
+underlying data. If a later export ends up with the same key, its job simply
+points to the component that was already uploaded. As the key is stored on
+the server, this works across users and machines.
+'''
+
+import hashlib
+import json
+
+
+#: Metadata key used to tag exported components
+CACHE_KEY = 'unex_export_key'
+
+
+def export_key(identifier, entities, settings, version):
+    '''
+    Return the cache key of an export
+
+    *identifier* is the action's identifier, *entities* the selection (list
+    of `(entity_type, entity_id)`), *settings* a dictionary of everything
+    that changes the output and *version* a string that changes whenever the
+    exported data changes (see `data_version`).
+    '''
+    data = {
+        'identifier': identifier,
+        'entities': sorted([list(entity) for entity in entities]),
+        'settings': settings,
+        'version': version
+    }
+
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def data_version(rows, attributes):
+    '''
+    Return a digest over *attributes* of all entities in *rows*
+
+    *rows* are usually the result of a query projecting just these
+    attributes, so getting them is much cheaper than the export itself. The
+    order of the rows does not matter.
+    '''
+    values = sorted(
+        [u'{0}'.format(row[attribute]) for attribute in attributes]
+        for row in rows
+    )
+
+    return hashlib.sha1(json.dumps(values).encode('utf-8')).hexdigest()
+
+
+def find_cached(session, key):
+    '''Return a component on the ftrack server that is tagged with *key* (or None)'''
+    return session.query(
+        u'select id, name from Component where metadata any (key is "{0}" and value is "{1}") '
+        u'and component_locations any (location.name is "ftrack.server")'.format(CACHE_KEY, key)
+    ).first()
+
+
+def attach_cached(session, job, component, description):
+    '''Point *job* to the existing *component* and set it to done with a single commit'''
+    session.create(
+        'JobComponent',
+        {
+            'component_id': component['id'],
+            'job_id': job['id']
+        }
+    )
+
+    job['status'] = 'done'
+    job['data'] = json.dumps({
+        'description': description
+    })
+    session.commit()
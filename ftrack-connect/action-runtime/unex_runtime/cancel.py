@@ -0,0 +1,93 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2019 c.arlt@unexpected.de
+# :license: GPL-3.0
+
+'''
+Cooperative cancellation of running jobs
+
+A job counts as cancelled as soon as it is deleted (e.g. by clearing the job
+list) or its status is set to anything but running (e.g. killed). Long loops
+call `CancelToken.check()` between their batches, which polls the job's
+status at most every few seconds and raises `ExportCancelled` if the job is
+gone.
+'''
+
+import json
+import time
+
+
+#: Statuses of a job that is still supposed to run
+RUNNING_STATUSES = ('queued', 'running')
+
+
+class ExportCancelled(Exception):
+    '''Raised when the job of a running export was cancelled'''
+
+
+class CancelToken(object):
+    '''
+    Cancellation state of *job*
+
+    The status of the job is fetched with *session* at most every *interval*
+    seconds, so calling `check()` often is cheap.
+    '''
+
+    def __init__(self, session, job, interval=2.0, clock=time.time):
+        self.session = session
+        self.job_id = job['id']
+        self.interval = interval
+        self.clock = clock
+
+        self.cancelled = False
+        self.last_poll = clock()
+
+    def cancel(self):
+        '''Cancel locally (without asking the server)'''
+        self.cancelled = True
+
+    def poll(self):
+        '''Ask the server if the job is still running and return if it was cancelled'''
+        self.last_poll = self.clock()
+
+        job = self.session.query(
+            u'select status from Job where id is "{0}"'.format(self.job_id)
+        ).first()
+
+        if (job is None or job['status'] not in RUNNING_STATUSES):
+            self.cancelled = True
+
+        return self.cancelled
+
+    def check(self):
+        '''Raise `ExportCancelled` if the job was cancelled (polls if it is time to)'''
+        if (not self.cancelled and self.clock() - self.last_poll >= self.interval):
+            self.poll()
+
+        if self.cancelled:
+            raise ExportCancelled('Job {0} was cancelled'.format(self.job_id))
+
+
+def checked(items, token):
+    '''Yield all *items*, checking *token* before each one'''
+    for item in items:
+        token.check()
+        yield item
+
+
+def end_cancelled_job(session, job):
+    '''
+    Tidy up after *job* was cancelled
+
+    Anything pending is rolled back. If the job still exists, it is marked
+    as killed.
+    '''
+    session.rollback()
+
+    if session.query(u'select id from Job where id is "{0}"'.format(job['id'])).first() is None:
+        return
+
+    job['status'] = 'killed'
+    job['data'] = json.dumps({
+        'description': 'Cancelled'
+    })
+    session.commit()
@@ -0,0 +1,100 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2019 c.arlt@unexpected.de
+# :license: GPL-3.0
+
+'''
+Discover replies within a latency budget
+
+Many discover callbacks fetch the selected entity to decide if the action is
+shown. When the ftrack server is slow, this holds up the Actions Panel. With
+a budget, the reply is sent after a few hundred milliseconds at the latest:
+
+- If the discover callback finished by then, its decision is sent.
+- Otherwise the last decision for the same selection is sent (from a
+  `DiscoverCache`), or the action is shown, if there is none. The callback
+  keeps running and updates the cache for the next time.
+
+Actions shown this way have to check the selection at launch, as it was not
+checked before (see `unex_runtime.action.UnexAction`).
+'''
+
+import collections
+import threading
+import time
+
+
+#: Decisions kept per action
+CACHE_SIZE = 1000
+
+#: Seconds a decision is used at most
+CACHE_AGE = 3600.0
+
+
+class DiscoverCache(object):
+    '''The last discover decisions of an action (the newest *size*, at most *maxAge* seconds old)'''
+
+    def __init__(self, size=CACHE_SIZE, maxAge=CACHE_AGE, clock=time.time):
+        self.size = size
+        self.maxAge = maxAge
+        self.clock = clock
+
+        self.lock = threading.Lock()
+        self.decisions = collections.OrderedDict()
+
+    def get(self, key):
+        '''Returns the decision for *key*, or None if there is none (or it is too old)'''
+        with self.lock:
+            decision = self.decisions.get(key)
+            if decision is None:
+                return None
+
+            accepts, decided = decision
+            if (self.clock() - decided > self.maxAge):
+                del self.decisions[key]
+                return None
+
+            return accepts
+
+    def set(self, key, accepts):
+        with self.lock:
+            self.decisions.pop(key, None)
+            self.decisions[key] = (bool(accepts), self.clock())
+
+            while (len(self.decisions) > self.size):
+                self.decisions.popitem(last=False)
+
+
+class BudgetedReply(object):
+    '''
+    Sends the reply to a single event once
+
+    Whatever comes first is sent with *reply*: the result given to `send`, or
+    the one of *fallback* after *budget* seconds. None is never sent.
+    '''
+
+    def __init__(self, reply, budget, fallback):
+        self.reply = reply
+        self.fallback = fallback
+
+        self.lock = threading.Lock()
+        self.sent = False
+
+        self.timer = threading.Timer(budget, self.expire)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def expire(self):
+        self.send(self.fallback())
+
+    def send(self, data):
+        '''Sends *data*, unless a reply was sent already. Returns if it was sent.'''
+        with self.lock:
+            if self.sent:
+                return False
+            self.sent = True
+
+        self.timer.cancel()
+        if data is not None:
+            self.reply(data)
+
+        return True
@@ -0,0 +1,201 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2019 c.arlt@unexpected.de
+# :license: GPL-3.0
+
+'''
+Event callbacks on a pool of worker threads
+
+The event hub calls its subscribers one after another on its own thread. A
+slow callback (e.g. a discover looking at a network share) delays every
+other action's discovery, for every user of that ftrack-connect.
+
+`DISPATCHER` runs the callbacks on a few worker threads instead and sends
+their replies once they are done. Per action and topic only *limit*
+callbacks run at the same time, the others wait for them (not for the
+workers), so a slow action cannot take all of the workers.
+
+A reply is only useful for a while: a callback which did not start within
+its *timeout* is skipped, and a reply which is later than that is dropped.
+Both are logged, so slow actions show up.
+
+ftrack_api sessions must not be shared between threads, so every worker
+has a session of its own (see `Dispatcher.session`). The workers are
+started when the actions are registered (see `Dispatcher.start`) and each
+one connects its session right away, all at the same time and without
+holding up ftrack-connect. Events arriving before that wait until a worker
+is ready. Its cache is cleared
+before and after every launch, so a launch never works on outdated data.
+Discover only reads, so it keeps what the worker fetched before, for
+`DATA_AGE` seconds at most.
+'''
+
+import collections
+import logging
+import os
+import threading
+import time
+
+
+#: Environment variable with the number of worker threads
+WORKERS_VARIABLE = 'UNEX_EVENT_WORKERS'
+
+#: Worker threads, if the environment variable is not set
+DEFAULT_WORKERS = 4
+
+#: Seconds a callback without reset may use what its worker fetched before
+DATA_AGE = 30.0
+
+
+class Dispatcher(object):
+    '''
+    Runs callbacks on *workers* threads (see `start`)
+
+    Each worker creates its own session with *sessionFactory* when it starts
+    (or when it first needs one, if that failed), which is cleared with *resetSession* around the callbacks that ask for
+    a reset (and once it holds data older than *dataAge* seconds).
+    '''
+
+    def __init__(self, sessionFactory, resetSession, workers=None, logger=None, clock=time.time, dataAge=DATA_AGE):
+        self.sessionFactory = sessionFactory
+        self.resetSession = resetSession
+        self.workers = int(workers or os.environ.get(WORKERS_VARIABLE) or DEFAULT_WORKERS)
+        self.dataAge = dataAge
+        self.logger = logger or logging.getLogger(__name__)
+        self.clock = clock
+
+        self.condition = threading.Condition()
+        self.ready = collections.deque()
+        self.waiting = {}
+        self.active = {}
+        self.threads = []
+        self.local = threading.local()
+
+    def session(self):
+        '''Returns the session of the current worker thread, or None outside of the workers'''
+        if not getattr(self.local, 'worker', False):
+            return None
+
+        if getattr(self.local, 'session', None) is None:
+            self.local.session = self.sessionFactory()
+        return self.local.session
+
+    def createSession(self):
+        '''Returns a new session for a worker, or None if it cannot be created now'''
+        try:
+            return self.sessionFactory()
+        except Exception:
+            self.logger.exception('Could not create the session of an event worker')
+            return None
+
+    def submit(self, key, limit, timeout, callback, reply, reset=True):
+        '''
+        Runs *callback* on a worker and calls *reply* with its result
+
+        No more than *limit* callbacks of the same *key* (e.g. an action and a
+        topic) run at the same time. *reply* is not called if the result is
+        None or if *callback* took longer than *timeout* seconds (including
+        the time it waited).
+
+        With *reset*, the worker's session is cleared before and after
+        *callback*, so it only sees what it fetched itself.
+        '''
+        task = (key, callback, reply, self.clock() + timeout, timeout, reset)
+
+        self.start()
+
+        with self.condition:
+            if (self.active.get(key, 0) < limit):
+                self.active[key] = self.active.get(key, 0) + 1
+                self.ready.append(task)
+                self.condition.notify()
+            else:
+                self.waiting.setdefault(key, collections.deque()).append(task)
+
+    def start(self):
+        '''
+        Starts the workers, unless they are running already
+
+        Called when the actions are registered (and on first use), so the
+        workers connect their sessions before the first events arrive. This
+        returns right away, the sessions are created on the workers.
+        '''
+        with self.condition:
+            while (len(self.threads) < self.workers):
+                thread = threading.Thread(target=self.work, name='unex-event-worker-{0}'.format(len(self.threads) + 1))
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+
+    def work(self):
+        self.local.worker = True
+
+        # A worker only takes callbacks once its session is ready
+        self.local.session = self.createSession()
+
+        while True:
+            with self.condition:
+                while not self.ready:
+                    self.condition.wait()
+                task = self.ready.popleft()
+
+            try:
+                self.run(*task)
+            finally:
+                self.done(task[0])
+
+    def done(self, key):
+        '''Starts the next waiting callback of *key*, if there is one'''
+        with self.condition:
+            waiting = self.waiting.get(key)
+            if waiting:
+                self.ready.append(waiting.popleft())
+                self.condition.notify()
+            else:
+                self.active[key] -= 1
+
+    def run(self, key, callback, reply, deadline, timeout, reset):
+        if (self.clock() > deadline):
+            self.logger.warning(u'Skipped {0}: it waited longer than {1}s to start'.format(key, timeout))
+            return
+
+        fetched = getattr(self.local, 'fetched', None)
+        if (fetched is not None and (reset or self.clock() - fetched > self.dataAge)):
+            self.reset()
+
+        try:
+            result = callback()
+        except Exception:
+            self.logger.exception(u'Callback of {0} failed'.format(key))
+            return
+        finally:
+            if getattr(self.local, 'fetched', None) is None:
+                self.local.fetched = self.clock()
+            if reset:
+                self.reset()
+
+        if result is None:
+            return
+
+        if (self.clock() > deadline):
+            self.logger.warning(u'Dropped the reply of {0}: it took longer than {1}s'.format(key, timeout))
+            return
+
+        try:
+            reply(result)
+        except Exception:
+            self.logger.exception(u'Could not reply for {0}'.format(key))
+
+    def reset(self):
+        '''Clears the cache of this worker's session, so the next callback fetches fresh data'''
+        self.local.fetched = None
+
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            return
+
+        try:
+            self.resetSession(session)
+        except Exception:
+            self.logger.exception('Could not reset the session of an event worker')
+            self.local.session = None
+            session.close()
@@ -0,0 +1,255 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2019 c.arlt@unexpected.de
+# :license: GPL-3.0
+
+'''
+Streaming export pipeline for actions that return a file with their job
+
+An export consists of three stages:
+
+- *fetch* returns an iterable of entities (e.g. a generator over query pages)
+- *transform* turns these entities into text chunks (this is the format)
+- *sink* writes the chunks to a temporary file, optionally gzip-compressed
+
+Only one chunk is held in memory at a time. The file is then attached to the
+job and the job is set to done with a single commit.
+'''
+
+import gzip
+import json
+import os
+
+from unex_runtime.cancel import checked
+from unex_runtime.lazy import lazy_import
+from unex_runtime.metrics import phase, timed
+from unex_runtime.progress import JobProgress
+from unex_runtime.upload import compress_if_smaller, discard_components, register_component, upload_component
+
+tempfile = lazy_import('tempfile')
+
+#: Attribute of a session holding its ftrack.server location
+LOCATION_KEY = '_unex_server_location'
+
+
+def start_job(session, user_id, description):
+    '''Create a running job for *user_id* showing *description* and return it'''
+    job = session.create('Job', {
+        'user_id': user_id,
+        'status': 'running',
+        'data': json.dumps({
+            'description': description
+        })
+    })
+    session.commit()
+
+    return job
+
+
+def fail_job(session, job, message):
+    '''Roll back anything pending and set *job* to failed showing *message*'''
+    session.rollback()
+    job['status'] = 'failed'
+    job['data'] = json.dumps({
+        'description': message
+    })
+    session.commit()
+
+
+def server_location(session):
+    '''Return the ftrack.server location (looked up once per session)'''
+    location = vars(session).get(LOCATION_KEY)
+    if location is None:
+        location = session.query(
+            u"Location where name is 'ftrack.server'"
+        ).one()
+        setattr(session, LOCATION_KEY, location)
+
+    return location
+
+
+def publish(session, job, file_path, description, progress=None, cancel=None, metadata=None):
+    '''
+    Upload *file_path* and attach it to *job*
+
+    Large files are compressed first if that helps, the upload progress is
+    shown in the job through *progress* (a `JobProgress`, created if not
+    given). The upload stops between two chunks once the `CancelToken`
+    *cancel* is cancelled. The job is set to done showing *description*.
+    *metadata* is added to the component (e.g. a cache key, see `cache`).
+    Registering the component, attaching it to the job and updating the job
+    are committed together. If the upload fails or is cancelled, the
+    component is deleted again. The local file is removed afterwards.
+    '''
+    return publish_files(session, job, [(file_path, metadata)], description, progress, cancel)[0]
+
+
+def publish_files(session, job, files, description, progress=None, cancel=None, components=(), metrics=None):
+    '''
+    Upload several files and attach them to *job* (see `publish`)
+
+    *files* is a list of `(file_path, metadata)` tuples. Existing
+    *components* (e.g. from the cache) are attached as well. Returns the
+    components of the job. *metrics* is an optional `Metrics` getting the
+    upload and commit phases.
+    '''
+    if progress is None:
+        progress = JobProgress(session, job, cancel=cancel)
+
+    uploaded = []
+    try:
+        for index, (file_path, metadata) in enumerate(files):
+            label = 'Uploading'
+            if (len(files) > 1):
+                label = 'Uploading {0}/{1}'.format(index + 1, len(files))
+
+            progress.update('Compressing')
+            file_path = compress_if_smaller(file_path)
+
+            # Keep inner extensions (e.g. export.html.gz will be downloaded as such)
+            name = os.path.splitext(os.path.basename(file_path))[0]
+
+            def sent(done, total):
+                if cancel is not None:
+                    cancel.check()
+                progress.step(label, done, total)
+
+            with phase(metrics, 'upload'):
+                component = upload_component(
+                    session,
+                    file_path,
+                    name,
+                    progress=sent
+                )
+
+            uploaded.append((file_path, component, metadata))
+
+        # Register the components along with everything else
+        location = server_location(session)
+        for file_path, component, metadata in uploaded:
+            register_component(session, component, location)
+
+            for key, value in (metadata or {}).items():
+                component['metadata'][key] = value
+
+        attached = [component for file_path, component, metadata in uploaded] + list(components)
+
+        # Attach to job
+        for component in attached:
+            session.create(
+                'JobComponent',
+                {
+                    'component_id': component['id'],
+                    'job_id': job['id']
+                }
+            )
+
+        # Set job status as done
+        job['status'] = 'done'
+        job['data'] = json.dumps({
+            'description': description
+        })
+        with phase(metrics, 'commit'):
+            session.commit()
+
+    except BaseException:
+        # Rolling back the job does not remove the components uploaded so far
+        discard_components(session, [component for file_path, component, metadata in uploaded])
+        raise
+
+    for file_path, component, metadata in uploaded:
+        os.remove(file_path)
+
+    return attached
+
+
+class FileSink(object):
+    '''
+    Write text chunks to a unique temporary file
+
+    *prefix* and *suffix* are used for the file name. If *compress* is True,
+    the file is gzip-compressed while writing and `.gz` is appended to its
+    name. Unicode chunks are encoded with *encoding*.
+    '''
+
+    def __init__(self, prefix, suffix, compress=False, encoding='utf-8'):
+        self.prefix = prefix
+        self.suffix = suffix + ('.gz' if compress else '')
+        self.compress = compress
+        self.encoding = encoding
+
+    def write(self, chunks):
+        '''Write all *chunks* and return the path of the file'''
+        handle, file_path = tempfile.mkstemp(
+            prefix=self.prefix,
+            suffix=self.suffix
+        )
+        raw = os.fdopen(handle, 'wb')
+        f = raw
+        if self.compress:
+            f = gzip.GzipFile(fileobj=raw, mode='wb')
+
+        try:
+            for chunk in chunks:
+                if not isinstance(chunk, bytes):
+                    chunk = chunk.encode(self.encoding)
+                f.write(chunk)
+        except BaseException:
+            # Don't leave incomplete files behind
+            f.close()
+            raw.close()
+            os.remove(file_path)
+            raise
+
+        f.close()
+
+        # GzipFile does not close the file it wraps
+        raw.close()
+
+        return file_path
+
+
+class Exporter(object):
+    '''
+    Fetch, transform and write an export
+
+    *fetch* is called without arguments and returns an iterable of entities.
+
+    *transform* is called with that iterable and returns an iterable of text
+    chunks, so new formats only need to provide a generator.
+
+    *sink* is a `FileSink` (or anything with a `write(chunks)` method that
+    returns a path).
+
+    *progress* is an optional `JobProgress`. The stages may report their own
+    progress to it as well.
+
+    *cancel* is an optional `CancelToken`, checked between the chunks.
+
+    *metrics* is an optional `Metrics`. Producing the chunks counts as
+    rendering, the rest as writing. As the stages are streamed, a *fetch*
+    needs to mark its own phase (see `metrics.timed`) to be told apart.
+    '''
+
+    def __init__(self, fetch, transform, sink, progress=None, cancel=None, metrics=None):
+        self.fetch = fetch
+        self.transform = transform
+        self.sink = sink
+        self.progress = progress
+        self.cancel = cancel
+        self.metrics = metrics
+
+    def run(self):
+        '''Run all stages and return the path of the written file'''
+        if self.progress is not None:
+            self.progress.update('Exporting')
+
+        chunks = timed(self.transform(self.fetch()), self.metrics, 'render')
+        if self.cancel is not None:
+            chunks = checked(chunks, self.cancel)
+
+        with phase(self.metrics, 'write'):
+            return self.sink.write(chunks)
+
+    def publish(self, session, job, description, metadata=None):
+        '''Run the export and attach the result to *job* (see `publish`)'''
+        return publish_files(session, job, [(self.run(), metadata)], description, self.progress, self.cancel, metrics=self.metrics)[0]
@@ -0,0 +1,185 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2019 c.arlt@unexpected.de
+# :license: GPL-3.0
+
+'''
+Guard against N+1 round trips (debug and CI mode)
+
+Accessing an attribute which was not fetched by the query, like
+`task['type']['color']` within a loop over tasks, costs one round trip per
+task. Nothing fails, it just gets slow with large projects.
+
+A `QueryGuard` watches a session during a single run of an action and
+remembers the line of code causing each round trip. If a single line causes
+more round trips than the limit, it grows with the number of entities, and
+the guard warns about it (or fails) pointing at that line:
+
+    N+1 round trips: 112 from .../unex_gantt/layout.py:202 `bar = Bar(task['id'], ...)`
+    (e.g. select name from Task where id is "...")
+
+Round trips which only fetch further pages of the same query are not
+counted, neither are lines fetching many entities per round trip on average
+(e.g. a selection resolved in chunks of ids): these grow with the number of
+entities as well, but by a fraction of it.
+
+The guard is off unless the environment variable `UNEX_QUERY_GUARD` is set
+to `warn` or `fail`. `UNEX_QUERY_GUARD_LIMIT` sets the limit (default 10).
+'''
+
+import logging
+import os
+import re
+import sys
+import traceback
+
+from unex_runtime.metrics import restore
+
+
+#: Environment variables of the mode (warn or fail) and of the limit
+GUARD_VARIABLE = 'UNEX_QUERY_GUARD'
+LIMIT_VARIABLE = 'UNEX_QUERY_GUARD_LIMIT'
+
+#: Round trips a single line may cause during one run
+DEFAULT_LIMIT = 10
+
+#: Entities per round trip (on average) of a line that fetches them in batches
+BATCH_SIZE = 20
+
+MODES = ('warn', 'fail')
+
+#: Paging at the end of a query expression
+_PAGING = re.compile(r'(\s+offset\s+\d+)?(\s+limit\s+\d+)?\s*$', re.IGNORECASE)
+
+
+class QueryCountExceeded(Exception):
+    '''Raised in `fail` mode when a line of code caused too many round trips'''
+
+
+class QueryGuard(object):
+    '''
+    Counts the round trips of a session per line of code during a run of *action*
+
+    *mode* and *limit* are taken from the environment, if they are not given.
+    Without a mode, `watch` and `finish` do nothing.
+    '''
+
+    def __init__(self, action, mode=None, limit=None, logger=None):
+        self.action = action
+        self.mode = mode or os.environ.get(GUARD_VARIABLE, '').lower()
+        self.limit = int(limit or os.environ.get(LIMIT_VARIABLE) or DEFAULT_LIMIT)
+        self.logger = logger or logging.getLogger(__name__)
+
+        self.session = None
+        self.calls = 0
+        self.sites = {}
+
+    @property
+    def enabled(self):
+        return self.mode in MODES
+
+    def watch(self, session):
+        '''Counts all round trips of *session* until `release` or `finish`'''
+        if not self.enabled:
+            return
+
+        self.session = session
+        self.previous = {'call': vars(session).get('call')}
+        self.ignored = self.libraryPaths(session)
+        call = session.call
+
+        def guardedCall(data, *args, **kwargs):
+            site = self.record(data)
+            result = call(data, *args, **kwargs)
+            self.fetched(site, result)
+            return result
+
+        session.call = guardedCall
+
+    def libraryPaths(self, session):
+        '''Returns the paths of code that is never responsible (the session's package and this runtime)'''
+        paths = [os.path.dirname(os.path.abspath(__file__))]
+
+        module = sys.modules.get(type(session).__module__.split('.')[0])
+        if (module is not None and getattr(module, '__file__', None)):
+            paths.append(os.path.dirname(os.path.abspath(module.__file__)))
+
+        return tuple(os.path.join(path, '') for path in paths)
+
+    def callSite(self):
+        '''Returns `(file, line, code)` of the innermost frame outside of the session and this runtime'''
+        for filename, line, function, code in reversed(traceback.extract_stack()):
+            if not os.path.abspath(filename).startswith(self.ignored):
+                return (filename, line, code)
+
+        return ('<unknown>', 0, None)
+
+    def record(self, data):
+        '''Counts a round trip sending *data* for the line causing it and returns that line'''
+        self.calls += 1
+        site = self.callSite()
+
+        expressions = [operation.get('expression') for operation in data if operation.get('expression')]
+        if site not in self.sites:
+            self.sites[site] = {'calls': 0, 'queries': set(), 'entities': 0, 'example': expressions[0] if expressions else None}
+
+        counted = self.sites[site]
+        counted['calls'] += 1
+        # Further pages of a query are the same query
+        counted['queries'].add(tuple(_PAGING.sub('', expression) for expression in expressions) or counted['calls'])
+
+        return site
+
+    def fetched(self, site, result):
+        '''Counts the entities in the *result* of a round trip of *site*'''
+        for operation in (result or []):
+            if isinstance(operation, dict):
+                self.sites[site]['entities'] += len(operation.get('data') or [])
+
+    def release(self):
+        '''Stops watching the session'''
+        if self.session is not None:
+            restore(self.session, self.previous)
+            self.session = None
+
+    def offenders(self):
+        '''Returns `(count, site, example)` of all lines above the limit, the worst first
+
+        *count* is the number of round trips, not counting further pages of a
+        query. Lines fetching `BATCH_SIZE` entities per round trip (or more)
+        are no offenders.
+        '''
+        return sorted(
+            (
+                (len(counted['queries']), site, counted['example'])
+                for site, counted in self.sites.items()
+                if len(counted['queries']) > self.limit and counted['entities'] < len(counted['queries']) * BATCH_SIZE
+            ),
+            key=lambda offender: offender[0],
+            reverse=True
+        )
+
+    def finish(self):
+        '''
+        Stops watching and reports all lines above the limit
+
+        Logs a warning for each of them, and in `fail` mode raises
+        `QueryCountExceeded` afterwards.
+        '''
+        if not self.enabled:
+            return
+
+        self.release()
+
+        offenders = self.offenders()
+        self.logger.info(u'{0}: {1} round trips from {2} lines of code'.format(self.action, self.calls, len(self.sites)))
+
+        messages = []
+        for count, (filename, line, code), example in offenders:
+            message = u'N+1 round trips: {0} from {1}:{2} `{3}` (e.g. {4})'.format(
+                count, filename, line, (code or '').strip(), example
+            )
+            self.logger.warning(message)
+            messages.append(message)
+
+        if (self.mode == 'fail' and len(messages) > 0):
+            raise QueryCountExceeded(u'{0} caused too many round trips:\n{1}'.format(self.action, '\n'.join(messages)))
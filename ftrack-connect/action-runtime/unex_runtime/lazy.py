@@ -0,0 +1,41 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2019 c.arlt@unexpected.de
+# :license: GPL-3.0
+
+'''
+Modules imported on first use
+
+ftrack-connect imports every hook when it starts (and again whenever the
+plugins are reloaded), but most of a hook's code only runs once its action
+is launched. Hooks bind their heavy modules (e.g. requests, the renderers
+and their templates) with `lazy_import`, so these are imported on first
+use instead of slowing down the start:
+
+    requests = lazy_import('requests')
+    ...
+    requests.get(url)   # requests is imported here
+'''
+
+import importlib
+
+
+class LazyModule(object):
+    '''Stands in for the module *name* until one of its attributes is needed'''
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+
+    def __getattr__(self, attribute):
+        # Already imported modules are just looked up in sys.modules
+        return getattr(importlib.import_module(self._name), attribute)
+
+    def __setattr__(self, attribute, value):
+        setattr(importlib.import_module(self._name), attribute, value)
+
+    def __repr__(self):
+        return '<lazy module {0}>'.format(self._name)
+
+
+def lazy_import(name):
+    '''Returns the module *name*, which is imported when it is first used'''
+    return LazyModule(name)
@@ -0,0 +1,299 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2019 c.arlt@unexpected.de
+# :license: GPL-3.0
+
+'''
+Timing of the phases of running actions
+
+A `Metrics` is created per action run. The run marks its phases (e.g.
+"resolve", "query", "layout", "render", "write", "upload", "commit") and
+the time in between is added to the innermost phase, so nested phases are
+not counted twice. Instrumenting the session counts round trips to the
+server per phase, and separately the lazy loads of attributes that were
+not fetched by a query (one round trip for each, the usual N+1 problem).
+
+When the run is finished, a single JSON line is logged:
+
+    {"event": "action_metrics", "action": "...", "status": "done", "duration": 12.3,
+     "phases": {"query": {"seconds": 1.2, "round_trips": 4, "lazy_loads": 0}, ...}}
+
+All finished runs are summed up in `REGISTRY`. If the environment variable
+`UNEX_METRICS_PORT` is set, `serve_metrics` shows these sums in the text
+format of Prometheus on http://host:port/metrics.
+'''
+
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+
+#: Environment variable with the port of the metrics endpoint
+PORT_VARIABLE = 'UNEX_METRICS_PORT'
+
+#: Phase of time and calls outside of any marked phase
+OTHER = 'other'
+
+
+class Metrics(object):
+    '''
+    Phases, round trips and counters of a single run of *action*
+
+    Use `phase` (or `timed` for generators) to mark the phases and
+    `instrument` to count the round trips of a session. Call `finish` at
+    the end to log the result and add it to `REGISTRY`.
+    '''
+
+    def __init__(self, action, logger=None, clock=time.time):
+        self.action = action
+        self.logger = logger or logging.getLogger(__name__)
+        self.clock = clock
+
+        self.stack = []
+        self.phases = {}
+        self.counters = {}
+
+        self.started = clock()
+        self.mark = self.started
+        self.session = None
+
+    def stats(self, name):
+        '''Returns the numbers of phase *name* (created on first use)'''
+        if name not in self.phases:
+            self.phases[name] = {'seconds': 0.0, 'round_trips': 0, 'lazy_loads': 0}
+        return self.phases[name]
+
+    def current(self):
+        return self.stack[-1] if self.stack else OTHER
+
+    def switch(self):
+        '''Adds the time since the last switch to the current phase'''
+        now = self.clock()
+        self.stats(self.current())['seconds'] += now - self.mark
+        self.mark = now
+
+    def enter(self, name):
+        self.switch()
+        self.stack.append(name)
+
+    def leave(self):
+        self.switch()
+        self.stack.pop()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        '''Counts everything within the `with` block to phase *name*'''
+        self.enter(name)
+        try:
+            yield self
+        finally:
+            self.leave()
+
+    def timed(self, items, name):
+        '''Yield all *items*, counting the time to produce each one to phase *name*'''
+        iterator = iter(items)
+        while True:
+            self.enter(name)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.leave()
+
+            yield item
+
+    def count(self, name, amount=1):
+        '''Adds *amount* to the counter *name* (e.g. the amount of exported tasks)'''
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def instrument(self, session):
+        '''
+        Counts the round trips and lazy loads of *session* until `finish`
+
+        All requests of a `ftrack_api.Session` go through its `call`, and
+        lazily loaded attributes through its `populate`.
+        '''
+        self.session = session
+        self.previous = dict((name, vars(session).get(name)) for name in ('call', 'populate'))
+        call = session.call
+        populate = session.populate
+
+        def countedCall(*args, **kwargs):
+            self.stats(self.current())['round_trips'] += 1
+            return call(*args, **kwargs)
+
+        def countedPopulate(*args, **kwargs):
+            self.stats(self.current())['lazy_loads'] += 1
+            return populate(*args, **kwargs)
+
+        session.call = countedCall
+        session.populate = countedPopulate
+
+    def release(self):
+        '''Stops counting the calls of the instrumented session'''
+        if self.session is not None:
+            restore(self.session, self.previous)
+            self.session = None
+
+    def report(self, status='done'):
+        '''Returns all numbers of this run'''
+        self.switch()
+
+        phases = dict(
+            (name, dict(stats, seconds=round(stats['seconds'], 4)))
+            for name, stats in self.phases.items()
+        )
+
+        return {
+            'event': 'action_metrics',
+            'action': self.action,
+            'status': status,
+            'duration': round(self.clock() - self.started, 4),
+            'round_trips': sum(stats['round_trips'] for stats in phases.values()),
+            'lazy_loads': sum(stats['lazy_loads'] for stats in phases.values()),
+            'phases': phases,
+            'counters': dict(self.counters)
+        }
+
+    def finish(self, status='done'):
+        '''Ends the run with *status* (e.g. done, failed or cancelled), logs and returns its report'''
+        self.release()
+        report = self.report(status)
+
+        self.logger.info(json.dumps(report, sort_keys=True))
+        REGISTRY.add(report)
+
+        return report
+
+
+def restore(session, previous):
+    '''Puts back the methods of *session* which were replaced by a wrapper
+
+    *previous* holds what was set on the instance before (None for the
+    method of the class), so wrappers may be stacked and released in
+    reverse order.
+    '''
+    for name, method in previous.items():
+        if method is not None:
+            setattr(session, name, method)
+        elif name in vars(session):
+            delattr(session, name)
+
+
+@contextlib.contextmanager
+def nothing():
+    yield None
+
+
+def phase(metrics, name):
+    '''Returns `metrics.phase(name)` or a `with` block doing nothing, if *metrics* is None'''
+    if metrics is None:
+        return nothing()
+    return metrics.phase(name)
+
+
+def timed(items, metrics, name):
+    '''Returns `metrics.timed(items, name)` or just *items*, if *metrics* is None'''
+    if metrics is None:
+        return items
+    return metrics.timed(items, name)
+
+
+class Registry(object):
+    '''Sums of all finished runs of this process, by action and phase'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.runs = {}
+        self.phases = {}
+
+    def add(self, report):
+        with self.lock:
+            key = (report['action'], report['status'])
+            self.runs[key] = self.runs.get(key, 0) + 1
+
+            for name, stats in report['phases'].items():
+                sums = self.phases.setdefault((report['action'], name), {'seconds': 0.0, 'round_trips': 0, 'lazy_loads': 0})
+                for field in sums:
+                    sums[field] += stats[field]
+
+    def prometheus(self):
+        '''Returns all sums in the text format of Prometheus'''
+        lines = []
+        with self.lock:
+            lines.append('# TYPE unex_action_runs_total counter')
+            for (action, status), count in sorted(self.runs.items()):
+                lines.append('unex_action_runs_total{{action="{0}",status="{1}"}} {2}'.format(action, status, count))
+
+            for field, kind in (('seconds', 'phase_seconds_total'), ('round_trips', 'round_trips_total'), ('lazy_loads', 'lazy_loads_total')):
+                lines.append('# TYPE unex_action_{0} counter'.format(kind))
+                for (action, name), sums in sorted(self.phases.items()):
+                    lines.append('unex_action_{0}{{action="{1}",phase="{2}"}} {3}'.format(kind, action, name, sums[field]))
+
+        return '\n'.join(lines) + '\n'
+
+
+#: Sums of all runs of this process
+REGISTRY = Registry()
+
+_server = None
+_serverLock = threading.Lock()
+
+
+def handler():
+    '''Returns the request handler serving `REGISTRY` (the HTTP server is only imported if it is used)'''
+    try:
+        from BaseHTTPServer import BaseHTTPRequestHandler
+    except ImportError:
+        from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if (self.path.split('?')[0] != '/metrics'):
+                self.send_error(404)
+                return
+
+            body = REGISTRY.prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return MetricsHandler
+
+
+def serve_metrics(port=None, host=''):
+    '''
+    Serves `REGISTRY` on *port* in a background thread and returns the server
+
+    Without *port*, the one in `UNEX_METRICS_PORT` is used. If that is not set
+    either, nothing is served and None is returned. The endpoint is started
+    once per process, so every action may call this when it is registered.
+    '''
+    global _server
+
+    port = port or os.environ.get(PORT_VARIABLE)
+    if not port:
+        return None
+
+    try:
+        from BaseHTTPServer import HTTPServer
+    except ImportError:
+        from http.server import HTTPServer
+
+    with _serverLock:
+        if _server is None:
+            _server = HTTPServer((host, int(port)), handler())
+            thread = threading.Thread(target=_server.serve_forever)
+            thread.daemon = True
+            thread.start()
+
+    return _server
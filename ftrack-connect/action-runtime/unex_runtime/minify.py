@@ -0,0 +1,135 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2019 c.arlt@unexpected.de
+# :license: GPL-3.0
+
+'''
+Smaller HTML exports
+
+The exported pages are written as readable, indented text with lots of
+inline styles. These helpers strip what the browser does not need while
+streaming: whitespace, overly precise numbers and repeated style
+declarations (which become shared classes).
+'''
+
+import re
+
+
+#: Fonts every system has, used instead of loading web fonts
+SYSTEM_FONTS = "-apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, Helvetica, Arial, sans-serif"
+
+#: Style properties that differ for most elements, so they stay inline
+INLINE_PROPERTIES = ('left', 'right', 'top', 'bottom', 'width', 'height')
+
+_COMMENT = re.compile(r'/\*.*?\*/', re.DOTALL)
+_SPACE = re.compile(r'\s+')
+_CSS_PUNCTUATION = re.compile(r'\s*([{};:,>])\s*')
+_BETWEEN_TAGS = re.compile(r'>\s+<')
+_PRECISE_NUMBER = re.compile(r'(\d+\.\d{3})\d+')
+_STYLED_TAG = re.compile(r'<[^<>]*\sstyle="[^"]*"[^<>]*>')
+_STYLE = re.compile(r'\sstyle="([^"]*)"')
+_CLASS = re.compile(r'\sclass="([^"]*)"')
+
+
+def minify_css(css):
+    '''Return *css* without comments and unneeded whitespace'''
+    css = _COMMENT.sub('', css)
+    css = _SPACE.sub(' ', css)
+    css = _CSS_PUNCTUATION.sub(r'\1', css)
+
+    return css.replace(';}', '}').strip()
+
+
+def minify_js(js):
+    '''Return *js* without indentation and empty lines (comments are kept)'''
+    return '\n'.join(line.strip() for line in js.splitlines() if line.strip() != '')
+
+
+class StyleClasses(object):
+    '''
+    Turn repeated inline style declarations into classes
+
+    Declarations of `INLINE_PROPERTIES` (the position of a bar) stay in the
+    style attribute, all others (e.g. the color of a type) are replaced by a
+    class. `css()` returns the rules of all classes handed out so far.
+    '''
+
+    def __init__(self, prefix='s'):
+        self.prefix = prefix
+        self.classes = {}
+
+    def declarations(self, style):
+        '''Split *style* into its normalized declarations'''
+        declarations = []
+        for declaration in style.split(';'):
+            if ':' not in declaration:
+                continue
+            name, value = declaration.split(':', 1)
+            declarations.append((name.strip().lower(), _SPACE.sub(' ', value.strip())))
+
+        return declarations
+
+    def tag(self, match):
+        '''Rewrite a single tag (a regular expression match)'''
+        tag = match.group(0)
+
+        inline = []
+        classes = []
+        for name, value in self.declarations(_STYLE.search(tag).group(1)):
+            declaration = u'{0}:{1}'.format(name, _PRECISE_NUMBER.sub(r'\1', value))
+            if name in INLINE_PROPERTIES:
+                inline.append(declaration)
+            else:
+                if declaration not in self.classes:
+                    self.classes[declaration] = u'{0}{1}'.format(self.prefix, len(self.classes))
+                classes.append(self.classes[declaration])
+
+        style = u' style="{0}"'.format(';'.join(inline)) if inline else u''
+        tag = _STYLE.sub(lambda m: style, tag, count=1)
+
+        if classes:
+            existing = _CLASS.search(tag)
+            if existing is None:
+                end = -2 if tag.endswith('/>') else -1
+                tag = tag[:end] + u' class="{0}"'.format(' '.join(classes)) + tag[end:]
+            else:
+                tag = _CLASS.sub(
+                    lambda m: u' class="{0}"'.format(' '.join([m.group(1)] + classes)), tag, count=1
+                )
+
+        return tag
+
+    def rewrite(self, html):
+        '''Return *html* with the styles of all its tags rewritten'''
+        return _STYLED_TAG.sub(self.tag, html)
+
+    def css(self):
+        '''Return the rules of all classes'''
+        return ''.join(
+            u'.{0}{{{1}}}'.format(name, declaration)
+            for declaration, name in sorted(self.classes.items(), key=lambda item: item[1])
+        )
+
+
+def minify_html(chunks):
+    '''
+    Yield the minified *chunks* of an HTML page
+
+    Whitespace between tags is removed and repeated styles become classes
+    (see `StyleClasses`). The rules of these classes are added in a style
+    element right before the last chunk, as they are only known at the end.
+    Chunks are expected to contain whole tags.
+    '''
+    styles = StyleClasses()
+    last = None
+
+    for chunk in chunks:
+        if last is not None:
+            yield last
+        last = _BETWEEN_TAGS.sub('><', styles.rewrite(chunk)).strip()
+
+    css = styles.css()
+    if css:
+        yield u'<style>{0}</style>'.format(css)
+
+    if last is not None:
+        yield last
@@ -0,0 +1,183 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2019 c.arlt@unexpected.de
+# :license: GPL-3.0
+
+'''
+Paths of files on the shares, on every platform
+
+Custom attributes like `associatedFile` hold a path as it was entered on one
+machine, e.g. `\\\\fileserver\\projects\\...` on Windows. A `PathMap` turns
+such a path into the one of the same file on this machine: the share's root
+is replaced by the root of this platform and the separators are fixed.
+
+Roots may have local mounts holding a copy (or a cache) of the same tree,
+e.g. on the render nodes. Files are looked up on the fastest of these first,
+measured once in a while, and on the share itself last.
+
+The roots are read from the JSON file (or JSON text) in `UNEX_PATH_ROOTS`:
+
+    [{"windows": "\\\\\\\\fileserver\\\\projects", "linux": "/mnt/projects",
+      "darwin": "/Volumes/projects", "mounts": ["/cache/projects"]}]
+
+Without it, paths only get the separators of this platform.
+'''
+
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+
+
+#: Environment variable with the roots (a JSON file or JSON text)
+ROOTS_VARIABLE = 'UNEX_PATH_ROOTS'
+
+#: Seconds until the speed of the mounts is measured again
+MEASURE_AGE = 600.0
+
+PLATFORMS = ('windows', 'linux', 'darwin')
+
+
+def platform_name():
+    '''Returns the name of this platform, as used for the roots (windows, linux or darwin)'''
+    if sys.platform.startswith('win'):
+        return 'windows'
+    if sys.platform == 'darwin':
+        return 'darwin'
+    return 'linux'
+
+
+def comparable(path):
+    '''Returns *path* with forward slashes and in lower case, so paths of any platform can be compared'''
+    return path.replace('\\', '/').rstrip('/').lower()
+
+
+def native(path, separator=os.sep):
+    '''Returns *path* with the separators of this platform'''
+    return path.replace('\\', separator).replace('/', separator)
+
+
+class PathMap(object):
+    '''
+    Translates paths between the *roots* of the platforms and their local mounts
+
+    Each root is a dictionary with the path of the share per platform (see
+    `PLATFORMS`) and optional `mounts` of the same tree on this machine.
+    '''
+
+    def __init__(self, roots=(), platform=None, logger=None, clock=time.time):
+        self.roots = list(roots)
+        self.platform = platform or platform_name()
+        self.logger = logger or logging.getLogger(__name__)
+        self.clock = clock
+
+        self.lock = threading.Lock()
+        self.speeds = {}
+
+    @classmethod
+    def from_environment(cls):
+        '''Returns the map of the roots in `UNEX_PATH_ROOTS` (or one without roots)'''
+        value = os.environ.get(ROOTS_VARIABLE, '').strip()
+        if not value:
+            return cls()
+
+        if not value.startswith(('[', '{')):
+            with open(value) as handle:
+                value = handle.read()
+
+        roots = json.loads(value)
+        return cls(roots if isinstance(roots, list) else roots.get('roots', []))
+
+    def split(self, path):
+        '''Returns the root *path* is on and the rest of it, or `(None, path)` if it is on none'''
+        compared = comparable(path)
+
+        for root in self.roots:
+            for prefix in [root.get(platform) for platform in PLATFORMS] + list(root.get('mounts', [])):
+                if not prefix:
+                    continue
+
+                prefix = comparable(prefix)
+                if (compared == prefix or compared.startswith(prefix + '/')):
+                    return root, path.replace('\\', '/').rstrip('/')[len(prefix):].lstrip('/')
+
+        return None, path
+
+    def latency(self, directory):
+        '''Returns the seconds listing *directory* takes (measured once in a while), None if it is not there'''
+        with self.lock:
+            measured = self.speeds.get(directory)
+        if (measured is not None and self.clock() - measured[1] < MEASURE_AGE):
+            return measured[0]
+
+        started = time.time()
+        try:
+            os.listdir(directory)
+            seconds = time.time() - started
+        except OSError:
+            seconds = None
+
+        with self.lock:
+            self.speeds[directory] = (seconds, self.clock())
+        return seconds
+
+    def bases(self, root):
+        '''Returns the directories of *root* on this machine, the fastest first and the share last'''
+        mounts = [mount for mount in root.get('mounts', []) if self.latency(mount) is not None]
+        mounts.sort(key=self.latency)
+
+        share = root.get(self.platform)
+        return mounts + ([share] if share else [])
+
+    def candidates(self, path):
+        '''Returns the paths of *path* on this machine, the fastest first'''
+        root, rest = self.split(path)
+        if root is None:
+            return [native(path)]
+
+        return [os.path.join(base, native(rest)) if rest else base for base in self.bases(root)]
+
+    def local(self, path):
+        '''Returns the path of *path* on this machine: the first candidate that exists (or the share's)'''
+        candidates = self.candidates(path)
+
+        for candidate in candidates:
+            if os.path.exists(candidate):
+                return candidate
+
+        self.logger.debug(u'{0} is not there on this machine'.format(path))
+        return candidates[-1] if candidates else native(path)
+
+
+_default = None
+_defaultLock = threading.Lock()
+
+
+def path_map():
+    '''Returns the `PathMap` of this process (read from `UNEX_PATH_ROOTS` on first use)'''
+    global _default
+
+    with _defaultLock:
+        if _default is None:
+            _default = PathMap.from_environment()
+
+    return _default
+
+
+def local_path(path):
+    '''Returns the path of *path* on this machine (see `PathMap.local`)'''
+    return path_map().local(path)
+
+
+def open_file(path):
+    '''Opens *path* with its default application, without waiting for it'''
+    platform = platform_name()
+
+    if platform == 'windows':
+        os.startfile(path)
+    elif platform == 'darwin':
+        subprocess.Popen(['open', path])
+    else:
+        subprocess.Popen(['xdg-open', path])
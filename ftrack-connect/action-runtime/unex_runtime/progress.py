@@ -0,0 +1,82 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2019 c.arlt@unexpected.de
+# :license: GPL-3.0
+
+'''
+Progress reporting for running jobs
+
+Every update of a job needs a commit. To keep the server calm, updates are
+collected and only the latest one is committed, at most once per interval.
+'''
+
+import json
+import time
+
+
+class JobProgress(object):
+    '''
+    Show the phase and progress of *job* in its description
+
+    Updates are committed with *session* at most every *interval* seconds.
+    Updates in between are coalesced, so only the latest state is sent.
+
+    If a `CancelToken` is given as *cancel*, it is checked before each commit,
+    so a cancelled job is never updated again.
+    '''
+
+    def __init__(self, session, job, interval=5.0, clock=time.time, cancel=None):
+        self.session = session
+        self.job = job
+        self.interval = interval
+        self.clock = clock
+        self.cancel = cancel
+
+        #: The job has just been created, so there is no need to update right away
+        self.last_commit = clock()
+        self.pending = None
+        self.commits = 0
+
+    def update(self, phase, percent=None, count=None):
+        '''
+        Set the current *phase* (e.g. "Rendering")
+
+        *percent* is the progress within this phase, if it is known. Otherwise
+        *count* may tell how many items have been processed so far.
+        '''
+        self.pending = {
+            'phase': phase,
+            'progress': percent,
+            'count': count
+        }
+
+        if (self.clock() - self.last_commit >= self.interval):
+            self.flush()
+
+    def step(self, phase, done, total):
+        '''Set the progress of *phase* to *done* out of *total* items'''
+        self.update(phase, percent=int(done * 100 / max(total, 1)))
+
+    def describe(self, state):
+        '''Returns the text shown for *state*'''
+        if state['progress'] is not None:
+            return u'{0}... {1}%'.format(state['phase'], state['progress'])
+        if state['count'] is not None:
+            return u'{0}... ({1})'.format(state['phase'], state['count'])
+        return u'{0}...'.format(state['phase'])
+
+    def flush(self):
+        '''Commit the latest pending update (if any) right away'''
+        if self.pending is None:
+            return
+
+        if self.cancel is not None:
+            self.cancel.check()
+
+        state = self.pending
+        self.pending = None
+
+        self.job['data'] = json.dumps(dict(state, description=self.describe(state)))
+        self.session.commit()
+
+        self.last_commit = self.clock()
+        self.commits += 1
@@ -0,0 +1,193 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2019 c.arlt@unexpected.de
+# :license: GPL-3.0
+
+'''
+Upload stage for exported files
+
+Instead of `session.create_component`, which uploads a file with one blocking
+request, files are streamed to the ftrack server in chunks. The progress is reported
+once per chunk, failed uploads are retried with a back-off (each time with
+a fresh upload url, as presigned urls do not resume), and large files are
+compressed first if that makes them considerably smaller.
+'''
+
+import gzip
+import logging
+import os
+import shutil
+import time
+
+from unex_runtime.lazy import lazy_import
+
+requests = lazy_import('requests')
+
+
+#: Size of a single chunk read from disk and sent to the server (and bytes between progress reports)
+CHUNK_SIZE = 1024 * 1024
+
+#: Files smaller than this are uploaded as they are
+COMPRESS_MIN_SIZE = 5 * 1024 * 1024
+
+#: Only keep the compressed file if it is at most this fraction of the original
+COMPRESS_MAX_RATIO = 0.7
+
+
+def compress_if_smaller(file_path, min_size=COMPRESS_MIN_SIZE, max_ratio=COMPRESS_MAX_RATIO):
+    '''
+    Gzip *file_path* if it is large and compresses well
+
+    Returns the path of the file to upload. If the compressed file is used,
+    the original one is removed.
+    '''
+    size = os.path.getsize(file_path)
+    if (size < min_size or file_path.endswith('.gz')):
+        return file_path
+
+    compressed_path = file_path + '.gz'
+    with open(file_path, 'rb') as source:
+        target = gzip.open(compressed_path, 'wb')
+        try:
+            shutil.copyfileobj(source, target, CHUNK_SIZE)
+        finally:
+            target.close()
+
+    if (os.path.getsize(compressed_path) > size * max_ratio):
+        os.remove(compressed_path)
+        return file_path
+
+    os.remove(file_path)
+    return compressed_path
+
+
+class ChunkedFile(object):
+    '''
+    Read-only file object handing out *path* in chunks of at most *chunk_size*
+
+    *callback* is called with `(sent, total)` bytes once per *chunk_size* bytes
+    and at the end. The HTTP client reads far smaller blocks (8 KB), which
+    would otherwise report each one. The length is known in advance, so the
+    upload is sent with a content length instead of a chunked transfer encoding.
+    '''
+
+    def __init__(self, path, callback=None, chunk_size=CHUNK_SIZE):
+        self.file = open(path, 'rb')
+        self.total = os.path.getsize(path)
+        self.sent = 0
+        self.reported = 0
+        self.callback = callback
+        self.chunk_size = chunk_size
+
+    def __len__(self):
+        return self.total - self.sent
+
+    def read(self, size=-1):
+        if (size is None or size < 0 or size > self.chunk_size):
+            size = self.chunk_size
+
+        chunk = self.file.read(size)
+        self.sent += len(chunk)
+
+        if (chunk and self.callback is not None and (self.sent - self.reported >= self.chunk_size or self.sent == self.total)):
+            self.reported = self.sent
+            self.callback(self.sent, self.total)
+
+        return chunk
+
+    def close(self):
+        self.file.close()
+
+
+def discard_components(session, components):
+    '''
+    Deletes *components* again, which were committed but never registered in a location
+
+    Anything pending is rolled back first. The deletion is committed right
+    away, so a failed or cancelled export does not leave empty components
+    behind (rolling back its job would not remove them).
+    '''
+    if not components:
+        return
+
+    session.rollback()
+    try:
+        for component in components:
+            session.delete(component)
+        session.commit()
+    except Exception:
+        session.rollback()
+        logging.getLogger(__name__).exception('Could not delete the components of a failed upload')
+
+
+def upload_component(session, file_path, name, progress=None, retries=3, backoff=2.0):
+    '''
+    Create a file component for *file_path* and upload its data
+
+    *progress* is called with `(sent, total)` bytes while uploading. Failed
+    uploads are retried *retries* times, waiting *backoff* seconds (doubled
+    each time). A retry sends the whole file again, to a fresh upload url:
+    the presigned urls of the server location cannot resume an upload.
+
+    The server needs to know the component before accepting its data, so it
+    is committed first. If the upload fails (or is cancelled through
+    *progress*), it is deleted again. Register the component with
+    `register_component`, together with whatever uses it.
+    '''
+    file_type = os.path.splitext(file_path)[1]
+    size = os.path.getsize(file_path)
+
+    component = session.create('FileComponent', {
+        'name': name,
+        'file_type': file_type,
+        'size': size
+    })
+    session.commit()
+
+    try:
+        send_data(session, component, file_path, name + file_type, size, progress, retries, backoff)
+    except BaseException:
+        discard_components(session, [component])
+        raise
+
+    return component
+
+
+def send_data(session, component, file_path, file_name, size, progress, retries, backoff):
+    '''Upload the data of *component* from *file_path* (see `upload_component`)'''
+    attempt = 0
+    while True:
+        metadata = session.get_upload_metadata(
+            component_id=component['id'],
+            file_name=file_name,
+            file_size=size
+        )
+
+        data = ChunkedFile(file_path, progress)
+        try:
+            response = requests.put(
+                metadata['url'],
+                data=data,
+                headers=metadata['headers']
+            )
+            response.raise_for_status()
+            return
+
+        except (requests.RequestException, IOError):
+            if attempt >= retries:
+                raise
+
+            time.sleep(backoff * (2 ** attempt))
+            attempt += 1
+
+        finally:
+            data.close()
+
+
+def register_component(session, component, location):
+    '''Register the uploaded *component* in *location* (left uncommitted)'''
+    # The server location identifies its files by the component id
+    session.create('ComponentLocation', {
+        'component_id': component['id'],
+        'location_id': location['id'],
+        'resource_identifier': component['id']
+    })
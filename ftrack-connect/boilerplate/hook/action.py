@@ -3,49 +3,26 @@
 # :license: GPL-3.0
 
 import logging
-import threading
 import sys
-import argparse
-import json
-import tempfile
 import os
 
-import ftrack_api
+# The shared runtime is deployed next to the actions (ftrack-connect/action-runtime)
+RUNTIME_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'action-runtime'))
+if RUNTIME_PATH not in sys.path:
+    sys.path.append(RUNTIME_PATH)
 
-from ftrack_action_handler.action import BaseAction
+from unex_runtime.export import Exporter, FileSink, start_job, fail_job
+from unex_runtime.cancel import CancelToken, ExportCancelled, end_cancelled_job
 
+# Shared utility methods (getRealEntitiesFromTypedContext, get_filter_string, run_async, ...)
+# and the base of all actions, which does discovery, registration and more
+from unex_runtime.action import (
+    UnexAction, JOB_SESSIONS, getRealEntityFromTypedContext, getRealEntitiesFromTypedContext,
+    get_filter_string, run_async, register_actions, listen
+)
 
-##############################################################################
-#                                                                            #
-#           Custom utility methods (might not need to be changed)            #
-#                                                                            #
-##############################################################################
 
-def getRealEntityFromTypedContext(session, entity):
-    '''
-    This one will return you a real entity behind a TypedContext-entity
-    
-    *session* is a `ftrack_api.Session` instance
-
-    *entity* should be a tuple containing the entity type of `TypedContext`
-    and (more important) the entity id.
-    '''
-    return session.get(entity[0], entity[1])
-
-def async(fn):
-    '''Run *fn* asynchronously.'''
-    def wrapper(*args, **kwargs):
-        thread = threading.Thread(target=fn, args=args, kwargs=kwargs)
-        thread.start()
-    return wrapper
-
-def get_filter_string(entity_ids):
-    '''Return a comma separated string of quoted ids from *entity_ids* list.'''
-    return ', '.join(
-        '"{0}"'.format(entity_id) for entity_id in entity_ids
-    )
-
-class MainAction(BaseAction):
+class MainAction(UnexAction):
     '''This is an bare bone action'''
     
     ##############################################################################
@@ -156,7 +133,7 @@ class MainAction(BaseAction):
 
 
 
-    @async
+    @run_async
     def mainAsyncAction(self, entities, user_id=None):
         '''
         The main action this one is doing inside a job
@@ -166,18 +143,17 @@ class MainAction(BaseAction):
         or https://bitbucket.org/ftrack/ftrack-recipes/src/master/python/actions/create_report/hook/create_report.py
         '''
         
-        # Setup a session for the running job
-        session = ftrack_api.Session(
-            auto_connect_event_hub=False
-        )
-        job = session.create('Job', {
-            'user_id': user_id,
-            'status': 'running',
-            'data': json.dumps({
-                'description': 'Collecting your selection'
-            })
-        })
-        session.commit()
+        # Take a session for the running job
+        with JOB_SESSIONS.session() as session:
+            self.runJob(session, entities, user_id)
+
+    def runJob(self, session, entities, user_id=None):
+        '''Collects the selected *entities* within a job of *user_id*'''
+        job = start_job(session, user_id, 'Collecting your selection')
+
+        # Long loops should call cancel.check() once in a while, so that
+        # deleting the job stops them
+        cancel = CancelToken(session, job)
 
         try:
             # Do, whatever you like
@@ -186,177 +162,46 @@ class MainAction(BaseAction):
 
             # In this sample, we are collecting the entities
             # and print a list into a text file
-            realEntities = []
-            printString = ""
-
-            for entity in entities:
-                oneObject = getRealEntityFromTypedContext(session, entity)
-                realEntities.append(oneObject)
-
-                printString += "\t- {0} (Type: {1}), due date: {2}\n".format(oneObject['name'], type(oneObject).__name__, oneObject['end_date'])
-            
-            filecontent = "You selected:\n{0}" .format(printString)
-
-
-
-
-
-            # Generate unique temp file name
-            file_path = tempfile.NamedTemporaryFile(
-                prefix='example_collection', 
-                suffix='.txt', 
-                delete=False
-            ).name
-
-            # Write to file
-            f=open(file_path,"w")
-            f.write(filecontent)
-            f.close()
-
-            # Create file component for job
-            job_file = os.path.basename(file_path).replace('.txt', '')
-            component = session.create_component(
-                file_path,
-                data={'name': job_file},
-                location=session.query(u"Location where name is 'ftrack.server'").one()
+            def collect():
+                # One query per entity type, not one per selected entity
+                for realEntity in getRealEntitiesFromTypedContext(session, entities):
+                    cancel.check()
+                    if realEntity is not None:
+                        yield realEntity
+
+            def listing(realEntities):
+                yield "You selected:\n"
+                for oneObject in realEntities:
+                    yield "\t- {0} (Type: {1}), due date: {2}\n".format(oneObject['name'], type(oneObject).__name__, oneObject['end_date'])
+
+            # Fetch, transform and write to a temp file which is attached to the job
+            exporter = Exporter(
+                fetch=collect,
+                transform=listing,
+                sink=FileSink('example_collection', '.txt'),
+                cancel=cancel
             )
-            session.commit()
-
-            # Attach to job
-            session.create(
-                'JobComponent',
-                {
-                    'component_id': component['id'], 
-                    'job_id': job['id']
-                }
-            )
-            
-            # Set job status as done
-            job['status'] = 'done'
-            job['data'] = json.dumps({
-                'description': 'Click to download your selection'
-            })
-            session.commit()
+            exporter.publish(session, job, 'Click to download your selection')
+
+        except ExportCancelled:
+            self.logger.info('Async action was cancelled')
+            end_cancelled_job(session, job)
 
         except BaseException as exc:
             # Error handling: Write error
             self.logger.exception('Async action failed')
-            session.rollback()
-            job['status'] = 'failed'
-            job['data'] = json.dumps({
-                'description': exc.message
-            })
-            session.commit()
-
-            
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-    
-
-
-    ##############################################################################
-    #                                                                            #
-    # You do not need to edit something below, as these are just utility methods #
-    #                   for discovery, registration and more                     #
-    #                                                                            #
-    ##############################################################################
-
-
-    @property
-    def session(self):
-        '''Return convenient exposure of the self._session reference.'''
-        return self._session
-
-    @property
-    def ftrack_server_location(self):
-        '''Return the ftrack.server location.'''
-        return self.session.query(
-            u"Location where name is 'ftrack.server'"
-        ).one()
-
-
-    def _discover(self, event):
-        '''Returns the parameters to show the interaction icon in the Actions Panel'''
-        args = self._translate_event(
-            self.session, event
-        )
-
-        accepts = self.discover(
-            self.session, *args
-        )
-
-        if accepts:
-            return {
-                'items': [{
-                    'label': self.label,
-                    'variant': self.variant,
-                    'description': self.description,
-                    'actionIdentifier': self.identifier,
-                    'icon': self.icon,
-                }]
-            }
+            fail_job(session, job, exc.message)
 
 
 def register(session, **kw):
     '''Register plugin. Called when used as an plugin.'''
-    # Validate that session is an instance of ftrack_api.Session. If not,
-    # assume that register is being called from an old or incompatible API and
-    # return without doing anything.
-    if not isinstance(session, ftrack_api.session.Session):
-        return
-
-    action_handler = MainAction(session)
-    action_handler.register()
+    register_actions(session, MainAction)
 
 
 def main(arguments=None):
     '''Set up logging and register action.'''
-    if arguments is None:
-        arguments = []
-
-    parser = argparse.ArgumentParser()
-    # Allow setting of logging level from arguments.
-    loggingLevels = {}
-    for level in (
-        logging.NOTSET, logging.DEBUG, logging.INFO, logging.WARNING,
-        logging.ERROR, logging.CRITICAL
-    ):
-        loggingLevels[logging.getLevelName(level).lower()] = level
-
-    parser.add_argument(
-        '-v', '--verbosity',
-        help='Set the logging output verbosity.',
-        choices=loggingLevels.keys(),
-        default='info'
-    )
-    namespace = parser.parse_args(arguments)
-
-    # Set up basic logging.
-    logging.basicConfig(level=loggingLevels[namespace.verbosity])
-
-    session = ftrack_api.Session()
-    register(session)
-
-    # Wait for events.
-    logging.info(
-        'Registered actions and listening for events. Use Ctrl-C to abort.'
-    )
-    session.event_hub.wait()
+    return listen(register, arguments)
 
 
 if __name__ == '__main__':
     raise SystemExit(main(sys.argv[1:]))
-
@@ -3,50 +3,56 @@
 # :license: GPL-3.0
 
 import logging
-import threading
 import sys
-import argparse
-import json
-import tempfile
 import os
 import datetime
-import calendar
+import shutil
+import time
+import urlparse
 from types import NoneType
 
 import ftrack_api
 
-from ftrack_action_handler.action import BaseAction
+# The shared runtime is deployed next to the actions (ftrack-connect/action-runtime)
+RUNTIME_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'action-runtime'))
+if RUNTIME_PATH not in sys.path:
+    sys.path.append(RUNTIME_PATH)
 
+# Layout and renderers of the chart are next to this hook (export-gantt-chart/unex_gantt)
+GANTT_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if GANTT_PATH not in sys.path:
+    sys.path.append(GANTT_PATH)
 
-##############################################################################
-#                                                                            #
-#           Custom utility methods (might not need to be changed)            #
-#                                                                            #
-##############################################################################
+from unex_runtime.export import Exporter, FileSink, start_job, fail_job, publish_files
+from unex_runtime.progress import JobProgress
+from unex_runtime.cancel import CancelToken, ExportCancelled, end_cancelled_job
+from unex_runtime.cache import CACHE_KEY, export_key, data_version, find_cached
+from unex_runtime.metrics import Metrics, phase, serve_metrics
+from unex_runtime.guard import QueryGuard
+# Shared utility methods (getRealEntitiesFromTypedContext, get_filter_string, run_async, ...)
+# and the base of all actions, which does discovery, registration and more
+from unex_runtime.action import (
+    UnexAction, JOB_SESSIONS, RESOLVE_CHUNK_SIZE, getRealEntityFromTypedContext, getRealEntitiesFromTypedContext,
+    get_filter_string, run_async, register_actions, argument_parser, setup_logging, wait, reset_session
+)
+from unex_runtime.lazy import lazy_import
 
-def getRealEntityFromTypedContext(session, entity):
-    '''
-    This one will return you a real entity behind a TypedContext-entity
-    
-    *session* is a `ftrack_api.Session` instance
+# Only needed once the action is launched, so these do not slow down ftrack-connect's start
+requests = lazy_import('requests')
+layout = lazy_import('unex_gantt.layout')
+renderers = lazy_import('unex_gantt.renderers')
+live = lazy_import('unex_gantt.live')
+
+
+#: Metadata key of a project pointing to the component of its latest pre-rendered chart
+LATEST_CHART_KEY = 'unex_gantt_chart'
+
+#: Environment variable with the hosts custom CSS is inlined from (comma-separated)
+CSS_HOSTS_VARIABLE = 'UNEX_GANTT_CSS_HOSTS'
+
+#: Attributes the chart shows of each task and milestone, fetched along with them
+CHART_ATTRIBUTES = ('name', 'start_date', 'end_date', 'type.name', 'type.color', 'status.name', 'status.color')
 
-    *entity* should be a tuple containing the entity type of `TypedContext`
-    and (more important) the entity id.
-    '''
-    return session.get(entity[0], entity[1])
-
-def async(fn):
-    '''Run *fn* asynchronously.'''
-    def wrapper(*args, **kwargs):
-        thread = threading.Thread(target=fn, args=args, kwargs=kwargs)
-        thread.start()
-    return wrapper
-
-def get_filter_string(entity_ids):
-    '''Return a comma separated string of quoted ids from *entity_ids* list.'''
-    return ', '.join(
-        '"{0}"'.format(entity_id) for entity_id in entity_ids
-    )
 
 def extract_start_date(taskObject):
     try:
@@ -62,12 +68,556 @@ def extract_start_date(taskObject):
     except:
         return datetime.datetime(2000, 1, 1)
 
-def daterange(start_date, end_date):
-    for n in range(int ((end_date - start_date).days)):
-        yield start_date + datetime.timedelta(n)
+class GanttChart(object):
+    '''
+    The Gantt Chart of a selection, usable with or without ftrack-connect
+
+    *session* is a `ftrack_api.Session` instance
+
+    *entities* is a list of tuples each containing the entity type and the entity id
+    (just like the selection of an action)
+
+    *settings* is a dictionary of the export settings (see the action's interface).
+    Missing ones are taken from `defaultSettings`.
+
+    *progress*, *cancel* and *metrics* are an optional `JobProgress`, `CancelToken`
+    and `Metrics`
+
+    *trusted* settings (given on the command line) may name a local file or any
+    URL as custom CSS, see `customCss`.
+    '''
+
+    #: Identifies these exports in the cache
+    identifier = 'de.unexpected.ftrack.export.ganttchart'
+
+    #: Settings used, if they are not given
+    defaultSettings = {
+        'show_assignees': False,
+        'show_status': False,
+        'custom_css': '',
+        'compress': False,
+        'show_load': False,
+        'load_capacity': 1,
+        'self_contained': False,
+        'formats': ['html'],
+        'date_window': 'all',
+        'start_date': '',
+        'end_date': '',
+        'task_types': [],
+        'statuses': [],
+        'assignees': []
+    }
+
+    #: Date windows relative to today (in days)
+    dateWindows = {
+        '2w': 14,
+        '6w': 42,
+        '3m': 91
+    }
+
+    def __init__(self, session, entities, settings=None, progress=None, cancel=None, metrics=None, version=None, trusted=False):
+        self.session = session
+        self.entities = entities
+        self.settings = dict(self.defaultSettings, **(settings or {}))
+        self.progress = progress
+        self.cancel = cancel
+        self.metrics = metrics
+        self.version = version
+        self.trusted = trusted
+
+    def dataVersion(self):
+        '''Returns a version of everything the chart shows (looked up once per chart)
+
+        ftrack keeps no modification date for tasks and assignments, so this is
+        a digest of what the chart shows of them (see `dataDigest`) and of the
+        colors of types and statuses (see `colorVersion`). *version* of the
+        constructor skips this.
+        '''
+        if self.version is None:
+            self.version = self.dataDigest() + self.colorVersion()
+
+        return self.version
+
+    def colorVersion(self):
+        '''Returns a digest of the colors of all types and statuses (which every chart shows)'''
+        colors = list(self.session.query('select id, color from Type'))
+        colors.extend(self.session.query('select id, color from Status'))
+
+        return data_version(colors, ('id', 'color'))
+
+    def dataDigest(self):
+        '''Returns a digest of the shown attributes of all tasks and milestones
+
+        These are fetched with lean projections, which is still much cheaper
+        than the export itself.
+        '''
+        projectIds = [entity[1] for entity in self.entities if entity[0] == 'Project']
+        contextIds = [entity[1] for entity in self.entities if entity[0] != 'Project']
+
+        conditions = []
+        assignmentConditions = []
+        if (len(projectIds) > 0):
+            conditions.append('project_id in ({0})'.format(get_filter_string(projectIds)))
+            assignmentConditions.append('context.project_id in ({0})'.format(get_filter_string(projectIds)))
+        if (len(contextIds) > 0):
+            conditions.append('id in ({0})'.format(get_filter_string(contextIds)))
+            assignmentConditions.append('context_id in ({0})'.format(get_filter_string(contextIds)))
+
+        attributes = ('id', 'name', 'start_date', 'end_date', 'status_id', 'type_id')
+        rows = self.session.query(
+            u'select {0} from TypedContext where ({1}) and object_type.name in ("Task", "Milestone")'.format(
+                ', '.join(attributes), ' or '.join(conditions)
+            )
+        )
+        version = data_version(rows, attributes)
+
+        if (self.settings['show_assignees'] or self.settings['show_load']):
+            assignments = self.session.query(
+                u'select context_id, resource_id from Appointment where type is "assignment" and ({0})'.format(
+                    ' or '.join(assignmentConditions)
+                )
+            )
+            version += data_version(assignments, ('context_id', 'resource_id'))
+
+        return version
+
+    def cacheKey(self, format):
+        '''Returns the key of this chart in *format* in the cache of exports'''
+        # Relative windows show other tasks each day
+        settings = dict(self.settings, date_window=self.dateWindow(), formats=[format])
+
+        return export_key(self.identifier, self.entities, settings, self.dataVersion())
+
+    def findCached(self):
+        '''Returns the cached component of each chosen format (None for the ones not in the cache)'''
+        return [find_cached(self.session, self.cacheKey(format)) for format in self.formats()]
+
+    def listSetting(self, name):
+        '''Returns the setting *name* as a list (text fields give comma separated values)'''
+        values = self.settings[name] or []
+        if isinstance(values, basestring):
+            values = values.split(',')
+
+        return [value.strip() for value in values if value.strip() != '']
+
+    def dateWindow(self):
+        '''Returns the first and last day to show as `YYYY-MM-DD` or None to show everything'''
+        window = self.settings['date_window']
+
+        if window in self.dateWindows:
+            today = datetime.date.today()
+            end = today + datetime.timedelta(self.dateWindows[window])
+            return (today.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'))
+
+        if window == 'custom':
+            start = (self.settings['start_date'] or '')[:10] or '1970-01-01'
+            end = (self.settings['end_date'] or '')[:10] or '9999-12-31'
+            return (start, end)
+
+        return None
+
+    def filterConditions(self, tasks=True):
+        '''Returns the conditions of the where-clause for the chosen window and filters
+
+        Types, statuses and assignees only filter tasks (*tasks* is True), so
+        milestones are always shown within the date window.
+        '''
+        conditions = []
+
+        window = self.dateWindow()
+        if window is not None:
+            # Everything overlapping the window (milestones might only have an end)
+            conditions.append(
+                u'end_date >= "{0}" and (start_date <= "{1}" or (start_date is None and end_date <= "{1}"))'.format(
+                    window[0], window[1]
+                )
+            )
+
+        if not tasks:
+            return conditions
+
+        taskTypes = self.listSetting('task_types')
+        if (len(taskTypes) > 0):
+            conditions.append(u'type_id in ({0})'.format(get_filter_string(taskTypes)))
+
+        statuses = self.listSetting('statuses')
+        if (len(statuses) > 0):
+            conditions.append(u'status_id in ({0})'.format(get_filter_string(statuses)))
+
+        assignees = self.listSetting('assignees')
+        if (len(assignees) > 0):
+            conditions.append(u'assignments any (resource_id in ({0}))'.format(get_filter_string(assignees)))
+
+        return conditions
+
+    def projection(self):
+        '''Returns the attributes to fetch along with the tasks and milestones'''
+        attributes = list(CHART_ATTRIBUTES)
+        if (self.settings['show_assignees'] or self.settings['show_load']):
+            # The names of their users are fetched all at once (see loadAssignees)
+            attributes.append('assignments.resource')
+
+        return attributes
+
+    def collect(self):
+        '''Returns all tasks and milestones to show (sorted by their start) and the headline'''
+        # TODO: What about connections between tasks? => Show arrows?
+        # TODO: What about hierarchy (sort and show parent-grouping?)
+
+        realEntities = []
+        headline = "Overview"
+        select = 'select {0} from '.format(', '.join(self.projection()))
+
+        # The server filters the tasks and milestones, so only these are transferred
+        taskFilter = ''.join(' and ({0})'.format(condition) for condition in self.filterConditions())
+        milestoneFilter = ''.join(' and ({0})'.format(condition) for condition in self.filterConditions(tasks=False))
+
+        # Selected tasks and milestones need to match the filters as well
+        contextIds = [entity[1] for entity in self.entities if entity[0] != 'Project']
+        matching = None
+        if (len(contextIds) > 0 and taskFilter != ''):
+            with phase(self.metrics, 'query'):
+                matching = set(
+                    match['id'] for match in self.session.query(
+                        u'select id from Task where id in ({0}){1}'.format(get_filter_string(contextIds), taskFilter)
+                    )
+                ) | set(
+                    match['id'] for match in self.session.query(
+                        u'select id from Milestone where id in ({0}){1}'.format(get_filter_string(contextIds), milestoneFilter)
+                    )
+                )
+
+        # The whole selection at once, with everything the chart shows
+        with phase(self.metrics, 'resolve'):
+            resolved = getRealEntitiesFromTypedContext(self.session, self.entities, {
+                'Project': ['name', 'full_name'],
+                'TypedContext': self.projection()
+            })
+
+        for index, oneObject in enumerate(resolved):
+            if self.cancel is not None:
+                self.cancel.check()
+            if self.progress is not None:
+                self.progress.step('Collecting', index, len(self.entities))
+
+            if oneObject is None:
+                continue
+
+            # Handling projects: We will need to get all the tasks of the project
+            if type(oneObject).__name__ == "Project":
+                with phase(self.metrics, 'query'):
+                    tasks = self.session.query(select + 'Task where project.name is "' + oneObject['name'] + '"' + taskFilter)
+                    realEntities.extend(tasks)
+                    milestones = self.session.query(select + 'Milestone where project.name is "' + oneObject['name'] + '"' + milestoneFilter)
+                    realEntities.extend(milestones)
+
+                headline = oneObject['full_name']
+            elif (matching is None or oneObject['id'] in matching):
+                realEntities.append(oneObject)
+
+        if self.metrics is not None:
+            self.metrics.count('entities', len(realEntities))
+
+        if (self.settings['show_assignees'] or self.settings['show_load']):
+            with phase(self.metrics, 'query'):
+                self.loadAssignees(realEntities)
+
+        # Sorting needs the start dates (fetched along with the entities)
+        with phase(self.metrics, 'load'):
+            return sorted(realEntities, key=extract_start_date), headline
+
+    def loadAssignees(self, entities):
+        '''Fetches the names of all users assigned to *entities* at once
+
+        The assignments come along with the tasks, but not the names of their
+        users. Otherwise each user would be loaded on its own when the layout
+        shows the first of its tasks.
+        '''
+        userIds = set()
+        for entity in entities:
+            for assignment in entity['assignments']:
+                if (type(assignment['resource']).__name__ == 'User'):
+                    userIds.add(assignment['resource']['id'])
+
+        userIds = sorted(userIds)
+        for start in range(0, len(userIds), RESOLVE_CHUNK_SIZE):
+            self.session.query(
+                u'select first_name, last_name from User where id in ({0})'.format(
+                    get_filter_string(userIds[start:start + RESOLVE_CHUNK_SIZE])
+                )
+            ).all()
+
+    def formats(self):
+        '''Returns the chosen formats (see `renderers.FORMATS`)'''
+        formats = self.listSetting('formats') or ['html']
+
+        for format in formats:
+            if format not in renderers.FORMATS:
+                raise ValueError('Unknown format "{0}" (choose from {1})'.format(format, ', '.join(sorted(renderers.FORMATS))))
+
+        return formats
+
+    def layout(self):
+        '''Returns the layout of the chart (this is where all data is fetched)'''
+        realEntities, headline = self.collect()
+
+        with phase(self.metrics, 'layout'):
+            return layout.build_layout(
+                realEntities,
+                headline,
+                status=self.settings['show_status'],
+                assignees=self.settings['show_assignees'],
+                load=self.settings['show_load'],
+                progress=self.progress
+            )
+
+    def files(self, formats):
+        '''Renders the chart in all *formats* into temporary files and returns their paths
+
+        All formats are rendered from the same layout, so the data is fetched once.
+        '''
+        layout = self.layout()
+
+        customCss = None
+        if (self.settings['self_contained'] and self.settings['custom_css'] != ''):
+            customCss = self.customCss()
+
+        files = []
+        for format in formats:
+            renderer, suffix = renderers.FORMATS[format]
+
+            exporter = Exporter(
+                fetch=lambda: layout,
+                transform=lambda layout: renderer(layout, self.settings, customCss),
+                sink=FileSink('gantt_export_', suffix, compress=self.settings['compress']),
+                progress=self.progress,
+                cancel=self.cancel,
+                metrics=self.metrics
+            )
+            files.append(exporter.run())
+
+        return files
+
+    def write(self, file_path):
+        '''Renders the chart to *file_path* (without any job or upload) and returns the written paths
+
+        If there are several formats, each gets its extension instead of the one of *file_path*.
+        Compressed files get `.gz` appended (e.g. chart.html.gz), as browsers do not open
+        them by the name of the format.
+        '''
+        formats = self.formats()
+
+        written = []
+        for format, path in zip(formats, self.files(formats)):
+            target = file_path
+            if (len(formats) > 1):
+                target = os.path.splitext(file_path)[0] + renderers.FORMATS[format][1]
+            if (self.settings['compress'] and not target.endswith('.gz')):
+                target += '.gz'
+
+            shutil.move(path, target)
+            written.append(target)
+
+        return written
+
+    def publish(self, job):
+        '''Exports the chart and attaches it to *job*
+
+        Each format that has been exported before (and nothing changed since) is
+        not exported again, the job simply gets that one.
+        '''
+        if self.progress is not None:
+            self.progress.update('Checking for changes')
+
+        formats = self.formats()
+
+        with phase(self.metrics, 'cache'):
+            components = self.findCached()
+
+        cached = [component for component in components if component is not None]
+        missing = [format for format, component in zip(formats, components) if component is None]
+
+        if (len(missing) == 0):
+            return publish_files(self.session, job, [], 'Gantt Chart exported (unchanged since the last export)', components=cached, metrics=self.metrics)
+
+        files = [
+            (path, {CACHE_KEY: self.cacheKey(format)})
+            for format, path in zip(missing, self.files(missing))
+        ]
+
+        return publish_files(self.session, job, files, 'Gantt Chart exported', self.progress, self.cancel, cached, self.metrics)
+
+    def customCss(self):
+        '''Returns the content of the custom CSS file (a URL or, if trusted, a local path)
+
+        The settings of an action come from any ftrack user, so the file is only
+        fetched from an http(s) URL on one of the hosts in `UNEX_GANTT_CSS_HOSTS`
+        (without following redirects). Otherwise users could read files of the
+        machine doing the export or make it request internal URLs.
+        '''
+        location = self.settings['custom_css']
+
+        if (self.trusted and os.path.isfile(location)):
+            with open(location) as f:
+                return f.read().decode('utf-8')
+
+        url = urlparse.urlparse(location)
+        hosts = [host.strip().lower() for host in os.environ.get(CSS_HOSTS_VARIABLE, '').split(',') if host.strip()]
+        if (url.scheme not in ('http', 'https') or not (self.trusted or (url.hostname or '').lower() in hosts)):
+            raise ValueError(u'Custom CSS can only be inlined from http(s) URLs on the hosts in {0}, not from "{1}"'.format(
+                CSS_HOSTS_VARIABLE, location
+            ))
+
+        response = requests.get(location, timeout=30, allow_redirects=False)
+        response.raise_for_status()
+        if response.is_redirect:
+            raise ValueError(u'Custom CSS at "{0}" redirects somewhere else'.format(location))
+
+        return response.text
+
+
+def exportGanttChart(session, entities, settings=None, user_id=None, output=None, logger=None, version=None, trusted=False):
+    '''
+    Export a Gantt Chart - this is what the action does, but usable from anywhere
+
+    *session* is a `ftrack_api.Session` instance
+
+    *entities* is a list of tuples each containing the entity type and the entity id
+
+    *settings* is a dictionary of export settings (see `GanttChart.defaultSettings`)
+
+    If *output* is given, the chart is simply written to this path and the written
+    paths are returned. Otherwise it is exported within a job for *user_id* (just like the
+    action does it) and the job is returned.
+
+    *version* is the `GanttChart.dataVersion` of the selection, if it is known already.
+
+    Only *trusted* settings (not the ones of an action) may inline a local file
+    as custom CSS (see `GanttChart.customCss`).
+
+    The time of each phase and the round trips to the server are logged when
+    the export is finished (see `unex_runtime.metrics`). With `UNEX_QUERY_GUARD`
+    set, lines of code causing a round trip per task are reported as well (see
+    `unex_runtime.guard`).
+    '''
+    logger = logger or logging.getLogger(__name__)
+    metrics = Metrics(GanttChart.identifier, logger)
+    metrics.instrument(session)
+    guard = QueryGuard(GanttChart.identifier, logger=logger)
+    guard.watch(session)
+
+    if output is not None:
+        try:
+            written = GanttChart(session, entities, settings, metrics=metrics, version=version, trusted=trusted).write(output)
+            guard.finish()
+        except BaseException:
+            guard.release()
+            metrics.finish('failed')
+            raise
+
+        metrics.finish()
+        return written
+
+    job = start_job(session, user_id, 'Exporting Gantt Chart...')
+    cancel = CancelToken(session, job)
+    progress = JobProgress(session, job, cancel=cancel)
+    status = 'done'
+
+    try:
+        GanttChart(session, entities, settings, progress, cancel, metrics, version, trusted).publish(job)
+        guard.finish()
+
+    except ExportCancelled:
+        logger.info('Exporting Gantt Chart was cancelled')
+        status = 'cancelled'
+        end_cancelled_job(session, job)
+
+    except BaseException as exc:
+        # Error handling: Write error
+        logger.exception('Exporting Gantt Chart failed')
+        status = 'failed'
+        fail_job(session, job, exc.message.replace("<", "&lt;").replace(">", "&gt;"))
+
+    finally:
+        guard.release()
+        metrics.finish(status)
+
+    return job
+
+
+def prerenderGanttCharts(session, settings=None, user_id=None, logger=None):
+    '''
+    Export the Gantt Charts of all active projects, unless they are up to date
+
+    A project is skipped if its chart (in each format of *settings*) is already in
+    the cache, which only needs the cheap queries of `GanttChart.dataVersion`. This
+    version is looked up once per project and run, the export reuses it. Each project
+    points to the component of its latest chart in its metadata (see
+    `LATEST_CHART_KEY`). As the charts are in the cache, exporting them on
+    demand with the same settings returns right away.
+
+    Returns the number of exported charts.
+    '''
+    logger = logger or logging.getLogger(__name__)
+    exported = 0
+
+    projects = session.query(u'select id, full_name, metadata from Project where status is "active"')
+
+    for project in projects:
+        entities = [('Project', project['id'])]
+        chart = GanttChart(session, entities, settings)
+        components = chart.findCached()
+
+        if None in components:
+            logger.info(u'Pre-rendering Gantt Chart for {0}'.format(project['full_name']))
+            job = exportGanttChart(session, entities, settings, user_id, logger=logger, version=chart.dataVersion())
+            exported += 1
+
+            if job['status'] != 'done':
+                continue
+
+            # The latest chart is the first format, as the action shows that one
+            components = chart.findCached()
+            if components[0] is None:
+                continue
+
+        else:
+            logger.debug(u'Gantt Chart for {0} is up to date'.format(project['full_name']))
+
+        if project['metadata'].get(LATEST_CHART_KEY) != components[0]['id']:
+            project['metadata'][LATEST_CHART_KEY] = components[0]['id']
+            session.commit()
+
+    return exported
+
+
+def scheduleGanttCharts(session, interval, settings=None, user_id=None, logger=None):
+    '''
+    Pre-render the Gantt Charts of all active projects every *interval* seconds
+
+    See `prerenderGanttCharts`. Runs until it is interrupted. *session* forgets
+    everything it fetched before each run (like the sessions of `JOB_SESSIONS`),
+    so it does not pile up all projects and every run sees fresh data.
+    '''
+    logger = logger or logging.getLogger(__name__)
+
+    while True:
+        started = time.time()
+
+        try:
+            reset_session(session)
+            exported = prerenderGanttCharts(session, settings, user_id, logger)
+            logger.info(u'Pre-rendered {0} Gantt Chart(s) in {1:.1f}s'.format(exported, time.time() - started))
+
+        except Exception:
+            # Try again next time
+            logger.exception('Pre-rendering Gantt Charts failed')
+            session.rollback()
+
+        time.sleep(max(interval - (time.time() - started), 0))
 
 
-class unexCreateGanttChartAction(BaseAction):
+class unexCreateGanttChartAction(UnexAction):
     '''This is the action for creating a Gantt Chart'''
     
     ##############################################################################
@@ -177,6 +727,83 @@ class unexCreateGanttChartAction(BaseAction):
                     'name': 'show_status',
                     'value': 'False'
                 },
+                {
+                    'label': 'Show workload per assignee',
+                    'type': 'boolean',
+                    'name': 'show_load',
+                    'value': 'False'
+                },
+                {
+                    'label': 'Tasks per assignee and day (more are overbooked)',
+                    'type': 'number',
+                    'name': 'load_capacity',
+                    'value': 1
+                },
+                {
+                    'type': 'label',
+                    'value': '___'
+                },
+                {
+                    'type': 'label',
+                    'value': 'Only export (leave empty to export everything):'
+                },
+                {
+                    'label': 'Date window',
+                    'type': 'enumerator',
+                    'name': 'date_window',
+                    'value': 'all',
+                    'data': [
+                        {'label': 'Everything', 'value': 'all'},
+                        {'label': 'Next 2 weeks', 'value': '2w'},
+                        {'label': 'Next 6 weeks', 'value': '6w'},
+                        {'label': 'Next 3 months', 'value': '3m'},
+                        {'label': 'From start to end date below', 'value': 'custom'}
+                    ]
+                },
+                {
+                    'label': 'Start date',
+                    'type': 'date',
+                    'name': 'start_date',
+                    'value': ''
+                },
+                {
+                    'label': 'End date',
+                    'type': 'date',
+                    'name': 'end_date',
+                    'value': ''
+                },
+                {
+                    'label': 'Task types',
+                    'type': 'enumerator',
+                    'name': 'task_types',
+                    'multi_select': True,
+                    'data': [
+                        {'label': taskType['name'], 'value': taskType['id']}
+                        for taskType in session.query('select id, name from Type order by name')
+                    ]
+                },
+                {
+                    'label': 'Statuses',
+                    'type': 'enumerator',
+                    'name': 'statuses',
+                    'multi_select': True,
+                    'data': [
+                        {'label': status['name'], 'value': status['id']}
+                        for status in session.query('select id, name from Status order by name')
+                    ]
+                },
+                {
+                    'label': 'Assignees',
+                    'type': 'enumerator',
+                    'name': 'assignees',
+                    'multi_select': True,
+                    'data': [
+                        {'label': u'{0} {1}'.format(user['first_name'], user['last_name']), 'value': user['id']}
+                        for user in session.query(
+                            'select id, first_name, last_name from User where is_active is true order by first_name'
+                        )
+                    ]
+                },
                 {
                     'type': 'label',
                     'value': '___'
@@ -186,6 +813,31 @@ class unexCreateGanttChartAction(BaseAction):
                     'type': 'text',
                     'name': 'custom_css',
                     'value': ''
+                },
+                {
+                    'label': 'Formats',
+                    'type': 'enumerator',
+                    'name': 'formats',
+                    'multi_select': True,
+                    'value': ['html'],
+                    'data': [
+                        {'label': 'HTML page', 'value': 'html'},
+                        {'label': 'SVG', 'value': 'svg'},
+                        {'label': 'PDF (needs cairosvg)', 'value': 'pdf'},
+                        {'label': 'PNG (needs cairosvg)', 'value': 'png'}
+                    ]
+                },
+                {
+                    'label': 'Self-contained and minified (for offline viewing)',
+                    'type': 'boolean',
+                    'name': 'self_contained',
+                    'value': 'False'
+                },
+                {
+                    'label': 'Compress file (gzip)',
+                    'type': 'boolean',
+                    'name': 'compress',
+                    'value': 'False'
                 }
             ]
 
@@ -243,630 +895,266 @@ class unexCreateGanttChartAction(BaseAction):
 
 
 
-    @async
+    @run_async
     def mainAsyncAction(self, entities, user_id, settings):
         '''
         The main action this one is doing inside a job
         '''
         
-        # Setup a session for the running job
-        session = ftrack_api.Session(
-            auto_connect_event_hub=False
-        )
-        job = session.create('Job', {
-            'user_id': user_id,
-            'status': 'running',
-            'data': json.dumps({
-                'description': 'Exporting Gantt Chart...'
-            })
-        })
-        session.commit()
-
-        try:
-            # TODO: What about connections between tasks? => Show arrows?
-            # TODO: What about hierarchy (sort and show parent-grouping?)
+        # Take a session for the running job
+        with JOB_SESSIONS.session() as session:
+            exportGanttChart(session, entities, settings, user_id, logger=self.logger)
 
 
-    
-            realEntities = []
-            printString = ""
-            headline = "Overview"
-
-            for entity in entities:
-                oneObject = getRealEntityFromTypedContext(session, entity)
-
-                # Handling projects: We will need to get all the tasks of the project
-                if type(oneObject).__name__ == "Project":
-                    tasks = session.query('select id from Task where project.name is "' + oneObject['name'] + '"')
-                    realEntities.extend(tasks)
-                    milestones = session.query('select id from Milestone where project.name is "' + oneObject['name'] + '"')
-                    realEntities.extend(milestones)
-
-                    headline = oneObject['full_name']
-                else:
-                    realEntities.append(oneObject)
-            
-            realEntities = sorted(realEntities, key=extract_start_date)
-
-            # Get min and max dates
-            minDate = datetime.datetime(3000, 1, 1)
-            maxDate = datetime.datetime(2000, 1, 1)
-            for task in realEntities:
-                if (task['start_date'] != None):
-                    tStartDate = datetime.datetime(task['start_date'].year, task['start_date'].month, task['start_date'].day, task['start_date'].hour, task['start_date'].minute)
-                    if (tStartDate < minDate):
-                        minDate = tStartDate
-                if (task['end_date'] != None):
-                    tEndDate = datetime.datetime(task['end_date'].year, task['end_date'].month, task['end_date'].day, task['end_date'].hour, task['end_date'].minute)
-                    if (tEndDate > maxDate):
-                        maxDate = tEndDate
-            daycount = (maxDate - minDate).days
-
-
-
-
-            # Generate HTML file
-
-            taskHeight = 38
-            if settings['show_assignees']:
-                taskHeight += 8
-
-            # CSS
-            cssStyle = '''
-            body {
-                font-family: 'Roboto', sans-serif;
-                padding: 0pt;
-                margin: 0pt;
-            }
-            .headline {
-                font-size: 18pt;
-                font-weight: bold;
-                padding: 5pt;
-                margin: 0pt;
-            }
-
-            @media print
-            {    
-                .no-print, .no-print *
-                {
-                    display: none !important;
-                }
-            }
-
-            .main {
-                position: relative;
-                margin: 5pt;
-                padding: 30pt 0% 20pt 0%;
-                background-color: #ddd;
-                border-radius: 2pt;
-                z-index: -20;
-            }
-
-            .weekend_mark {
-                position: absolute;
-                top: 0%;
-                margin: 0%;
-                padding: 0%;
-                background-color: #ccc;
-                height: 100%;
-                z-index: -10;
-                box-sizing: border-box;
-            }
-            .week_mark, .month_mark {
-                position: absolute;
-                top: 0%;
-                margin: 0%;
-                padding: 0%;
-                padding-left: 4pt;
-                height: 10pt;
-                border-left: 1pt #888 solid;
-                height: 100%;
-                font-size: 9pt;
-                font-weight: bold;
-                box-sizing: border-box;
-            }
-            .week_mark {
-                padding-top: 12pt;
-                border-left-color: #aaa;
-                z-index: -5;
-            }
-
-            .task {
-                margin: 0pt 0pt 2pt 0pt;
-                padding: 5pt;
-                height: ''' + str(taskHeight) + '''pt;
-                position: relative;
-                border: 1pt solid #000;
-                border-radius: 2pt;
-                box-sizing: border-box;
-            }
-
-            .task .name {
-                font-size: 9pt;
-                font-weight: bold;
-            }
-
-            .task .start {
-                position: absolute;
-                left: 5pt;
-                bottom: 0pt;
-                height: 10pt;
-                font-size: 7pt;
-            }
-            .task .end {
-                position: absolute;
-                right: 5pt;
-                bottom: 0pt;
-                height: 10pt;
-                font-size: 7pt;
-            }
-
-            .task .type {
-                font-size: 7pt;
-            }
-
-            .task .assigned {
-                font-size: 7pt;
-            }
-            .task .assigned .user {
-                font-size: 7pt;
-                display: inline;
-            }
-
-            .task .status {
-                font-size: 7pt;
-                display: inline-block;
-                border-radius: 2pt;
-                padding: 2pt;
-                position: absolute;
-                top: 0pt;
-                right: 0pt;
-                opacity: 0.9;
-                transition: all .3s;
-            }
-            .task .status:hover {
-                opacity: 1;
-            }
-
-
-            .milestone {
-                margin: 0pt 0pt 2pt 0pt;
-                padding: 5pt;
-                height: 28pt;
-                position: relative;
-                border-left: solid 2pt #f00;
-                box-sizing: border-box;
-            }
-
-            .milestone .caption {
-                font-size: 9pt;
-                font-weight: bold;
-            }
-            .milestone .end {
-                position: absolute;
-                left: 5pt;
-                bottom: 0pt;
-                height: 10pt;
-                font-size: 7pt;
-            }
-
-            
-            .milestone_bar {
-                position: absolute;
-                width: 2pt;
-                background-color: #f00;
-                top: 10pt;
-                bottom: 0pt;
-            }
-
-
-
-            .scale {
-                position: fixed;
-                opacity: .2;
-                top: 0pt;
-                right: 0pt;
-                width: 100pt;
-                background-color: #fff;
-                border: 1pt #000 solid;
-                padding: 0pt;
-                transition: all .3s;
-                border-top: 0pt;
-                border-right: 0pt;
-                border-radius: 0pt 0pt 0pt 5pt;
-            }
-
-            .scale:hover {
-                opacity: 1;
-            }
-
-            .scale input {
-                width: 90pt;
-                margin-left: 5pt;
-            }
-
-
-            '''
-
-            # General beginning
-
-            custom_css = ""
-            if settings['custom_css'] != '':
-                custom_css = '<link rel="stylesheet" href="' + settings['custom_css'] + '" />'
-
-            filecontent = '''
-            <html>
-                <head>
-                    <title>''' + headline + '''</title>
-                    <meta charset="utf-8">
-                    <link href="https://fonts.googleapis.com/css?family=Roboto&display=swap" rel="stylesheet"> 
-                    <style>''' + cssStyle + '''</style>
-                </head>
-                <body>
-                <div class="headline">''' + headline + '''</div>
-                <div class="main" id="mainpage">
-                    <div id="marks">
-            '''
-
-            # Write markers for weeks & months
-            for single_date in daterange(minDate, maxDate):
-                tLeft = ((single_date - minDate).days / float(daycount)) * 100.0
-
-                # mark weekends
-                if (single_date.weekday() == 5):
-                    tLength = (2.0 / float(daycount)) * 100.0
-                    filecontent += '''
-                        <div class="weekend_mark" style="left: ''' + str(tLeft) + '''%; width: ''' + str(tLength) + '''%;"></div>
-                    '''
-                
-                # mark each week beginning
-                if (single_date.weekday() == 0):
-                    tLength = (7.0 / float(daycount)) * 100.0
-                    filecontent += '''
-                        <div class="week_mark" style="left: ''' + str(tLeft) + '''%; width: ''' + str(tLength) + '''%;">
-                            <div class="caption">''' + single_date.strftime("%m/%d") + '''</div>
-                        </div>
-                    '''
-                
-                if (single_date.day == 1):
-                    # mark first day of month
-                    tLength = (calendar.monthrange(single_date.year, single_date.month)[1] / float(daycount)) * 100.0
-                    filecontent += '''
-                        <div class="month_mark" style="left: ''' + str(tLeft) + '''%; width: ''' + str(tLength) + '''%;">
-                            <div class="caption">''' + single_date.strftime("%b %Y") + '''</div>
-                        </div>
-                    '''
+class unexGanttChartWorker(unexCreateGanttChartAction):
+    '''
+    The same action, but served by a worker on a server
 
-            
-            filecontent += '''
-                </div>
-                '''
-            
-            tasksprint = ""
-            milestonesprint = ""
-
-            # Write all tasks
-            for task in realEntities:
-                if (type(task).__name__ == "Task"):
-                    statusText = ""
-                    assigneesText = ""
-
-                    if settings['show_status']:
-                        statusText = '<div class="status" style="background-color: ' + task['status']['color'] + ';">' + task['status']['name'] + '</div>'
-                    
-                    if settings['show_assignees']:
-                        assignedUsers = []
-
-                        for assignment in task['assignments']:
-                            if (type(assignment['resource']).__name__ == 'User'):
-                                assignedUsers.append('<div class="user">' + assignment['resource']['first_name'] + " " + assignment['resource']['last_name'] + '</div>')
-                        
-                        if (len(assignedUsers) > 0):
-                            assigneesText = '<div class="assigned">' + ', '.join(assignedUsers) + '</div>'
-                        else:
-                            assigneesText = '<div class="assigned">(unassigned)</div>'
-
-                    if (task['start_date'] != None and task['end_date'] != None):
-                        # Task with defined dates: Calculate ranges
-                        tStartDate = datetime.datetime(task['start_date'].year, task['start_date'].month, task['start_date'].day, task['start_date'].hour, task['start_date'].minute)
-                        tEndDate = datetime.datetime(task['end_date'].year, task['end_date'].month, task['end_date'].day, task['end_date'].hour, task['end_date'].minute)
-
-                        tLeft = ((tStartDate - minDate).days / float(daycount)) * 100.0
-                        tLength = ((tEndDate - tStartDate).days / float(daycount)) * 100.0
-                    
-
-                        tasksprint += '''
-                            <div class="task" style="left: ''' + str(tLeft) + '''%; width: ''' + str(tLength) + '''%; background-color: ''' + task['type']['color'] + '''C0;">
-                                <div class="name">''' + task['name'] + '''</div>
-                                <div class="start">''' + task['start_date'].strftime("%Y/%m/%d") + '''</div>
-                                <div class="end">''' + task['end_date'].strftime("%Y/%m/%d") + '''</div>
-                                <div class="type">''' + task['type']['name'] + '''</div>
-                                ''' + statusText + assigneesText + '''
-                            </div>
-                        '''
-                    else:
-                        # Task without defined dates
-                        
-                        if (task['end_date'] != None):
-                            # Task with an end date, but no start date
-                            tEndDate = datetime.datetime(task['end_date'].year, task['end_date'].month, task['end_date'].day, task['end_date'].hour, task['end_date'].minute)
-                            tLeft = ((tEndDate - minDate).days / float(daycount)) * 100.0
-                            tLength = 15
-
-                            if (tLeft - tLength < 0):
-                                tLength = tLeft
-                                tLeft = 0
-                            else:
-                                tLeft = tLeft - tLength
-
-                            tasksprint += '''
-                            <div class="task" style="left: ''' + str(tLeft) + '''%; width: ''' + str(tLength) + '''%; background-color: ''' + task['type']['color'] + '''C0; border-left: 0pt;">
-                                <div class="name">''' + task['name'] + '''</div>
-                                <div class="end">''' + task['end_date'].strftime("%Y/%m/%d") + '''</div>
-                                <div class="type">''' + task['type']['name'] + '''</div>
-                                ''' + statusText + assigneesText + '''
-                            </div>
-                            '''
-                        elif (task['start_date'] != None):
-                            # Task with an start date, but no end date
-                            tStartDate = datetime.datetime(task['start_date'].year, task['start_date'].month, task['start_date'].day, task['start_date'].hour, task['start_date'].minute)
-                            tLeft = ((tStartDate - minDate).days / float(daycount)) * 100.0
-                            tLength = 15
-
-                            if (tLeft + tLength > 100):
-                                tLength = 100 - tLeft
-
-                            tasksprint += '''
-                            <div class="task" style="left: ''' + str(tLeft) + '''%; width: ''' + str(tLength) + '''%; background-color: ''' + task['type']['color'] + '''C0; border-right: 0pt;">
-                                <div class="name">''' + task['name'] + '''</div>
-                                <div class="start">''' + task['start_date'].strftime("%Y/%m/%d") + '''</div>
-                                <div class="type">''' + task['type']['name'] + '''</div>
-                                ''' + statusText + assigneesText + '''
-                            </div>
-                            '''
-                        else:
-                            tLeft = 0
-                            tLength = 100
-
-                            tasksprint += '''
-                            <div class="task" style="left: ''' + str(tLeft) + '''%; width: ''' + str(tLength) + '''%; background-color: ''' + task['type']['color'] + '''C0;">
-                                <div class="name">''' + task['name'] + '''</div>
-                                <div class="type">''' + task['type']['name'] + '''</div>
-                                ''' + statusText + assigneesText + '''
-                            </div>
-                            '''
-
-                elif (type(task).__name__ == "Milestone" and task['end_date'] != None):
-                    # Handling milestones (but only if they have a date)
-
-                    tStartDate = datetime.datetime(task['end_date'].year, task['end_date'].month, task['end_date'].day, task['end_date'].hour, task['end_date'].minute)
-                    tLeft = ((tStartDate - minDate).days / float(daycount)) * 100.0
-                    tLength = 15
-
-                    if (tLeft + tLength > 100):
-                        tLength = 100 - tLeft
-
-                    milestonesprint += '''
-                            <div class="milestone" style="left: ''' + str(tLeft) + '''%; width: ''' + str(tLength) + '''%; background-color: ''' + task['type']['color'] + '''C0;">
-                                <div class="caption">''' + task['name'] + '''</div>
-                                <div class="end">''' + task['end_date'].strftime("%Y/%m/%d") + '''</div>
-                            </div>
-                            <div class="milestone_bar" style="left: ''' + str(tLeft) + '''%;"></div>
-                            '''
-                    
-            # Apply
-            
-            filecontent += '''
-                <div id="milestones">
-                    ''' + milestonesprint + '''
-                </div>
-                <div id="tasks">
-                    ''' + tasksprint + '''
-                </div>
-                '''
-
-
-            # General ending
-
-            filecontent += '''
-                    </div>
-
-                    <div class="no-print">
-                        <div class="scale">
-                            <input type="range" min="800" max="5000" value="50" class="slider" id="scaleRange" onchange="Scale()">
-                        </div>
-                        <script>
-
-function Scale()
-{
-    document.getElementById("mainpage").style.width = document.getElementById("scaleRange").value + "px";
-    UpdateWeekMarks();
-}
-function UpdateWeekMarks()
-{
-    marks = document.getElementsByClassName("week_mark");
-    monthMarks = document.getElementsByClassName("month_mark");
-
-    if (monthMarks.length > 0 && monthMarks[0].offsetWidth < 310)
-    {
-        for (i = 0; i < marks.length; i++)
-        {
-            marks[i].style.display = "none";
-        }
-    } else
-    {
-        for (i = 0; i < marks.length; i++)
-        {
-            marks[i].style.display = "block";
-        }
-    }
-}
-
-document.getElementById("scaleRange").value = document.getElementById("mainpage").offsetWidth;
-UpdateWeekMarks();
-
-                        </script>
-                    </div>
-                </div>
-            </html>
-            '''
-
-            # Generate unique temp file name
-            file_path = tempfile.NamedTemporaryFile(
-                prefix='gantt_export_', 
-                suffix='.html', 
-                delete=False
-            ).name
-
-            # Write to file
-            f=open(file_path,"w")
-            f.write(filecontent.encode('utf-8'))
-            f.close()
-
-            # Create file component for job
-            job_file = os.path.basename(file_path).replace('.html', '')
-            component = session.create_component(
-                file_path,
-                data={'name': job_file},
-                location=session.query(u"Location where name is 'ftrack.server'").one()
-            )
-            session.commit()
+    Registers for all users instead of just the one running it, so a single
+    worker (see `main`) can take the exports off the artists' machines.
+    '''
 
-            # Attach to job
-            session.create(
-                'JobComponent',
-                {
-                    'component_id': component['id'], 
-                    'job_id': job['id']
-                }
-            )
-            
-            # Set job status as done
-            job['status'] = 'done'
-            job['data'] = json.dumps({
-                'description': 'Gantt Chart exported'
-            })
-            session.commit()
+    #: Action identifier.
+    identifier = 'de.unexpected.ftrack.export.ganttchart.server'
+
+    #: Action variant
+    variant = '(on server)'
+
+    def register(self):
+        '''Registers the action for all users'''
+        self.subscribe(
+            'topic=ftrack.action.discover',
+            self._discover,
+            self.discoverTimeout,
+            self.discoverBudget,
+            self.guessDiscover
+        )
 
-        except BaseException as exc:
-            # Error handling: Write error
-            self.logger.exception('Exporting Gantt Chart failed')
-            session.rollback()
-            job['status'] = 'failed'
-            job['data'] = json.dumps({
-                'description': exc.message.replace("<", "&lt;").replace(">", "&gt;")
-            })
-            session.commit()
+        self.subscribe(
+            'topic=ftrack.action.launch and data.actionIdentifier={0}'.format(
+                self.identifier
+            ),
+            self._launch,
+            self.launchTimeout
+        )
 
-            
 
+def register(session, **kw):
+    '''Register plugin. Called when used as an plugin.'''
+    register_actions(session, unexCreateGanttChartAction)
 
 
+def parseEntities(session, projects, entities):
+    '''
+    Returns the selection for the given project names and `Type:id` strings
 
+    *session* is a `ftrack_api.Session` instance
+    '''
+    selection = []
 
+    for name in projects:
+        project = session.query(u'select id from Project where name is "{0}"'.format(name)).first()
+        if project is None:
+            raise ValueError('There is no project named "{0}"'.format(name))
+        selection.append(('Project', project['id']))
 
+    for entity in entities:
+        if ':' not in entity:
+            raise ValueError('Entities are given as Type:id, not "{0}"'.format(entity))
+        selection.append(tuple(entity.split(':', 1)))
 
+    return selection
 
 
+def resolveNames(session, entityType, attribute, names):
+    '''
+    Returns the ids of the entities of *entityType* whose *attribute* is one of *names*
 
+    *session* is a `ftrack_api.Session` instance
+    '''
+    if (len(names) == 0):
+        return []
 
+    found = dict(
+        (entity[attribute], entity['id']) for entity in session.query(
+            u'select id, {0} from {1} where {0} in ({2})'.format(attribute, entityType, get_filter_string(names))
+        )
+    )
 
+    for name in names:
+        if name not in found:
+            raise ValueError(u'There is no {0} "{1}"'.format(entityType, name))
 
+    return [found[name] for name in names]
 
 
-    
+def main(arguments=None):
+    '''Set up logging and register action, run a worker or export right away.'''
+    if arguments is None:
+        arguments = []
 
+    parser = argument_parser()
+    parser.add_argument(
+        'command',
+        nargs='?',
+        help='register: the action for this user (default), worker: the action '
+             'for all users (on a server), export: export the given selection once, '
+             'schedule: pre-render the charts of all active projects regularly, '
+             'live: serve the given selection as a chart which updates itself',
+        choices=('register', 'worker', 'export', 'schedule', 'live'),
+        default='register'
+    )
 
-    ##############################################################################
-    #                                                                            #
-    # You do not need to edit something below, as these are just utility methods #
-    #                   for discovery, registration and more                     #
-    #                                                                            #
-    ##############################################################################
+    # Options for exporting without ftrack-connect
+    parser.add_argument(
+        '--project',
+        help='Name of a project to export (may be given more than once).',
+        action='append',
+        default=[]
+    )
+    parser.add_argument(
+        '--entity',
+        help='Entity to export as Type:id (may be given more than once).',
+        action='append',
+        default=[]
+    )
+    parser.add_argument(
+        '-o', '--output',
+        help='Write the chart to this file. Otherwise it is attached to a job '
+             'of the API user, just like the action does.'
+    )
+    parser.add_argument('--show-assignees', action='store_true')
+    parser.add_argument('--show-status', action='store_true')
+    parser.add_argument('--custom-css', default='')
+    parser.add_argument('--compress', action='store_true')
+    parser.add_argument('--self-contained', action='store_true')
+    parser.add_argument(
+        '--format',
+        help='Format to export (may be given more than once, default: html).',
+        choices=sorted(renderers.FORMATS),
+        action='append',
+        default=[]
+    )
+    parser.add_argument('--show-load', action='store_true')
+    parser.add_argument('--load-capacity', type=int, default=1)
 
+    # Filters for exporting (and pre-rendering)
+    parser.add_argument(
+        '--window',
+        help='Only export the next 2 weeks, 6 weeks, 3 months or from --start to --end.',
+        choices=('all', '2w', '6w', '3m', 'custom'),
+        default='all'
+    )
+    parser.add_argument('--start', help='First day of a custom window (YYYY-MM-DD).', default='')
+    parser.add_argument('--end', help='Last day of a custom window (YYYY-MM-DD).', default='')
+    parser.add_argument(
+        '--task-type',
+        help='Only export tasks of this type (may be given more than once).',
+        action='append',
+        default=[]
+    )
+    parser.add_argument(
+        '--status',
+        help='Only export tasks with this status (may be given more than once).',
+        action='append',
+        default=[]
+    )
+    parser.add_argument(
+        '--assignee',
+        help='Only export tasks assigned to this username (may be given more than once).',
+        action='append',
+        default=[]
+    )
 
-    @property
-    def session(self):
-        '''Return convenient exposure of the self._session reference.'''
-        return self._session
+    # Options for pre-rendering
+    parser.add_argument(
+        '--interval',
+        help='Seconds between two runs of the schedule command.',
+        type=int,
+        default=3600
+    )
+    parser.add_argument(
+        '--once',
+        help='Pre-render just once instead of regularly.',
+        action='store_true'
+    )
 
-    @property
-    def ftrack_server_location(self):
-        '''Return the ftrack.server location.'''
-        return self.session.query(
-            u"Location where name is 'ftrack.server'"
-        ).one()
+    # Options for the live view
+    parser.add_argument(
+        '--port',
+        help='Port of the live view (on localhost).',
+        type=int,
+        default=8765
+    )
 
+    namespace = parser.parse_args(arguments)
 
-    def _discover(self, event):
-        '''Returns the parameters to show the interaction icon in the Actions Panel'''
-        args = self._translate_event(
-            self.session, event
-        )
+    setup_logging(namespace)
+
+    settings = {
+        'show_assignees': namespace.show_assignees,
+        'show_status': namespace.show_status,
+        'custom_css': namespace.custom_css,
+        'compress': namespace.compress,
+        'show_load': namespace.show_load,
+        'load_capacity': namespace.load_capacity,
+        'self_contained': namespace.self_contained,
+        'formats': namespace.format or ['html'],
+        'date_window': namespace.window,
+        'start_date': namespace.start,
+        'end_date': namespace.end
+    }
 
-        accepts = self.discover(
-            self.session, *args
+    if namespace.command in ('export', 'schedule', 'live'):
+        # Only the live view listens to events
+        session = ftrack_api.Session(
+            auto_connect_event_hub=(namespace.command == 'live')
         )
 
-        if accepts:
-            return {
-                'items': [{
-                    'label': self.label,
-                    'variant': self.variant,
-                    'description': self.description,
-                    'actionIdentifier': self.identifier,
-                    'icon': self.icon,
-                }]
-            }
+        try:
+            settings['task_types'] = resolveNames(session, 'Type', 'name', namespace.task_type)
+            settings['statuses'] = resolveNames(session, 'Status', 'name', namespace.status)
+            settings['assignees'] = resolveNames(session, 'User', 'username', namespace.assignee)
+
+            user = session.query(
+                u'select id from User where username is "{0}"'.format(session.api_user)
+            ).one()
+
+            if namespace.command == 'schedule':
+                serve_metrics()
+                if namespace.once:
+                    prerenderGanttCharts(session, settings, user['id'])
+                else:
+                    scheduleGanttCharts(session, namespace.interval, settings, user['id'])
+                return 0
 
+            entities = parseEntities(session, namespace.project, namespace.entity)
+            if (len(entities) == 0):
+                parser.error('Select something to export with --project or --entity')
 
-def register(session, **kw):
-    '''Register plugin. Called when used as an plugin.'''
-    # Validate that session is an instance of ftrack_api.Session. If not,
-    # assume that register is being called from an old or incompatible API and
-    # return without doing anything.
-    if not isinstance(session, ftrack_api.session.Session):
-        return
+            if namespace.command == 'live':
+                live.serve(GanttChart(session, entities, settings), namespace.port)
+                return 0
 
-    action_handler = unexCreateGanttChartAction(session)
-    action_handler.register()
+            result = exportGanttChart(session, entities, settings, user['id'], namespace.output, trusted=True)
+            if namespace.output is None:
+                logging.info(u'Export finished with status {0}'.format(result['status']))
+                return 0 if result['status'] == 'done' else 1
 
+            logging.info(u'Gantt Chart written to {0}'.format(', '.join(result)))
+            return 0
 
-def main(arguments=None):
-    '''Set up logging and register action.'''
-    if arguments is None:
-        arguments = []
-
-    parser = argparse.ArgumentParser()
-    # Allow setting of logging level from arguments.
-    loggingLevels = {}
-    for level in (
-        logging.NOTSET, logging.DEBUG, logging.INFO, logging.WARNING,
-        logging.ERROR, logging.CRITICAL
-    ):
-        loggingLevels[logging.getLevelName(level).lower()] = level
-
-    parser.add_argument(
-        '-v', '--verbosity',
-        help='Set the logging output verbosity.',
-        choices=loggingLevels.keys(),
-        default='info'
-    )
-    namespace = parser.parse_args(arguments)
-
-    # Set up basic logging.
-    logging.basicConfig(level=loggingLevels[namespace.verbosity])
+        finally:
+            session.close()
 
     session = ftrack_api.Session()
-    register(session)
+    if namespace.command == 'worker':
+        register_actions(session, unexGanttChartWorker)
+    else:
+        register(session)
 
-    # Wait for events.
-    logging.info(
-        'Registered actions and listening for events. Use Ctrl-C to abort.'
-    )
-    session.event_hub.wait()
+    wait(session)
 
 
 if __name__ == '__main__':
     raise SystemExit(main(sys.argv[1:]))
-
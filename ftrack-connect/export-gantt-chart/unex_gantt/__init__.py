@@ -0,0 +1,11 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2019 c.arlt@unexpected.de
+# :license: GPL-3.0
+
+'''
+Layout and renderers of the Gantt Chart export
+
+The layout (`unex_gantt.layout`) is computed once from the tasks and
+milestones. Each format (`unex_gantt.renderers`) just draws it, so exporting
+several formats needs a single fetch and layout pass.
+'''
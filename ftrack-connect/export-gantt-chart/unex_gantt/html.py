@@ -0,0 +1,499 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2019 c.arlt@unexpected.de
+# :license: GPL-3.0
+
+'''
+HTML renderer of a Gantt Chart
+
+The page is relative in width, so using a large monitor will create a nice
+chart. A slider lets the viewer scale it.
+'''
+
+from unex_runtime.minify import SYSTEM_FONTS, minify_css, minify_js, minify_html
+
+
+#: Script of the live view (see `unex_gantt.live`), which patches rows as they change
+LIVE_SCRIPT = '''
+function Patch(container, id, html)
+{
+    var old = document.querySelectorAll('[data-row="' + id + '"]');
+    var template = document.createElement("div");
+    template.innerHTML = html;
+
+    var parent = document.getElementById(container);
+    var anchor = (old.length > 0 && old[0].parentNode == parent) ? old[0] : null;
+    while (template.firstChild)
+    {
+        parent.insertBefore(template.firstChild, anchor);
+    }
+    for (var i = 0; i < old.length; i++)
+    {
+        old[i].parentNode.removeChild(old[i]);
+    }
+}
+
+var events = new EventSource("events");
+events.addEventListener("row", function (e) {
+    var data = JSON.parse(e.data);
+    Patch(data.container, data.id, data.html);
+});
+events.addEventListener("load", function (e) {
+    document.getElementById("load").innerHTML = JSON.parse(e.data).html;
+});
+events.addEventListener("reload", function (e) {
+    location.reload();
+});
+'''
+
+
+def render_html(layout, settings, custom_css=None, live=False):
+    '''
+    Yield the HTML of *layout* chunk by chunk
+
+    *settings* are the export settings (see `GanttChart.defaultSettings`).
+    If the page is self-contained, *custom_css* is the content of the custom
+    CSS, which is inlined instead of linked. With *live*, the page receives
+    changed rows from the live view's server.
+    '''
+    if settings['self_contained']:
+        return minify_html(html_chunks(layout, settings, custom_css, live))
+
+    return html_chunks(layout, settings, custom_css, live)
+
+
+def html_chunks(layout, settings, custom_css=None, live=False):
+    '''Yield the readable HTML of *layout* (see `render_html`)'''
+    headline = layout.headline
+
+    # Generate HTML file
+
+    taskHeight = 38
+    if settings['show_assignees']:
+        taskHeight += 8
+
+    # CSS
+    cssStyle = '''
+    body {
+        font-family: 'Roboto', sans-serif;
+        padding: 0pt;
+        margin: 0pt;
+    }
+    .headline {
+        font-size: 18pt;
+        font-weight: bold;
+        padding: 5pt;
+        margin: 0pt;
+    }
+
+    @media print
+    {    
+        .no-print, .no-print *
+        {
+            display: none !important;
+        }
+    }
+
+    .main {
+        position: relative;
+        margin: 5pt;
+        padding: 30pt 0% 20pt 0%;
+        background-color: #ddd;
+        border-radius: 2pt;
+        z-index: -20;
+    }
+
+    .weekend_mark {
+        position: absolute;
+        top: 0%;
+        margin: 0%;
+        padding: 0%;
+        background-color: #ccc;
+        height: 100%;
+        z-index: -10;
+        box-sizing: border-box;
+    }
+    .week_mark, .month_mark {
+        position: absolute;
+        top: 0%;
+        margin: 0%;
+        padding: 0%;
+        padding-left: 4pt;
+        height: 10pt;
+        border-left: 1pt #888 solid;
+        height: 100%;
+        font-size: 9pt;
+        font-weight: bold;
+        box-sizing: border-box;
+    }
+    .week_mark {
+        padding-top: 12pt;
+        border-left-color: #aaa;
+        z-index: -5;
+    }
+
+    .task {
+        margin: 0pt 0pt 2pt 0pt;
+        padding: 5pt;
+        height: ''' + str(taskHeight) + '''pt;
+        position: relative;
+        border: 1pt solid #000;
+        border-radius: 2pt;
+        box-sizing: border-box;
+    }
+
+    .task .name {
+        font-size: 9pt;
+        font-weight: bold;
+    }
+
+    .task .start {
+        position: absolute;
+        left: 5pt;
+        bottom: 0pt;
+        height: 10pt;
+        font-size: 7pt;
+    }
+    .task .end {
+        position: absolute;
+        right: 5pt;
+        bottom: 0pt;
+        height: 10pt;
+        font-size: 7pt;
+    }
+
+    .task .type {
+        font-size: 7pt;
+    }
+
+    .task .assigned {
+        font-size: 7pt;
+    }
+    .task .assigned .user {
+        font-size: 7pt;
+        display: inline;
+    }
+
+    .task .status {
+        font-size: 7pt;
+        display: inline-block;
+        border-radius: 2pt;
+        padding: 2pt;
+        position: absolute;
+        top: 0pt;
+        right: 0pt;
+        opacity: 0.9;
+        transition: all .3s;
+    }
+    .task .status:hover {
+        opacity: 1;
+    }
+
+
+    .milestone {
+        margin: 0pt 0pt 2pt 0pt;
+        padding: 5pt;
+        height: 28pt;
+        position: relative;
+        border-left: solid 2pt #f00;
+        box-sizing: border-box;
+    }
+
+    .milestone .caption {
+        font-size: 9pt;
+        font-weight: bold;
+    }
+    .milestone .end {
+        position: absolute;
+        left: 5pt;
+        bottom: 0pt;
+        height: 10pt;
+        font-size: 7pt;
+    }
+
+    
+    .milestone_bar {
+        position: absolute;
+        width: 2pt;
+        background-color: #f00;
+        top: 10pt;
+        bottom: 0pt;
+    }
+
+
+
+    .load {
+        margin: 0pt 0pt 2pt 0pt;
+        height: 24pt;
+        position: relative;
+        background-color: #eee;
+        box-sizing: border-box;
+    }
+    .load .name {
+        position: absolute;
+        left: 5pt;
+        top: 1pt;
+        font-size: 7pt;
+        font-weight: bold;
+    }
+    .load svg {
+        position: absolute;
+        left: 0pt;
+        bottom: 0pt;
+        width: 100%;
+        height: 100%;
+    }
+    .load .booked {
+        fill: #4a90d9;
+    }
+    .load .overbooked {
+        fill: #e02020;
+    }
+    .load .capacity {
+        stroke: #888;
+        stroke-dasharray: 2 2;
+        fill: none;
+    }
+
+
+
+    .scale {
+        position: fixed;
+        opacity: .2;
+        top: 0pt;
+        right: 0pt;
+        width: 100pt;
+        background-color: #fff;
+        border: 1pt #000 solid;
+        padding: 0pt;
+        transition: all .3s;
+        border-top: 0pt;
+        border-right: 0pt;
+        border-radius: 0pt 0pt 0pt 5pt;
+    }
+
+    .scale:hover {
+        opacity: 1;
+    }
+
+    .scale input {
+        width: 90pt;
+        margin-left: 5pt;
+    }
+
+
+    '''
+
+    # General beginning
+
+    fonts = '<link href="https://fonts.googleapis.com/css?family=Roboto&display=swap" rel="stylesheet">'
+    customStyle = ""
+    if settings['custom_css'] != '':
+        customStyle = '<link rel="stylesheet" href="' + settings['custom_css'] + '" />'
+
+    if settings['self_contained']:
+        # Nothing to load when opening the file: System fonts and everything inline
+        fonts = ''
+        cssStyle = minify_css(cssStyle.replace("'Roboto', sans-serif", SYSTEM_FONTS))
+        if custom_css is not None:
+            customStyle = '<style>' + minify_css(custom_css) + '</style>'
+
+    yield '''
+    <html>
+        <head>
+            <title>''' + headline + '''</title>
+            <meta charset="utf-8">
+            ''' + fonts + '''
+            <style>''' + cssStyle + '''</style>
+            ''' + customStyle + '''
+        </head>
+        <body>
+        <div class="headline">''' + headline + '''</div>
+        <div class="main" id="mainpage">
+            <div id="marks">
+    '''
+
+    # Write markers for weeks & months
+    for band in layout.bands:
+        yield band_html(band)
+
+    yield '''
+        </div>
+        '''
+
+    # Milestones first, then all tasks
+    yield '''
+        <div id="milestones">
+        '''
+    for milestone in layout.milestones:
+        yield milestone_html(milestone)
+
+    yield '''
+        </div>
+        <div id="tasks">
+        '''
+    for bar in layout.bars:
+        yield task_html(bar, settings)
+
+    yield '''
+        </div>
+        '''
+
+    if settings['show_load']:
+        # Workload of each assignee below the tasks
+        yield '''
+        <div id="load">
+        '''
+        for load in layout.loads:
+            yield load_html(load, layout.daycount, settings['load_capacity'])
+
+        yield '''
+        </div>
+        '''
+
+
+    # General ending
+
+    script = '''
+function Scale()
+{
+    document.getElementById("mainpage").style.width = document.getElementById("scaleRange").value + "px";
+    UpdateWeekMarks();
+}
+function UpdateWeekMarks()
+{
+    marks = document.getElementsByClassName("week_mark");
+    monthMarks = document.getElementsByClassName("month_mark");
+
+    if (monthMarks.length > 0 && monthMarks[0].offsetWidth < 310)
+    {
+        for (i = 0; i < marks.length; i++)
+        {
+            marks[i].style.display = "none";
+        }
+    } else
+    {
+        for (i = 0; i < marks.length; i++)
+        {
+            marks[i].style.display = "block";
+        }
+    }
+}
+
+document.getElementById("scaleRange").value = document.getElementById("mainpage").offsetWidth;
+UpdateWeekMarks();
+
+'''
+    if live:
+        script += LIVE_SCRIPT
+
+    if settings['self_contained']:
+        script = minify_js(script)
+
+    yield '''
+            </div>
+
+            <div class="no-print">
+                <div class="scale">
+                    <input type="range" min="800" max="5000" value="50" class="slider" id="scaleRange" onchange="Scale()">
+                </div>
+                <script>''' + script + '''
+                    </script>
+            </div>
+        </div>
+    </html>
+    '''
+
+
+def band_html(band):
+    '''Returns the HTML for a mark of the calendar'''
+    if (band.kind == 'weekend'):
+        return '''
+                <div class="weekend_mark" style="left: ''' + str(band.left) + '''%; width: ''' + str(band.width) + '''%;"></div>
+            '''
+
+    return '''
+                <div class="''' + band.kind + '''_mark" style="left: ''' + str(band.left) + '''%; width: ''' + str(band.width) + '''%;">
+                    <div class="caption">''' + band.caption + '''</div>
+                </div>
+            '''
+
+
+def task_html(bar, settings):
+    '''Returns the HTML for a single task bar'''
+    statusText = ""
+    assigneesText = ""
+
+    if settings['show_status']:
+        statusText = '<div class="status" style="background-color: ' + bar.status[1] + ';">' + bar.status[0] + '</div>'
+
+    if settings['show_assignees']:
+        if (len(bar.assignees) > 0):
+            assigneesText = '<div class="assigned">' + ', '.join('<div class="user">' + name + '</div>' for name in bar.assignees) + '</div>'
+        else:
+            assigneesText = '<div class="assigned">(unassigned)</div>'
+
+    # Bars without a start or an end are open to that side
+    border = ''
+    if (bar.start == None and bar.end != None):
+        border = ' border-left: 0pt;'
+    elif (bar.start != None and bar.end == None):
+        border = ' border-right: 0pt;'
+
+    dates = ''
+    if (bar.start != None):
+        dates += '''
+                <div class="start">''' + bar.start + '''</div>'''
+    if (bar.end != None):
+        dates += '''
+                <div class="end">''' + bar.end + '''</div>'''
+
+    return '''
+            <div class="task" data-row="''' + bar.id + '''" style="left: ''' + str(bar.left) + '''%; width: ''' + str(bar.width) + '''%; background-color: ''' + bar.color + '''C0;''' + border + '''">
+                <div class="name">''' + bar.name + '''</div>''' + dates + '''
+                <div class="type">''' + bar.typeName + '''</div>
+                ''' + statusText + assigneesText + '''
+            </div>
+        '''
+
+
+def milestone_html(milestone):
+    '''Returns the HTML for a single milestone'''
+    return '''
+            <div class="milestone" data-row="''' + milestone.id + '''" style="left: ''' + str(milestone.left) + '''%; width: ''' + str(milestone.width) + '''%; background-color: ''' + milestone.color + '''C0;">
+                <div class="caption">''' + milestone.name + '''</div>
+                <div class="end">''' + milestone.end + '''</div>
+            </div>
+            <div class="milestone_bar" data-row="''' + milestone.id + '''" style="left: ''' + str(milestone.left) + '''%;"></div>
+            '''
+
+
+def load_html(load, daycount, capacity):
+    '''Returns the HTML for the workload lane of one assignee
+
+    The lane is an SVG (one unit per day and task) with the booked tasks up to
+    the capacity stacked on top of the overbooked ones, so overbooked days show
+    up in red above the dashed capacity line.
+    '''
+    capacity = max(int(capacity or 1), 1)
+    height = max([capacity + 1] + [count for day, count in load.steps])
+
+    return '''
+            <div class="load">
+                <svg viewBox="0 0 ''' + str(daycount) + ' ' + str(height) + '''" preserveAspectRatio="none">
+                    <path class="overbooked" d="''' + load_path(load.steps, daycount, height, height) + '''" />
+                    <path class="booked" d="''' + load_path(load.steps, daycount, height, capacity) + '''" />
+                    <path class="capacity" d="M0 ''' + str(height - capacity) + 'H' + str(daycount) + '''" vector-effect="non-scaling-stroke" />
+                </svg>
+                <div class="name">''' + load.name + '''</div>
+            </div>
+            '''
+
+
+def load_path(steps, daycount, height, limit):
+    '''Returns the outline of *steps* (cut at *limit*) as a closed SVG path (one unit per day and task)'''
+    path = ['M0 ' + str(height)]
+    for day, count in steps:
+        path.append('H' + str(day) + 'V' + str(height - min(count, limit)))
+    path.append('H' + str(daycount) + 'V' + str(height) + 'Z')
+
+    return ''.join(path)
@@ -0,0 +1,325 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2019 c.arlt@unexpected.de
+# :license: GPL-3.0
+
+'''
+Layout model of a Gantt Chart
+
+Positions are given in percent of the chart's width, so renderers may scale
+the chart to whatever width they like. Dates are kept as they are shown.
+'''
+
+import calendar
+import datetime
+
+
+def to_datetime(date):
+    '''Return *date* (e.g. an arrow date of ftrack) as datetime, cut to minutes'''
+    return datetime.datetime(date.year, date.month, date.day, date.hour, date.minute)
+
+
+def daterange(start_date, end_date):
+    '''Yield all days from *start_date* up to (but not including) *end_date*'''
+    for n in range(int((end_date - start_date).days)):
+        yield start_date + datetime.timedelta(n)
+
+
+def load_steps(intervals):
+    '''
+    Return how many of *intervals* overlap, as a list of `(day, count)` steps
+
+    *intervals* are `(start, end)` days, the end is not included. Each step holds
+    from its day to the day of the next one. Instead of counting day by day,
+    this sweeps over the sorted starts and ends (n log n for n intervals).
+    '''
+    events = []
+    for start, end in intervals:
+        events.append((start, 1))
+        events.append((end, -1))
+    events.sort()
+
+    steps = []
+    count = 0
+    for day, change in events:
+        count += change
+        if (len(steps) > 0 and steps[-1][0] == day):
+            steps[-1] = (day, count)
+        else:
+            steps.append((day, count))
+
+        # Skip steps not changing anything (e.g. one task ends as the next starts)
+        if (len(steps) > 1 and steps[-1][1] == steps[-2][1]):
+            steps.pop()
+
+    return steps
+
+
+class Band(object):
+    '''
+    A mark of the calendar in the background
+
+    *kind* is `weekend`, `week` or `month`, weeks and months have a *caption*.
+    '''
+
+    def __init__(self, kind, left, width, caption=None):
+        self.kind = kind
+        self.left = left
+        self.width = width
+        self.caption = caption
+
+
+class Milestone(object):
+    '''A milestone at *left* (its label is *width* wide)'''
+
+    def __init__(self, id, name, color, left, width, end):
+        self.id = id
+        self.name = name
+        self.color = color
+        self.left = left
+        self.width = width
+        self.end = end
+
+
+class Bar(object):
+    '''
+    The bar of a task
+
+    *start* and *end* are the shown dates, either may be None if the task
+    does not have it (the bar is open to that side then). *status* is a tuple
+    of name and color and *assignees* a list of names, if they are shown.
+    '''
+
+    def __init__(self, id, name, typeName, color, left, width, start, end, status=None, assignees=None):
+        self.id = id
+        self.name = name
+        self.typeName = typeName
+        self.color = color
+        self.left = left
+        self.width = width
+        self.start = start
+        self.end = end
+        self.status = status
+        self.assignees = assignees
+
+
+class LoadLane(object):
+    '''The workload of one assignee as `load_steps`'''
+
+    def __init__(self, name, steps):
+        self.name = name
+        self.steps = steps
+
+
+class Layout(object):
+    '''
+    Everything a renderer draws: calendar bands, milestones, bars (rows in this
+    order) and load lanes
+
+    The chart starts at midnight of *minDate*, so bars and load lanes count
+    the same days (see `day`).
+    '''
+
+    def __init__(self, headline, minDate, maxDate):
+        self.headline = headline
+        self.minDate = datetime.datetime(minDate.year, minDate.month, minDate.day)
+        self.maxDate = maxDate
+        self.daycount = max((maxDate - self.minDate).days, 1)
+
+        self.bands = []
+        self.milestones = []
+        self.bars = []
+        self.loads = []
+
+    def day(self, date):
+        '''Returns the day of *date* in the chart (0 for its first day)'''
+        return (to_datetime(date) - self.minDate).days
+
+    def position(self, date):
+        '''Returns the position of *date* in percent'''
+        return (self.day(date) / float(self.daycount)) * 100.0
+
+    def addBands(self):
+        '''Adds the marks for weekends, weeks and months'''
+        for single_date in daterange(self.minDate, self.maxDate):
+            tLeft = ((single_date - self.minDate).days / float(self.daycount)) * 100.0
+
+            # mark weekends
+            if (single_date.weekday() == 5):
+                self.bands.append(Band('weekend', tLeft, (2.0 / float(self.daycount)) * 100.0))
+
+            # mark each week beginning
+            if (single_date.weekday() == 0):
+                self.bands.append(Band('week', tLeft, (7.0 / float(self.daycount)) * 100.0, single_date.strftime("%m/%d")))
+
+            # mark first day of month
+            if (single_date.day == 1):
+                tLength = (calendar.monthrange(single_date.year, single_date.month)[1] / float(self.daycount)) * 100.0
+                self.bands.append(Band('month', tLeft, tLength, single_date.strftime("%b %Y")))
+
+    def milestone(self, task):
+        '''Returns the `Milestone` for a milestone entity (which needs an end date)'''
+        tLeft = self.position(task['end_date'])
+        tLength = 15
+
+        if (tLeft + tLength > 100):
+            tLength = 100 - tLeft
+
+        return Milestone(task['id'], task['name'], task['type']['color'], tLeft, tLength, task['end_date'].strftime("%Y/%m/%d"))
+
+    def bar(self, task, status=False, assignees=False):
+        '''Returns the `Bar` for a task entity
+
+        The status and the assignees are only fetched if *status* or *assignees* is True.
+        '''
+        start = None
+        end = None
+
+        if (task['start_date'] != None and task['end_date'] != None):
+            # Task with defined dates: Calculate ranges
+            tLeft = self.position(task['start_date'])
+            tLength = ((to_datetime(task['end_date']) - to_datetime(task['start_date'])).days / float(self.daycount)) * 100.0
+            start = task['start_date'].strftime("%Y/%m/%d")
+            end = task['end_date'].strftime("%Y/%m/%d")
+
+        elif (task['end_date'] != None):
+            # Task with an end date, but no start date
+            tLeft = self.position(task['end_date'])
+            tLength = 15
+
+            if (tLeft - tLength < 0):
+                tLength = tLeft
+                tLeft = 0
+            else:
+                tLeft = tLeft - tLength
+            end = task['end_date'].strftime("%Y/%m/%d")
+
+        elif (task['start_date'] != None):
+            # Task with an start date, but no end date
+            tLeft = self.position(task['start_date'])
+            tLength = 15
+
+            if (tLeft + tLength > 100):
+                tLength = 100 - tLeft
+            start = task['start_date'].strftime("%Y/%m/%d")
+
+        else:
+            tLeft = 0
+            tLength = 100
+
+        bar = Bar(task['id'], task['name'], task['type']['name'], task['type']['color'], tLeft, tLength, start, end)
+
+        if status:
+            bar.status = (task['status']['name'], task['status']['color'])
+
+        if assignees:
+            bar.assignees = assigned_users(task)
+
+        return bar
+
+    def fits(self, entity):
+        '''Returns if the dates of *entity* are within the chart (so no other row moves)'''
+        for attribute in ('start_date', 'end_date'):
+            if (entity[attribute] != None and not (self.minDate <= to_datetime(entity[attribute]) <= self.maxDate)):
+                return False
+
+        return True
+
+    def replace(self, row):
+        '''Replaces the `Bar` or `Milestone` with the id of *row* (or adds it at the end)'''
+        rows = self.milestones if isinstance(row, Milestone) else self.bars
+
+        for index, existing in enumerate(rows):
+            if (existing.id == row.id):
+                rows[index] = row
+                return
+
+        rows.append(row)
+
+    def remove(self, id):
+        '''Removes the row with *id* and returns if there was one'''
+        for rows in (self.milestones, self.bars):
+            for index, existing in enumerate(rows):
+                if (existing.id == id):
+                    del rows[index]
+                    return True
+
+        return False
+
+    def addLoads(self, tasks):
+        '''Adds a `LoadLane` per assigned user of *tasks* (sorted by name)
+
+        Only tasks with a start and an end date count.
+        '''
+        intervals = {}
+        names = {}
+
+        for task in tasks:
+            if (task['start_date'] == None or task['end_date'] == None):
+                continue
+
+            start = self.day(task['start_date'])
+            end = max(self.day(task['end_date']), start + 1)
+
+            for assignment in task['assignments']:
+                resource = assignment['resource']
+                if (type(resource).__name__ == 'User'):
+                    names[resource['id']] = resource['first_name'] + " " + resource['last_name']
+                    intervals.setdefault(resource['id'], []).append((start, end))
+
+        self.loads = sorted(
+            (LoadLane(names[userId], load_steps(userIntervals)) for userId, userIntervals in intervals.items()),
+            key=lambda load: load.name
+        )
+
+
+def assigned_users(task):
+    '''Returns the names of all users assigned to *task*'''
+    return [
+        assignment['resource']['first_name'] + " " + assignment['resource']['last_name']
+        for assignment in task['assignments']
+        if type(assignment['resource']).__name__ == 'User'
+    ]
+
+
+def build_layout(entities, headline, status=False, assignees=False, load=False, progress=None):
+    '''
+    Return the `Layout` of *entities* (tasks and milestones, sorted by their start)
+
+    *status*, *assignees* and *load* tell what is shown, so nothing else is
+    fetched. *progress* is an optional `JobProgress`.
+    '''
+    # Get min and max dates
+    minDate = datetime.datetime(3000, 1, 1)
+    maxDate = datetime.datetime(2000, 1, 1)
+    for task in entities:
+        if (task['start_date'] != None):
+            tStartDate = to_datetime(task['start_date'])
+            if (tStartDate < minDate):
+                minDate = tStartDate
+        if (task['end_date'] != None):
+            tEndDate = to_datetime(task['end_date'])
+            if (tEndDate > maxDate):
+                maxDate = tEndDate
+
+    layout = Layout(headline, minDate, maxDate)
+    layout.addBands()
+
+    tasks = []
+    for index, task in enumerate(entities):
+        kind = type(task).__name__
+
+        if (kind == "Milestone" and task['end_date'] != None):
+            # Handling milestones (but only if they have a date)
+            layout.milestones.append(layout.milestone(task))
+
+        elif (kind == "Task"):
+            layout.bars.append(layout.bar(task, status, assignees))
+            tasks.append(task)
+
+        if progress is not None:
+            progress.step('Laying out', index + 1, len(entities))
+
+    if load:
+        layout.addLoads(tasks)
+
+    return layout
@@ -0,0 +1,282 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2019 c.arlt@unexpected.de
+# :license: GPL-3.0
+
+'''
+Live view of a Gantt Chart
+
+A small local server shows the chart and listens to `ftrack.update` events.
+Changed tasks and milestones are fetched again (all changes of a second in a
+single query) and only their rows of the layout are replaced. Connected
+browsers get the changed rows through Server-Sent Events.
+
+Rows keep their place when their dates change. Only if a date leaves the
+chart's time span (which moves all other rows), the layout is built again
+and the browsers reload the page.
+'''
+
+import json
+import logging
+import threading
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    import Queue as queue
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    import queue
+
+from unex_gantt.layout import build_layout
+from unex_gantt.html import render_html, task_html, milestone_html, load_html
+
+
+#: Seconds between two keep-alive messages to the browsers
+KEEP_ALIVE = 15
+
+
+class LiveChart(object):
+    '''
+    The layout of a chart, kept up to date by ftrack events
+
+    *chart* is a `GanttChart`, its session needs a connected event hub.
+    Events are collected by `handleUpdate` and applied by `flush`, both
+    are meant to be called from the thread waiting for events.
+    '''
+
+    def __init__(self, chart, logger=None):
+        self.chart = chart
+        self.session = chart.session
+        self.settings = chart.settings
+        self.logger = logger or logging.getLogger(__name__)
+
+        self.lock = threading.Lock()
+        self.clients = []
+        self.pending = set()
+
+        self.build()
+
+    def build(self):
+        '''Fetches everything and builds the layout from scratch'''
+        realEntities, headline = self.chart.collect()
+
+        layout = build_layout(
+            realEntities,
+            headline,
+            status=self.settings['show_status'],
+            assignees=self.settings['show_assignees'],
+            load=self.settings['show_load']
+        )
+
+        with self.lock:
+            self.layout = layout
+            self.entities = dict((entity['id'], entity) for entity in realEntities)
+
+    def page(self):
+        '''Returns the HTML of the whole chart'''
+        with self.lock:
+            return u''.join(render_html(self.layout, self.settings, live=True))
+
+    def subscribe(self):
+        '''Returns a queue receiving all changes as `(event, data)`'''
+        client = queue.Queue()
+        with self.lock:
+            self.clients.append(client)
+
+        return client
+
+    def unsubscribe(self, client):
+        with self.lock:
+            self.clients.remove(client)
+
+    def broadcast(self, event, data):
+        '''Sends *event* with *data* to all browsers (call with the lock held)'''
+        message = json.dumps(data)
+        for client in self.clients:
+            client.put((event, message))
+
+    def isRelevant(self, entity):
+        '''Returns if a changed *entity* of an event may be shown in the chart'''
+        if (entity.get('entityId') in self.entities):
+            return True
+
+        selected = set(selected[1] for selected in self.chart.entities)
+        return any(parent.get('entityId') in selected for parent in entity.get('parents') or [])
+
+    def handleUpdate(self, event):
+        '''Collects the tasks and milestones changed by an `ftrack.update` event'''
+        for entity in event['data'].get('entities', []):
+            if (entity.get('entityType') == 'task' and self.isRelevant(entity)):
+                self.pending.add(entity['entityId'])
+
+            elif (entity.get('entityType') == 'appointment'):
+                # Changed assignments change the task they belong to
+                context = (entity.get('changes') or {}).get('context_id') or {}
+                for taskId in (context.get('new'), context.get('old')):
+                    if taskId in self.entities:
+                        self.pending.add(taskId)
+
+    def flush(self):
+        '''Applies all collected changes and sends them to the browsers'''
+        if (len(self.pending) == 0):
+            return
+
+        ids = self.pending
+        self.pending = set()
+
+        try:
+            self.patch(ids)
+        except Exception:
+            self.logger.exception('Updating the live chart failed, building it again')
+            self.session.rollback()
+            self.reload()
+
+    def fetch(self, ids):
+        '''Returns the tasks and milestones with *ids* which match the chart's filters
+
+        They are fetched with everything an export fetches (see `GanttChart.projection`),
+        as the session only refreshes the attributes a query selects. Otherwise a
+        patched row would show the status and the assignees it had before.
+        '''
+        idString = ', '.join('"{0}"'.format(id) for id in ids)
+        select = ', '.join(['id'] + self.chart.projection())
+        found = {}
+
+        for entityType, tasks in (('Task', True), ('Milestone', False)):
+            conditions = ''.join(' and ({0})'.format(condition) for condition in self.chart.filterConditions(tasks))
+            for entity in self.session.query(
+                u'select {0} from {1} where id in ({2}){3}'.format(select, entityType, idString, conditions)
+            ):
+                found[entity['id']] = entity
+
+        if (self.settings['show_assignees'] or self.settings['show_load']):
+            self.chart.loadAssignees(list(found.values()))
+
+        return found
+
+    def patch(self, ids):
+        '''Replaces the rows of *ids* in the layout'''
+        found = self.fetch(ids)
+        layout = self.layout
+
+        # Dates outside of the chart move all rows
+        for entity in found.values():
+            if not layout.fits(entity):
+                return self.reload()
+
+        # Build the rows before taking the lock
+        rows = {}
+        for id, entity in found.items():
+            if (type(entity).__name__ == 'Milestone'):
+                if (entity['end_date'] != None):
+                    rows[id] = ('milestones', layout.milestone(entity))
+            else:
+                rows[id] = ('tasks', layout.bar(entity, self.settings['show_status'], self.settings['show_assignees']))
+
+        with self.lock:
+            for id in ids:
+                if id in rows:
+                    container, row = rows[id]
+                    self.entities[id] = found[id]
+                    layout.replace(row)
+
+                    html = milestone_html(row) if container == 'milestones' else task_html(row, self.settings)
+                    self.broadcast('row', {'container': container, 'id': id, 'html': html})
+
+                elif (layout.remove(id) or id in self.entities):
+                    self.entities.pop(id, None)
+                    self.broadcast('row', {'container': 'tasks', 'id': id, 'html': ''})
+
+        if self.settings['show_load']:
+            tasks = [entity for entity in self.entities.values() if type(entity).__name__ == 'Task']
+            layout.addLoads(tasks)
+
+            with self.lock:
+                self.broadcast('load', {'html': u''.join(
+                    load_html(load, layout.daycount, self.settings['load_capacity']) for load in layout.loads
+                )})
+
+        self.logger.info(u'Updated {0} row(s) of the live chart'.format(len(ids)))
+
+    def reload(self):
+        '''Builds the layout again and lets all browsers reload the page'''
+        self.build()
+
+        with self.lock:
+            self.broadcast('reload', {})
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def handler(live):
+    '''Returns the request handler serving *live* (a `LiveChart`)'''
+
+    class LiveHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if (self.path.split('?')[0] == '/events'):
+                return self.events()
+
+            page = live.page().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(page)))
+            self.end_headers()
+            self.wfile.write(page)
+
+        def events(self):
+            '''Streams all changes as Server-Sent Events until the browser leaves'''
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+
+            client = live.subscribe()
+            try:
+                while True:
+                    try:
+                        event, data = client.get(timeout=KEEP_ALIVE)
+                        message = u'event: {0}\ndata: {1}\n\n'.format(event, data)
+                    except queue.Empty:
+                        message = u': keep-alive\n\n'
+
+                    self.wfile.write(message.encode('utf-8'))
+                    self.wfile.flush()
+            except (IOError, OSError):
+                pass
+            finally:
+                live.unsubscribe(client)
+
+        def log_message(self, format, *args):
+            live.logger.debug(format % args)
+
+    return LiveHandler
+
+
+def serve(chart, port=8765, host='localhost', logger=None):
+    '''
+    Serves the live view of *chart* (a `GanttChart`) on *host*:*port* until interrupted
+
+    The chart's session needs a connected event hub.
+    '''
+    live = LiveChart(chart, logger)
+
+    server = ThreadingHTTPServer((host, port), handler(live))
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    session = chart.session
+    session.event_hub.subscribe('topic=ftrack.update', live.handleUpdate)
+    live.logger.info(u'Live Gantt Chart on http://{0}:{1}/ (Ctrl-C to stop)'.format(host, port))
+
+    try:
+        while True:
+            # Events are handled while waiting, then all of them are applied at once
+            session.event_hub.wait(1)
+            live.flush()
+    finally:
+        server.shutdown()
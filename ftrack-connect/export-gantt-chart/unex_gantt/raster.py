@@ -0,0 +1,37 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2019 c.arlt@unexpected.de
+# :license: GPL-3.0
+
+'''
+PDF and PNG renderers of a Gantt Chart
+
+Both convert the SVG (see `unex_gantt.svg`) locally with cairosvg, which is
+only needed for these formats and therefore only imported here.
+'''
+
+from unex_gantt.svg import render_svg
+
+
+def cairosvg():
+    '''Returns the cairosvg module or raises an `ImportError` telling how to get it'''
+    try:
+        import cairosvg
+    except ImportError:
+        raise ImportError('PDF and PNG exports need cairosvg (pip install cairosvg)')
+
+    return cairosvg
+
+
+def svg_bytes(layout, settings):
+    '''Returns the whole SVG of *layout* encoded as utf-8'''
+    return u''.join(render_svg(layout, settings)).encode('utf-8')
+
+
+def render_pdf(layout, settings, custom_css=None):
+    '''Yield the PDF of *layout* (in one chunk, see `svg.render_svg`)'''
+    yield cairosvg().svg2pdf(bytestring=svg_bytes(layout, settings))
+
+
+def render_png(layout, settings, custom_css=None):
+    '''Yield the PNG of *layout* (in one chunk, see `svg.render_svg`)'''
+    yield cairosvg().svg2png(bytestring=svg_bytes(layout, settings))
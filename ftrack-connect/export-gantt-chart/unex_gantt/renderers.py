@@ -0,0 +1,23 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2019 c.arlt@unexpected.de
+# :license: GPL-3.0
+
+'''
+All formats of the Gantt Chart export
+
+Each renderer is called with the `Layout`, the export settings and the
+content of the custom CSS (or None) and yields the chunks of the file.
+'''
+
+from unex_gantt.html import render_html
+from unex_gantt.svg import render_svg
+from unex_gantt.raster import render_pdf, render_png
+
+
+#: Renderer and file extension of each format
+FORMATS = {
+    'html': (render_html, '.html'),
+    'svg': (render_svg, '.svg'),
+    'pdf': (render_pdf, '.pdf'),
+    'png': (render_png, '.png')
+}
@@ -0,0 +1,181 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2019 c.arlt@unexpected.de
+# :license: GPL-3.0
+
+'''
+SVG renderer of a Gantt Chart
+
+Unlike the HTML page, the SVG has a fixed size, so it prints the same
+everywhere. It is also the source of the PDF and PNG exports.
+'''
+
+from xml.sax.saxutils import escape, quoteattr
+
+from unex_runtime.minify import SYSTEM_FONTS
+
+from unex_gantt.html import load_path
+
+
+#: Width of the chart in pixels
+WIDTH = 1600
+
+#: Height of the headline and of the calendar captions above the rows
+HEADLINE_HEIGHT = 36
+CALENDAR_HEIGHT = 30
+
+#: Heights of the rows (including a small gap)
+MILESTONE_HEIGHT = 38
+TASK_HEIGHT = 52
+ASSIGNEES_HEIGHT = 11
+LOAD_HEIGHT = 34
+
+STYLE = '''
+text { font-family: %s; font-size: 9px; }
+.headline { font-size: 22px; font-weight: bold; }
+.caption { font-size: 11px; font-weight: bold; }
+.name { font-size: 12px; font-weight: bold; }
+.main { fill: #ddd; }
+.weekend_mark { fill: #ccc; }
+.week_mark { stroke: #aaa; }
+.month_mark { stroke: #888; }
+.task { stroke: #000; fill-opacity: 0.75; }
+.milestone { fill-opacity: 0.75; }
+.milestone_bar { fill: #f00; }
+.load { fill: #eee; }
+.booked { fill: #4a90d9; }
+.overbooked { fill: #e02020; }
+.capacity { stroke: #888; stroke-dasharray: 2 2; fill: none; }
+''' % SYSTEM_FONTS
+
+
+def x(percent):
+    '''Returns the horizontal pixel of a position in percent'''
+    return round(percent * WIDTH / 100.0, 2)
+
+
+def chart_height(layout, settings):
+    '''Returns the height of the whole chart in pixels'''
+    taskHeight = TASK_HEIGHT + (ASSIGNEES_HEIGHT if settings['show_assignees'] else 0)
+    loadCount = len(layout.loads) if settings['show_load'] else 0
+
+    return (HEADLINE_HEIGHT + CALENDAR_HEIGHT + len(layout.milestones) * MILESTONE_HEIGHT +
+            len(layout.bars) * taskHeight + loadCount * LOAD_HEIGHT + 10)
+
+
+def render_svg(layout, settings, custom_css=None):
+    '''
+    Yield the SVG of *layout* chunk by chunk
+
+    *settings* are the export settings (see `GanttChart.defaultSettings`).
+    *custom_css* is ignored, as it is written for the HTML page.
+    '''
+    height = chart_height(layout, settings)
+    top = HEADLINE_HEIGHT
+    bottom = height - 5
+
+    yield (
+        u'<?xml version="1.0" encoding="utf-8"?>\n'
+        u'<svg xmlns="http://www.w3.org/2000/svg" width="{0}" height="{1}" viewBox="0 0 {0} {1}">'
+        u'<style>{2}</style>'
+        u'<rect width="100%" height="100%" fill="#fff"/>'
+        u'<text class="headline" x="5" y="26">{3}</text>'
+        u'<rect class="main" x="0" y="{4}" width="{0}" height="{5}" rx="3"/>'
+    ).format(WIDTH, height, STYLE, escape(layout.headline), top, bottom - top)
+
+    # Calendar in the background
+    for band in layout.bands:
+        if (band.kind == 'weekend'):
+            yield u'<rect class="weekend_mark" x="{0}" y="{1}" width="{2}" height="{3}"/>'.format(
+                x(band.left), top, x(band.width), bottom - top
+            )
+        else:
+            captionY = top + (12 if band.kind == 'month' else 24)
+            yield (
+                u'<line class="{0}_mark" x1="{1}" y1="{2}" x2="{1}" y2="{3}"/>'
+                u'<text class="caption" x="{4}" y="{5}">{6}</text>'
+            ).format(band.kind, x(band.left), top, bottom, x(band.left) + 4, captionY, escape(band.caption))
+
+    y = top + CALENDAR_HEIGHT
+
+    # Milestones first, then all tasks
+    for milestone in layout.milestones:
+        yield (
+            u'<rect class="milestone_bar" x="{0}" y="{1}" width="2" height="{2}"/>'
+            u'<svg x="{0}" y="{1}" width="{3}" height="{4}">'
+            u'<rect class="milestone" width="100%" height="100%" fill={5}/>'
+            u'<text class="name" x="6" y="14">{6}</text>'
+            u'<text x="6" y="{7}">{8}</text>'
+            u'</svg>'
+        ).format(
+            x(milestone.left), y, bottom - y, x(milestone.width), MILESTONE_HEIGHT - 4,
+            quoteattr(milestone.color), escape(milestone.name), MILESTONE_HEIGHT - 8, escape(milestone.end)
+        )
+        y += MILESTONE_HEIGHT
+
+    taskHeight = TASK_HEIGHT + (ASSIGNEES_HEIGHT if settings['show_assignees'] else 0)
+    for bar in layout.bars:
+        yield bar_svg(bar, y, taskHeight - 4, settings)
+        y += taskHeight
+
+    if settings['show_load']:
+        for load in layout.loads:
+            yield load_svg(load, y, LOAD_HEIGHT - 4, layout.daycount, settings['load_capacity'])
+            y += LOAD_HEIGHT
+
+    yield u'</svg>'
+
+
+def bar_svg(bar, y, height, settings):
+    '''Returns the SVG of a single task bar (its texts are clipped to the bar)'''
+    width = x(bar.width)
+    parts = [
+        u'<svg x="{0}" y="{1}" width="{2}" height="{3}">'.format(x(bar.left), y, width, height),
+        u'<rect class="task" x="0.5" y="0.5" width="{0}" height="{1}" rx="2" fill={2}/>'.format(
+            max(width - 1, 0), height - 1, quoteattr(bar.color)
+        ),
+        u'<text class="name" x="6" y="15">{0}</text>'.format(escape(bar.name)),
+        u'<text x="6" y="27">{0}</text>'.format(escape(bar.typeName))
+    ]
+
+    if (settings['show_assignees'] and bar.assignees is not None):
+        parts.append(u'<text x="6" y="38">{0}</text>'.format(
+            escape(', '.join(bar.assignees) if len(bar.assignees) > 0 else '(unassigned)')
+        ))
+
+    if (bar.start != None):
+        parts.append(u'<text x="6" y="{0}">{1}</text>'.format(height - 4, escape(bar.start)))
+    if (bar.end != None):
+        parts.append(u'<text x="{0}" y="{1}" text-anchor="end">{2}</text>'.format(width - 6, height - 4, escape(bar.end)))
+
+    if (settings['show_status'] and bar.status is not None):
+        parts.append(
+            u'<rect x="{0}" y="0" width="70" height="13" rx="2" fill={1}/>'
+            u'<text x="{2}" y="10" text-anchor="end">{3}</text>'.format(
+                width - 70, quoteattr(bar.status[1]), width - 4, escape(bar.status[0])
+            )
+        )
+
+    parts.append(u'</svg>')
+
+    return ''.join(parts)
+
+
+def load_svg(load, y, height, daycount, capacity):
+    '''Returns the SVG of the workload lane of one assignee (see `html.load_html`)'''
+    capacity = max(int(capacity or 1), 1)
+    units = max([capacity + 1] + [count for day, count in load.steps])
+
+    return (
+        u'<rect class="load" x="0" y="{0}" width="{1}" height="{2}"/>'
+        u'<svg x="0" y="{0}" width="{1}" height="{2}" viewBox="0 0 {3} {4}" preserveAspectRatio="none">'
+        u'<path class="overbooked" d="{5}"/>'
+        u'<path class="booked" d="{6}"/>'
+        u'<path class="capacity" d="M0 {7}H{3}" vector-effect="non-scaling-stroke"/>'
+        u'</svg>'
+        u'<text class="name" x="5" y="{8}">{9}</text>'
+    ).format(
+        y, WIDTH, height, daycount, units,
+        load_path(load.steps, daycount, units, units),
+        load_path(load.steps, daycount, units, capacity),
+        units - capacity, y + 12, escape(load.name)
+    )
@@ -3,51 +3,138 @@
 # :license: GPL-3.0
 
 import logging
-import threading
 import sys
-import argparse
 import json
-import tempfile
 import os
-import datetime
+import hashlib
+import csv
+import io
+
+# The shared runtime is deployed next to the actions (ftrack-connect/action-runtime)
+RUNTIME_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'action-runtime'))
+if RUNTIME_PATH not in sys.path:
+    sys.path.append(RUNTIME_PATH)
+
+from unex_runtime.export import Exporter, FileSink, start_job, fail_job
+from unex_runtime.progress import JobProgress
+from unex_runtime.cancel import CancelToken, ExportCancelled, end_cancelled_job
+from unex_runtime.metrics import Metrics, phase, timed
+from unex_runtime.guard import QueryGuard
+# Shared utility methods (get_filter_string, run_async) and the base of
+# all actions, which does discovery, registration and more
+from unex_runtime.action import (
+    UnexAction, JOB_SESSIONS, get_filter_string, run_async, register_actions, listen
+)
+from unex_runtime.lazy import lazy_import
+
+# Only needed once the action is launched, so these do not slow down ftrack-connect's start
+requests = lazy_import('requests')
+uuid = lazy_import('uuid')
+
+
+class TodoistSync(object):
+    '''
+    Minimal client for Todoist's batched sync-command protocol
+
+    Commands are collected and sent with as few requests as possible. The
+    *url* may point to a local stand-in (see utilities/todoist_mock_server.py)
+    for testing.
+    '''
+
+    #: Todoist does not accept more than 100 commands per request
+    batchSize = 100
 
-import ftrack_api
+    def __init__(self, token, url):
+        self.token = token
+        self.url = url
 
-from ftrack_action_handler.action import BaseAction
+    def send(self, commands):
+        '''Send *commands* and return the `(sync_status, temp_id_mapping)` of the response'''
+        response = requests.post(
+            self.url,
+            headers={'Authorization': 'Bearer {0}'.format(self.token)},
+            data={'commands': json.dumps(commands)},
+            timeout=60
+        )
+        response.raise_for_status()
+        result = response.json()
 
+        return result.get('sync_status', {}), result.get('temp_id_mapping', {})
 
-##############################################################################
-#                                                                            #
-#           Custom utility methods (might not need to be changed)            #
-#                                                                            #
-##############################################################################
 
-def getRealEntityFromTypedContext(session, entity):
+class TodoistIdStore(object):
     '''
-    This one will return you a real entity behind a TypedContext-entity
-    
+    Local mapping of ftrack ids to Todoist ids
+
+    For each synced entity, the Todoist id and a checksum of the synced values
+    are stored, so that a re-run only sends tasks that changed. The mapping is
+    kept per Todoist token.
+    '''
+
+    def __init__(self, path, token):
+        self.path = path
+        self.account = hashlib.sha1(token.encode('utf-8')).hexdigest()[:12]
+        self.data = {}
+
+        if (os.path.isfile(self.path)):
+            with open(self.path) as f:
+                self.data = json.load(f)
+
+        self.items = self.data.setdefault(self.account, {})
+
+    def get(self, ftrackId):
+        '''Returns the stored `{'id', 'hash', 'parent'}` for *ftrackId* or None'''
+        return self.items.get(ftrackId)
+
+    def set(self, ftrackId, todoistId, checksum, parent):
+        self.items[ftrackId] = {'id': todoistId, 'hash': checksum, 'parent': parent}
+
+    def save(self):
+        if not os.path.isdir(os.path.dirname(self.path)):
+            os.makedirs(os.path.dirname(self.path))
+
+        with open(self.path, 'w') as f:
+            json.dump(self.data, f)
+
+
+def iterQueryPages(session, expression, pageSize=500, progress=None, cancel=None, fetched=0):
+    '''
+    Yield the results of *expression* page by page
+
     *session* is a `ftrack_api.Session` instance
 
-    *entity* should be a tuple containing the entity type of `TypedContext`
-    and (more important) the entity id.
+    *expression* is a query expression without offset and limit. Make sure
+    its order is unique (e.g. ends with the id), otherwise rows with the same
+    values might show up on two pages or on none.
+
+    *pageSize* is the amount of entities fetched with one round-trip
+
+    *progress* is an optional `JobProgress` which gets the amount of
+    fetched entities, including the *fetched* ones of earlier queries
+
+    *cancel* is an optional `CancelToken` which is checked before each page
     '''
-    return session.get(entity[0], entity[1])
-
-def async(fn):
-    '''Run *fn* asynchronously.'''
-    def wrapper(*args, **kwargs):
-        thread = threading.Thread(target=fn, args=args, kwargs=kwargs)
-        thread.start()
-    return wrapper
-
-def get_filter_string(entity_ids):
-    '''Return a comma separated string of quoted ids from *entity_ids* list.'''
-    return ', '.join(
-        '"{0}"'.format(entity_id) for entity_id in entity_ids
-    )
+    offset = 0
+    while True:
+        if cancel is not None:
+            cancel.check()
+
+        page = session.query(
+            u'{0} offset {1} limit {2}'.format(expression, offset, pageSize)
+        ).all()
 
-class unexExportToTodoist(BaseAction):
-    '''This is the action for creating a Gantt Chart'''
+        if page:
+            if progress is not None:
+                progress.update('Fetching tasks', count=fetched + offset + len(page))
+            yield page
+
+        if len(page) < pageSize:
+            break
+
+        offset += pageSize
+
+class unexExportToTodoist(UnexAction):
+    '''This is the action for exporting tasks to Todoist (as a csv to import or synced directly)'''
     
     ##############################################################################
     #                                                                            #
@@ -69,10 +156,29 @@ class unexExportToTodoist(BaseAction):
     icon = 'https://mediathek.unexpected.de/img/ftrack/todoist_export.png'
 
     #: The types of entities you like to support here
+    #: (projects, sequences, shots and so on will be expanded to their tasks)
     SUPPORTED_ENTITY_TYPES = (
-        'Task', 'TypedContext'
+        'Project', 'Task', 'TypedContext'
     )
 
+    #: Amount of tasks fetched with one query
+    pageSize = 500
+
+    #: Contexts whose tasks are fetched together (and held in memory at once)
+    contextChunkSize = 100
+
+    #: Deepest indent Todoist supports for sub-tasks
+    maxIndent = 4
+
+    #: Todoist API token used for syncing (csv export works without it)
+    todoistToken = os.environ.get('TODOIST_API_TOKEN', '')
+
+    #: Todoist sync endpoint; point this to a local stand-in for testing
+    todoistSyncUrl = os.environ.get('TODOIST_SYNC_URL', 'https://api.todoist.com/api/v1/sync')
+
+    #: Where to remember which ftrack task belongs to which Todoist task
+    syncStorePath = os.path.join(os.path.expanduser('~'), '.ftrack', 'todoist_sync.json')
+
     def discover(self, session, entities, event):
         '''Checks the selected entities and/or events and sessions.
         Return True, if you like to show the interaction icon and False, if you do not like the selection
@@ -103,6 +209,50 @@ class unexExportToTodoist(BaseAction):
             return False
 
 
+    def interface(self, session, entities, event):
+        '''The user interface for our action
+
+        *session* is a `ftrack_api.Session` instance
+
+        *entities* is a list of tuples each containing the entity type and the entity id.
+        If the entity is a hierarchical you will always get the entity
+        type TypedContext, once retrieved through a get operation you
+        will have the "real" entity type ie. example Shot, Sequence
+        or Asset Build.
+
+        *event* the unmodified original event
+        '''
+        values = event['data'].get('values', {})
+
+        if not values:
+            return [
+                {
+                    'type': 'label',
+                    'value': 'Exporting tasks of {0} selected entities for Todoist'.format(len(entities))
+                },
+                {
+                    'label': 'Export mode',
+                    'type': 'enumerator',
+                    'name': 'mode',
+                    'value': 'csv',
+                    'data': [
+                        {'label': 'csv file for importing', 'value': 'csv'},
+                        {'label': 'Sync directly to Todoist', 'value': 'sync'}
+                    ]
+                },
+                {
+                    'type': 'label',
+                    'value': '___'
+                },
+                {
+                    'label': 'Todoist project id (sync only, leave empty for Inbox):',
+                    'type': 'text',
+                    'name': 'todoist_project',
+                    'value': ''
+                }
+            ]
+
+
     def launch(self, session, entities, event):
         '''Callback method for the custom action.
 
@@ -122,21 +272,27 @@ class unexExportToTodoist(BaseAction):
         *event* the unmodified original event
 
         '''
+        if 'values' in event['data']:
+            self.logger.info(
+                u'Launching action with selection {0}'.format(entities)
+            )
 
-        self.logger.info(
-            u'Launching action with selection {0}'.format(entities)
-        )
+            data = event['data']
+            logging.info(u'Launching action with data: {0}'.format(data))
 
-        data = event['data']
-        logging.info(u'Launching action with data: {0}'.format(data))
+            if (data['values'].get('mode') == 'sync' and not self.todoistToken):
+                return {
+                    'success': False,
+                    'message': 'Syncing needs a Todoist API token in TODOIST_API_TOKEN'
+                }
 
-        # Run exporter
-        self.mainAsyncAction(entities, event['source']['user']['id'])
+            # Run exporter
+            self.mainAsyncAction(entities, event['source']['user']['id'], data['values'])
 
-        return {
-            'success': True,
-            'message': 'Export started...'
-        }
+            return {
+                'success': True,
+                'message': 'Export started...'
+            }
 
 
     ##############################################################################
@@ -145,222 +301,398 @@ class unexExportToTodoist(BaseAction):
     #                                                                            #
     ##############################################################################
 
-    def sortValue (self, element):
-        '''Sort by custom key - in this case `end_date`'''
-        return element['end_date']
-
-
-    @async
-    def mainAsyncAction(self, entities, user_id=None):
-        '''
-        The main action this one is doing inside a job
-        '''
-        
-        # Setup a session for the running job
-        session = ftrack_api.Session(
-            auto_connect_event_hub=False
-        )
-        job = session.create('Job', {
-            'user_id': user_id,
-            'status': 'running',
-            'data': json.dumps({
-                'description': 'Exporting csv for Todoist...'
-            })
-        })
-        session.commit()
-
-        try:
-            # Collect all the single elements in their correct format
-            realEntities = []
-
-            for entity in entities:
-                oneObject = getRealEntityFromTypedContext(session, entity)
-                realEntities.append(oneObject)
-
-            # TODO: What about hierarchy?
-
-
-            # Sort the entities by end date
-            sortedEntities = sorted(realEntities, key=self.sortValue)
-
-            # Generate table
-            printString = "TYPE,CONTENT,PRIORITY,INDENT,AUTHOR,RESPONSIBLE,DATE,DATE_LANG,TIMEZONE\n"
-            for entity in sortedEntities:
-
-                datestr = ""
-                descriptionstr = ""
-
-                # Get correct date
-                if ('end_date' in entity and entity['end_date'] != None):
-                    # Create string
-                    datestr = entity['end_date'].format('MMM DD YYYY')
-                # Get description as comment
-                if ('description' in entity and bool(entity['description'].strip())):
-                    descriptionstr = "note,\"{0}\",,,,,,,\n".format(entity['description'].encode('ascii','ignore').replace("\"", "\\\""))
-                
-                printString += "task,{0},4,1,,,{1},en,\n{2},,,,,,,,\n".format(entity['name'], datestr, descriptionstr)
+    def scopeFilter(self, entities):
+        '''Returns a where-clause matching the selected *entities* and everything below them'''
+        projectIds = [entity[1] for entity in entities if entity[0] == 'Project']
+        contextIds = [entity[1] for entity in entities if entity[0] != 'Project']
 
+        conditions = []
+        if (len(contextIds) > 0):
+            conditions.append('id in ({0})'.format(get_filter_string(contextIds)))
+            conditions.append('ancestors.id in ({0})'.format(get_filter_string(contextIds)))
+        if (len(projectIds) > 0):
+            conditions.append('project_id in ({0})'.format(get_filter_string(projectIds)))
 
+        return ' or '.join(conditions)
 
-            # Export csv
+    def taskQuery(self, condition):
+        '''Returns a query for all tasks matching *condition*
 
+        Only the attributes needed for the csv are fetched.
+        '''
+        return u'select name, end_date, description, parent_id from Task where {0} order by end_date, id'.format(
+            condition
+        )
 
-            # Generate unique temp file name
-            file_path = tempfile.NamedTemporaryFile(
-                prefix='todoist_taskexport_', 
-                suffix='.csv', 
-                delete=False
-            ).name
-
-            # Write to file
-            f=open(file_path,"w")
-            f.write(printString)
-            f.close()
-
-            # Create file component for job
-            job_file = os.path.basename(file_path).replace('.csv', '')
-            component = session.create_component(
-                file_path,
-                data={'name': job_file},
-                location=session.query(u"Location where name is 'ftrack.server'").one()
-            )
-            session.commit()
+    def topLevelCondition(self, entities):
+        '''Returns a where-clause for the tasks which may be outside of the hierarchy
 
-            # Attach to job
-            session.create(
-                'JobComponent',
-                {
-                    'component_id': component['id'], 
-                    'job_id': job['id']
-                }
-            )
-            
-            # Set job status as done
-            job['status'] = 'done'
-            job['data'] = json.dumps({
-                'description': 'Exported csv for Todoist'
-            })
-            session.commit()
-
-        except BaseException as exc:
-            # Error handling: Write error
-            self.logger.exception('Exporting to Todoist csv failed')
-            session.rollback()
-            job['status'] = 'failed'
-            job['data'] = json.dumps({
-                'description': exc.message
-            })
-            session.commit()
+        These are the tasks right below the selected projects and the selected
+        tasks themselves. All other tasks within the selected *entities* are
+        below a context of the hierarchy (see `ancestorMap`).
+        '''
+        projectIds = [entity[1] for entity in entities if entity[0] == 'Project']
+        contextIds = [entity[1] for entity in entities if entity[0] != 'Project']
 
-            
+        conditions = []
+        if (len(projectIds) > 0):
+            conditions.append('parent_id in ({0})'.format(get_filter_string(projectIds)))
+        if (len(contextIds) > 0):
+            conditions.append('id in ({0})'.format(get_filter_string(contextIds)))
 
+        return ' or '.join(conditions)
 
+    def ancestorMap(self, session, entities, metrics=None):
+        '''Returns all contexts (sequences, shots, ...) within the selected *entities*
 
+        The result is a dictionary of `id: (name, parent_id)`. It is fetched once
+        per export, so the hierarchy never needs to be walked per task.
+        '''
+        ancestors = {}
 
+        expression = u'select name, parent_id from TypedContext where ({0}) and object_type.name is_not "Task" order by name, id'.format(
+            self.scopeFilter(entities)
+        )
+        for page in timed(iterQueryPages(session, expression, self.pageSize), metrics, 'query'):
+            for context in page:
+                ancestors[context['id']] = (context['name'], context['parent_id'])
+
+        return ancestors
+
+    def contextDepths(self, ancestors):
+        '''Returns the depth of each context in *ancestors* (top level contexts are 1)'''
+        depths = {}
+
+        for contextId in ancestors:
+            # Walk up until we reach something we already know (or the top)
+            path = []
+            current = contextId
+            while (current in ancestors and current not in depths):
+                path.append(current)
+                current = ancestors[current][1]
+
+            depth = depths.get(current, 0)
+            for pathId in reversed(path):
+                depth += 1
+                depths[pathId] = depth
+
+        return depths
+
+    def indentFor(self, depth):
+        '''Returns the Todoist indent for a hierarchy *depth*'''
+        return max(1, min(depth, self.maxIndent))
+
+    def csvLine(self, *values):
+        '''Returns a line of the csv with *values* (quoted if they contain commas, quotes or line breaks)'''
+        line = io.BytesIO()
+        csv.writer(line, lineterminator='\n').writerow([u'{0}'.format(value).encode('utf-8') for value in values])
+
+        return line.getvalue().decode('utf-8')
+
+    def contextRows(self, name, indent):
+        '''Returns the csv rows for a parent task (sequence, shot, ...)'''
+        return self.csvLine('task', name, 4, indent, '', '', '', 'en', '') + self.csvLine(*[''] * 9)
+
+    def taskRows(self, entity, indent=1):
+        '''Returns the csv rows for a single task *entity*'''
+        datestr = ""
+        descriptionstr = ""
+
+        # Get correct date
+        if (entity['end_date'] != None):
+            # Create string
+            datestr = entity['end_date'].format('MMM DD YYYY')
+        # Get description as comment
+        if (entity['description'] != None and bool(entity['description'].strip())):
+            descriptionstr = self.csvLine('note', entity['description'].encode('ascii','ignore'), '', '', '', '', '', '', '')
+
+        return self.csvLine('task', entity['name'], 4, indent, '', '', datestr, 'en', '') + descriptionstr + self.csvLine(*[''] * 9)
+
+    def hierarchyOrder(self, ancestors):
+        '''Returns the ids of all contexts in *ancestors* depth first (siblings sorted by name)'''
+        children = {}
+        roots = []
+        for contextId, (name, parentId) in ancestors.items():
+            if (parentId in ancestors):
+                children.setdefault(parentId, []).append(contextId)
+            else:
+                roots.append(contextId)
+
+        byName = lambda contextId: (ancestors[contextId][0], contextId)
+
+        order = []
+        stack = sorted(roots, key=byName, reverse=True)
+        while stack:
+            contextId = stack.pop()
+            order.append(contextId)
+            stack.extend(sorted(children.get(contextId, []), key=byName, reverse=True))
+
+        return order
+
+    def hierarchyTasks(self, session, entities, ancestors, depths, progress=None, cancel=None, metrics=None):
+        '''Yields all tasks within *entities* and the contexts above them, in the order of the csv
+
+        Each entry is a tuple of `(ftrack_id, parent_id, depth, task)`. *task* is
+        None for a context (sequence, shot, ...), *parent_id* is None on the
+        top level. Tasks outside of the hierarchy come first, then each context
+        is followed by its tasks (sorted by their end date) and its children.
+        Contexts without any task below them are skipped.
+
+        The tasks are fetched for `contextChunkSize` contexts at a time, so
+        only their tasks are held in memory while the rest is streamed.
+        '''
+        fetched = [0]
+
+        def tasks(condition):
+            pages = iterQueryPages(session, self.taskQuery(condition), self.pageSize, progress, cancel, fetched[0])
+            for page in timed(pages, metrics, 'query'):
+                fetched[0] += len(page)
+                for task in page:
+                    yield task
+
+        # Tasks right below a project or selected on their own
+        for task in tasks(self.topLevelCondition(entities)):
+            if (task['parent_id'] not in ancestors):
+                yield task['id'], None, 1, task
+
+        # The contexts on the way down to the current one, and how many of them were yielded
+        path = []
+        yielded = 0
+
+        order = self.hierarchyOrder(ancestors)
+        for start in range(0, len(order), self.contextChunkSize):
+            chunk = order[start:start + self.contextChunkSize]
+
+            chunkTasks = {}
+            for task in tasks('parent_id in ({0})'.format(get_filter_string(chunk))):
+                chunkTasks.setdefault(task['parent_id'], []).append(task)
+
+            for contextId in chunk:
+                depth = depths[contextId]
+                path[depth - 1:] = [contextId]
+                yielded = min(yielded, depth - 1)
+
+                for task in chunkTasks.pop(contextId, []):
+                    # A context comes right before the first task below it
+                    for index in range(yielded, len(path)):
+                        yield path[index], path[index - 1] if index > 0 else None, index + 1, None
+                    yielded = len(path)
+
+                    yield task['id'], contextId, depth + 1, task
+
+    def csvRows(self, entries, ancestors):
+        '''Yields the csv for all *entries* of `hierarchyTasks` (contexts named as in *ancestors*)'''
+        yield self.csvLine('TYPE', 'CONTENT', 'PRIORITY', 'INDENT', 'AUTHOR', 'RESPONSIBLE', 'DATE', 'DATE_LANG', 'TIMEZONE')
+
+        for ftrackId, parentId, depth, task in entries:
+            if task is None:
+                yield self.contextRows(ancestors[ftrackId][0], self.indentFor(depth))
+            else:
+                yield self.taskRows(task, self.indentFor(depth))
+
+    def csvExporter(self, session, entities, progress=None, cancel=None, metrics=None):
+        '''Returns the exporter for the csv of all tasks within *entities*'''
+        # Get the hierarchy once for the whole export
+        ancestors = self.ancestorMap(session, entities, metrics)
+        depths = self.contextDepths(ancestors)
+
+        # The tasks are streamed to the file while the pages arrive
+        return Exporter(
+            fetch=lambda: self.hierarchyTasks(session, entities, ancestors, depths, progress, cancel, metrics),
+            transform=lambda entries: self.csvRows(entries, ancestors),
+            sink=FileSink('todoist_taskexport_', '.csv'),
+            progress=progress,
+            cancel=cancel,
+            metrics=metrics
+        )
 
+    def syncItem(self, ftrackId, parentId, content, endDate=None, description=None):
+        '''Returns the Todoist item for a task or context (parents always come first)'''
+        values = {
+            'content': content,
+            'description': (description or '').strip(),
+            'due': {'date': endDate.format('YYYY-MM-DD')} if endDate != None else None
+        }
 
+        return {
+            'ftrack_id': ftrackId,
+            'parent': parentId,
+            'values': values,
+            'hash': hashlib.sha1(json.dumps(values, sort_keys=True).encode('utf-8')).hexdigest()
+        }
 
+    def syncTodoist(self, session, entities, settings, progress=None, cancel=None, metrics=None):
+        '''Syncs all tasks within *entities* to Todoist
 
+        Only tasks that are new or changed since the last sync are sent, all of
+        them batched into as few requests as possible. The tasks are streamed
+        like for the csv, a batch is sent as soon as it is full. Returns a tuple
+        of `(added, updated, unchanged)`.
+        '''
+        client = TodoistSync(self.todoistToken, self.todoistSyncUrl)
+        store = TodoistIdStore(self.syncStorePath, self.todoistToken)
+
+        # Items come in the same order as in the csv (parents before children)
+        ancestors = self.ancestorMap(session, entities, metrics)
+        depths = self.contextDepths(ancestors)
+
+        commands = []
+        tempIds = {}
+        sent = 0
+        added = 0
+        updated = 0
+        unchanged = 0
+        for ftrackId, parentId, depth, task in self.hierarchyTasks(session, entities, ancestors, depths, progress, cancel, metrics):
+            if task is None:
+                item = self.syncItem(ftrackId, parentId, ancestors[ftrackId][0])
+            else:
+                item = self.syncItem(ftrackId, parentId, task['name'], task['end_date'], task['description'])
+
+            # Create the commands for everything that changed
+            known = store.get(item['ftrack_id'])
+
+            # Moving to the top level needs the project, without one the item keeps its parent
+            if (known is not None and item['parent'] == None and not settings.get('todoist_project')):
+                item['parent'] = known.get('parent')
+
+            if known is None:
+                args = dict((key, value) for key, value in item['values'].items() if value != None)
+                if settings.get('todoist_project'):
+                    args['project_id'] = settings['todoist_project']
+                commands.append((item, {'type': 'item_add', 'temp_id': str(uuid.uuid4()), 'uuid': str(uuid.uuid4()), 'args': args}))
+                added += 1
+
+            elif (known['hash'] != item['hash'] or known.get('parent') != item['parent']):
+                if (known['hash'] != item['hash']):
+                    args = dict(item['values'], id=known['id'])
+                    commands.append((item, {'type': 'item_update', 'uuid': str(uuid.uuid4()), 'args': args}))
+                if (known.get('parent') != item['parent']):
+                    args = {'id': known['id']}
+                    if (item['parent'] == None):
+                        args['project_id'] = settings['todoist_project']
+                    commands.append((item, {'type': 'item_move', 'uuid': str(uuid.uuid4()), 'args': args}))
+                updated += 1
+
+            else:
+                unchanged += 1
+
+            # Send full batches right away
+            while (len(commands) >= client.batchSize):
+                sent += self.sendBatch(client, store, commands[:client.batchSize], tempIds, progress, cancel, metrics, sent)
+                del commands[:client.batchSize]
+
+        if commands:
+            self.sendBatch(client, store, commands, tempIds, progress, cancel, metrics, sent)
+
+        return added, updated, unchanged
+
+    def sendBatch(self, client, store, batch, tempIds, progress=None, cancel=None, metrics=None, sent=0):
+        '''Sends a *batch* of `(item, command)` tuples with *client* and stores the results
+
+        *tempIds* maps the ftrack ids of all added items to their temporary ids.
+        *sent* is the amount of commands sent before (for the progress).
+        Returns the amount of commands sent.
+        '''
+        if cancel is not None:
+            cancel.check()
+        if progress is not None:
+            progress.update('Syncing', count=sent)
 
+        for item, command in batch:
+            if command['type'] == 'item_add':
+                tempIds[item['ftrack_id']] = command['temp_id']
 
+            if (item['parent'] != None and command['type'] in ('item_add', 'item_move')):
+                # Parents are either known already or were added in this batch
+                parent = store.get(item['parent'])
+                command['args']['parent_id'] = parent['id'] if parent else tempIds[item['parent']]
 
+        with phase(metrics, 'upload'):
+            syncStatus, tempIdMapping = client.send([command for item, command in batch])
 
+        for item, command in batch:
+            if (syncStatus.get(command['uuid']) != 'ok'):
+                self.logger.warning(u'Todoist rejected {0}: {1}'.format(command['type'], syncStatus.get(command['uuid'])))
+                continue
 
+            if command['type'] == 'item_add':
+                store.set(item['ftrack_id'], tempIdMapping[command['temp_id']], item['hash'], item['parent'])
+            elif command['type'] == 'item_move':
+                # Only a move which went through changes the parent
+                known = store.get(item['ftrack_id'])
+                store.set(item['ftrack_id'], known['id'], known['hash'], item['parent'])
+            else:
+                known = store.get(item['ftrack_id'])
+                store.set(item['ftrack_id'], known['id'], item['hash'], known.get('parent'))
 
+        store.save()
 
-    
+        return len(batch)
 
 
-    ##############################################################################
-    #                                                                            #
-    # You do not need to edit something below, as these are just utility methods #
-    #                   for discovery, registration and more                     #
-    #                                                                            #
-    ##############################################################################
+    @run_async
+    def mainAsyncAction(self, entities, user_id=None, settings=None):
+        '''
+        The main action this one is doing inside a job
+        '''
+        # Take a session for the running job
+        with JOB_SESSIONS.session() as session:
+            self.runJob(session, entities, user_id, settings or {})
+
+    def runJob(self, session, entities, user_id, settings):
+        '''Exports (or syncs) the selected *entities* within a job of *user_id*'''
+        metrics = Metrics(self.identifier, self.logger)
+        metrics.instrument(session)
+        guard = QueryGuard(self.identifier, logger=self.logger)
+        guard.watch(session)
+        status = 'done'
+
+        job = start_job(session, user_id, 'Exporting tasks for Todoist...')
+        cancel = CancelToken(session, job)
+        progress = JobProgress(session, job, cancel=cancel)
 
+        try:
+            if (settings.get('mode') == 'sync'):
+                # Push the changes to Todoist directly
+                added, updated, unchanged = self.syncTodoist(session, entities, settings, progress, cancel, metrics)
 
-    @property
-    def session(self):
-        '''Return convenient exposure of the self._session reference.'''
-        return self._session
+                job['status'] = 'done'
+                job['data'] = json.dumps({
+                    'description': 'Synced to Todoist: {0} added, {1} updated, {2} unchanged'.format(added, updated, unchanged)
+                })
+                with phase(metrics, 'commit'):
+                    session.commit()
 
-    @property
-    def ftrack_server_location(self):
-        '''Return the ftrack.server location.'''
-        return self.session.query(
-            u"Location where name is 'ftrack.server'"
-        ).one()
+            else:
+                self.csvExporter(session, entities, progress, cancel, metrics).publish(session, job, 'Exported csv for Todoist')
 
+            guard.finish()
 
-    def _discover(self, event):
-        '''Returns the parameters to show the interaction icon in the Actions Panel'''
-        args = self._translate_event(
-            self.session, event
-        )
+        except ExportCancelled:
+            self.logger.info('Exporting to Todoist was cancelled')
+            status = 'cancelled'
+            end_cancelled_job(session, job)
 
-        accepts = self.discover(
-            self.session, *args
-        )
+        except BaseException as exc:
+            # Error handling: Write error
+            self.logger.exception('Exporting to Todoist failed')
+            status = 'failed'
+            fail_job(session, job, exc.message)
 
-        if accepts:
-            return {
-                'items': [{
-                    'label': self.label,
-                    'variant': self.variant,
-                    'description': self.description,
-                    'actionIdentifier': self.identifier,
-                    'icon': self.icon,
-                }]
-            }
+        finally:
+            guard.release()
+            metrics.finish(status)
 
 
 def register(session, **kw):
     '''Register plugin. Called when used as an plugin.'''
-    # Validate that session is an instance of ftrack_api.Session. If not,
-    # assume that register is being called from an old or incompatible API and
-    # return without doing anything.
-    if not isinstance(session, ftrack_api.session.Session):
-        return
-
-    action_handler = unexExportToTodoist(session)
-    action_handler.register()
+    register_actions(session, unexExportToTodoist)
 
 
 def main(arguments=None):
     '''Set up logging and register action.'''
-    if arguments is None:
-        arguments = []
-
-    parser = argparse.ArgumentParser()
-    # Allow setting of logging level from arguments.
-    loggingLevels = {}
-    for level in (
-        logging.NOTSET, logging.DEBUG, logging.INFO, logging.WARNING,
-        logging.ERROR, logging.CRITICAL
-    ):
-        loggingLevels[logging.getLevelName(level).lower()] = level
-
-    parser.add_argument(
-        '-v', '--verbosity',
-        help='Set the logging output verbosity.',
-        choices=loggingLevels.keys(),
-        default='info'
-    )
-    namespace = parser.parse_args(arguments)
-
-    # Set up basic logging.
-    logging.basicConfig(level=loggingLevels[namespace.verbosity])
-
-    session = ftrack_api.Session()
-    register(session)
-
-    # Wait for events.
-    logging.info(
-        'Registered actions and listening for events. Use Ctrl-C to abort.'
-    )
-    session.event_hub.wait()
+    return listen(register, arguments)
 
 
 if __name__ == '__main__':
     raise SystemExit(main(sys.argv[1:]))
-
@@ -3,40 +3,20 @@
 # :license: GPL-3.0
 
 import sys
-import logging
-import argparse
 import os
 import glob
 
-import ftrack_api
+# The shared runtime is deployed next to the actions (ftrack-connect/action-runtime)
+RUNTIME_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'action-runtime'))
+if RUNTIME_PATH not in sys.path:
+    sys.path.append(RUNTIME_PATH)
 
-from ftrack_action_handler.action import BaseAction
+# Shared utility methods and the base of all actions, which does discovery, registration and more
+from unex_runtime.action import UnexAction, getRealEntityFromTypedContext, register_actions, listen
+from unex_runtime.paths import local_path, open_file
 
 
-##############################################################################
-#                                                                            #
-#           Custom utility methods (might not need to be changed)            #
-#                                                                            #
-##############################################################################
-
-def getRealEntityFromTypedContext(session, entity):
-    '''
-    This one will return you a real entity behind a TypedContext-entity
-    
-    *session* is a `ftrack_api.Session` instance
-
-    *entity* should be a tuple containing the entity type of `TypedContext`
-    and (more important) the entity id.
-    '''
-    return session.get(entity[0], entity[1])
-
-def get_filter_string(entity_ids):
-    '''Return a comma separated string of quoted ids from *entity_ids* list.'''
-    return ', '.join(
-        '"{0}"'.format(entity_id) for entity_id in entity_ids
-    )
-
-class unexOpenFileAction(BaseAction):
+class unexOpenFileAction(UnexAction):
     '''This action will open an associated file'''
     
     ##############################################################################
@@ -121,25 +101,27 @@ class unexOpenFileAction(BaseAction):
         oneObject = getRealEntityFromTypedContext(session, entities[0])
         
         # As we are very sure that this is valid, we may open the file directly
-        filename = oneObject['custom_attributes'][self.filePropertyName]
+        # (as seen from this machine, see unex_runtime.paths)
+        filename = local_path(oneObject['custom_attributes'][self.filePropertyName])
 
-        # Check, if we are looking at a file or directory
-        if (os.path.isfile(filename)):
-            os.startfile(filename)
+        # Look for the file to open
+        fileToOpen = self.findFile(filename)
+
+        if (fileToOpen == filename):
+            open_file(filename)
             
             return {
                 'success': True,
                 'message': 'Opening the file for {0}: <br />\n{1}'.format(oneObject['name'], filename)
             }
 
-        elif (os.path.isdir(filename)):
-            # If this is a directory, look for the most recent file in the directory
-            newestfile = max(glob.iglob(filename + '/*.[!json]*'), key=os.path.getmtime)
-            os.startfile(newestfile)
+        elif (fileToOpen is not None):
+            # This is the most recent file in the directory
+            open_file(fileToOpen)
             
             return {
                 'success': True,
-                'message': 'Opening the most recent file for {0}: <br />\n{1}<br />\nIn directory:<br />\n{2}'.format(oneObject['name'], newestfile, filename)
+                'message': 'Opening the most recent file for {0}: <br />\n{1}<br />\nIn directory:<br />\n{2}'.format(oneObject['name'], fileToOpen, filename)
             }
         else:
             return {
@@ -148,99 +130,31 @@ class unexOpenFileAction(BaseAction):
             }
 
 
+    def findFile(self, filename):
+        '''Returns the file to open for *filename* or None, if there is none
 
+        *filename* is returned as it is, if it is a file. For directories, the
+        most recent file in there is returned.
+        '''
+        if (os.path.isfile(filename)):
+            return filename
 
+        elif (os.path.isdir(filename)):
+            # If this is a directory, look for the most recent file in the directory
+            return max(glob.iglob(filename + '/*.[!json]*'), key=os.path.getmtime)
 
-    ##############################################################################
-    #                                                                            #
-    # You do not need to edit something below, as these are just utility methods #
-    #                   for discovery, registration and more                     #
-    #                                                                            #
-    ##############################################################################
-
-
-    @property
-    def session(self):
-        '''Return convenient exposure of the self._session reference.'''
-        return self._session
-
-    @property
-    def ftrack_server_location(self):
-        '''Return the ftrack.server location.'''
-        return self.session.query(
-            u"Location where name is 'ftrack.server'"
-        ).one()
-
-
-    def _discover(self, event):
-        '''Returns the parameters to show the interaction icon in the Actions Panel'''
-        args = self._translate_event(
-            self.session, event
-        )
-
-        accepts = self.discover(
-            self.session, *args
-        )
-
-        if accepts:
-            return {
-                'items': [{
-                    'label': self.label,
-                    'variant': self.variant,
-                    'description': self.description,
-                    'actionIdentifier': self.identifier,
-                    'icon': self.icon,
-                }]
-            }
+        return None
 
 
 def register(session, **kw):
     '''Register plugin. Called when used as an plugin.'''
-    # Validate that session is an instance of ftrack_api.Session. If not,
-    # assume that register is being called from an old or incompatible API and
-    # return without doing anything.
-    if not isinstance(session, ftrack_api.session.Session):
-        return
-
-    action_handler = unexOpenFileAction(session)
-    action_handler.register()
+    register_actions(session, unexOpenFileAction)
 
 
 def main(arguments=None):
     '''Set up logging and register action.'''
-    if arguments is None:
-        arguments = []
-
-    parser = argparse.ArgumentParser()
-    # Allow setting of logging level from arguments.
-    loggingLevels = {}
-    for level in (
-        logging.NOTSET, logging.DEBUG, logging.INFO, logging.WARNING,
-        logging.ERROR, logging.CRITICAL
-    ):
-        loggingLevels[logging.getLevelName(level).lower()] = level
-
-    parser.add_argument(
-        '-v', '--verbosity',
-        help='Set the logging output verbosity.',
-        choices=loggingLevels.keys(),
-        default='info'
-    )
-    namespace = parser.parse_args(arguments)
-
-    # Set up basic logging.
-    logging.basicConfig(level=loggingLevels[namespace.verbosity])
-
-    session = ftrack_api.Session()
-    register(session)
-
-    # Wait for events.
-    logging.info(
-        'Registered actions and listening for events. Use Ctrl-C to abort.'
-    )
-    session.event_hub.wait()
+    return listen(register, arguments)
 
 
 if __name__ == '__main__':
     raise SystemExit(main(sys.argv[1:]))
-
@@ -3,40 +3,21 @@
 # :license: GPL-3.0
 
 import sys
-import logging
-import argparse
 import os
 import glob
+import subprocess
 
-import ftrack_api
+# The shared runtime is deployed next to the actions (ftrack-connect/action-runtime)
+RUNTIME_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'action-runtime'))
+if RUNTIME_PATH not in sys.path:
+    sys.path.append(RUNTIME_PATH)
 
-from ftrack_action_handler.action import BaseAction
+# Shared utility methods and the base of all actions, which does discovery, registration and more
+from unex_runtime.action import UnexAction, getRealEntityFromTypedContext, register_actions, listen
+from unex_runtime.paths import local_path, platform_name
 
 
-##############################################################################
-#                                                                            #
-#           Custom utility methods (might not need to be changed)            #
-#                                                                            #
-##############################################################################
-
-def getRealEntityFromTypedContext(session, entity):
-    '''
-    This one will return you a real entity behind a TypedContext-entity
-    
-    *session* is a `ftrack_api.Session` instance
-
-    *entity* should be a tuple containing the entity type of `TypedContext`
-    and (more important) the entity id.
-    '''
-    return session.get(entity[0], entity[1])
-
-def get_filter_string(entity_ids):
-    '''Return a comma separated string of quoted ids from *entity_ids* list.'''
-    return ', '.join(
-        '"{0}"'.format(entity_id) for entity_id in entity_ids
-    )
-
-class unexOpenRenderingAction(BaseAction):
+class unexOpenRenderingAction(UnexAction):
     '''This action will open an associated rendering'''
     
     ##############################################################################
@@ -51,8 +32,12 @@ class unexOpenRenderingAction(BaseAction):
     #: If you like the first match to be shown, set to True. Otherwise the most recent file will be searched and shown
     takeFirstMatch = False
 
-    #: The link to the external software
-    viewerSoftware = "c:\\Program Files\\DJV\\bin\\djv_view.exe"
+    #: The link to the external software per platform
+    viewerSoftware = {
+        'windows': "c:\\Program Files\\DJV\\bin\\djv_view.exe",
+        'linux': "djv_view",
+        'darwin': "djv_view"
+    }
 
     #: The name of your main render pass (usually beauty or base)
     mainRenderpassName = "beauty"
@@ -143,20 +128,47 @@ class unexOpenRenderingAction(BaseAction):
         oneObject = getRealEntityFromTypedContext(session, entities[0])
         
         # As we are very sure that this is valid, we may open the file directly
-        filename = oneObject['custom_attributes'][self.filePropertyName]
+        # (as seen from this machine, see unex_runtime.paths)
+        filename = local_path(oneObject['custom_attributes'][self.filePropertyName])
+
+
+        # Look for the rendering
+        finalFile = self.findRendering(filename)
+
+        # Check, if we found something
+        if (finalFile):
+            # Open file (without waiting for the viewer to be closed)
+            subprocess.Popen([self.viewerSoftware[platform_name()], finalFile])
+            
+            return {
+                'success': True,
+                'message': 'Opening the rendering for {0}'.format(oneObject['name'])
+            }
+        else:
+            return {
+                'success': False,
+                'message': 'Could not find any rendering for {0}'.format(oneObject['name'])
+            }
 
 
+    def findRendering(self, filename):
+        '''Returns the main pass rendering belonging to *filename* or None
+
+        *filename* is the associated file of a task within the workflow directory
+        (a path of this machine, see `unex_runtime.paths.local_path`). The render
+        directories are searched in the order of `possibleRenderDirs`.
+        '''
         foundAFile = False
 
 
         # Find first element of hierarchy
-        rootdirPos = filename.find(self.workflowDirectoryName + "\\")
+        rootdirPos = filename.find(self.workflowDirectoryName + os.sep)
 
         if (rootdirPos > -1):
             lookat = filename[rootdirPos + self.workflowDirectoryName.__len__() + 1:]
 
             # Look at the elements
-            pathElements = lookat.split('\\')
+            pathElements = lookat.split(os.sep)
 
             # First part is the software. This is something we don't need here
             # Second part is the type of our content. This is something we will need
@@ -223,120 +235,21 @@ class unexOpenRenderingAction(BaseAction):
                                             finalFile = newest
                                             foundAFile = True
 
-
-
-
-
-
-        # Check, if we are looking at a file or directory
         if (foundAFile):
-            # Open file
-            os.system('"%s" %s' % (self.viewerSoftware, finalFile))
-            
-            return {
-                'success': True,
-                'message': 'Opening the rendering for {0}'.format(oneObject['name'])
-            }
-        else:
-            return {
-                'success': False,
-                'message': 'Could not find any rendering for {0}'.format(oneObject['name'])
-            }
-
-
-
-
-
-    ##############################################################################
-    #                                                                            #
-    # You do not need to edit something below, as these are just utility methods #
-    #                   for discovery, registration and more                     #
-    #                                                                            #
-    ##############################################################################
+            return finalFile
 
-
-    @property
-    def session(self):
-        '''Return convenient exposure of the self._session reference.'''
-        return self._session
-
-    @property
-    def ftrack_server_location(self):
-        '''Return the ftrack.server location.'''
-        return self.session.query(
-            u"Location where name is 'ftrack.server'"
-        ).one()
-
-
-    def _discover(self, event):
-        '''Returns the parameters to show the interaction icon in the Actions Panel'''
-        args = self._translate_event(
-            self.session, event
-        )
-
-        accepts = self.discover(
-            self.session, *args
-        )
-
-        if accepts:
-            return {
-                'items': [{
-                    'label': self.label,
-                    'variant': self.variant,
-                    'description': self.description,
-                    'actionIdentifier': self.identifier,
-                    'icon': self.icon,
-                }]
-            }
+        return None
 
 
 def register(session, **kw):
     '''Register plugin. Called when used as an plugin.'''
-    # Validate that session is an instance of ftrack_api.Session. If not,
-    # assume that register is being called from an old or incompatible API and
-    # return without doing anything.
-    if not isinstance(session, ftrack_api.session.Session):
-        return
-
-    action_handler = unexOpenRenderingAction(session)
-    action_handler.register()
+    register_actions(session, unexOpenRenderingAction)
 
 
 def main(arguments=None):
     '''Set up logging and register action.'''
-    if arguments is None:
-        arguments = []
-
-    parser = argparse.ArgumentParser()
-    # Allow setting of logging level from arguments.
-    loggingLevels = {}
-    for level in (
-        logging.NOTSET, logging.DEBUG, logging.INFO, logging.WARNING,
-        logging.ERROR, logging.CRITICAL
-    ):
-        loggingLevels[logging.getLevelName(level).lower()] = level
-
-    parser.add_argument(
-        '-v', '--verbosity',
-        help='Set the logging output verbosity.',
-        choices=loggingLevels.keys(),
-        default='info'
-    )
-    namespace = parser.parse_args(arguments)
-
-    # Set up basic logging.
-    logging.basicConfig(level=loggingLevels[namespace.verbosity])
-
-    session = ftrack_api.Session()
-    register(session)
-
-    # Wait for events.
-    logging.info(
-        'Registered actions and listening for events. Use Ctrl-C to abort.'
-    )
-    session.event_hub.wait()
+    return listen(register, arguments)
 
 
 if __name__ == '__main__':
     raise SystemExit(main(sys.argv[1:]))
-
@@ -0,0 +1,397 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2019 c.arlt@unexpected.de
+# :license: GPL-3.0
+
+'''
+Benchmarks of the actions against synthetic data
+
+Each action runs against a synthetic project (see `synthetic_project`) or a
+fake directory tree of the given scale. Every run happens in its own
+process, so its peak memory is not mixed up with the one of other runs.
+The `publish` run exports a Gantt Chart within a job twice, so uploading a
+file and reusing the cached one are covered as well (a failed job fails it).
+
+For each run, this reports:
+
+- round_trips: calls sent to the (stand-in) ftrack server
+- wall_time: seconds the action took (without building the data)
+- peak_rss_kb: peak memory of the process, and setup_rss_kb before the action ran
+- output_bytes: size of the written files
+- n_plus_one: lines of code causing a round trip per entity, if the
+  environment variable UNEX_QUERY_GUARD is set (see `unex_runtime.guard`)
+
+The start-up of each hook is measured as well: how long ftrack-connect
+takes to import it (import_ms, the best of a few runs) and how many modules
+that loads, and how long the modules it imports lazily take on its first
+launch (launch_import_ms).
+
+Run it with the Python of ftrack-connect (the actions need Python 2.7):
+
+    python benchmark.py -o before.json
+    python benchmark.py --scale 100 --scale 1000 --compare before.json
+'''
+
+import argparse
+import imp
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+UTILITIES_PATH = os.path.dirname(os.path.abspath(__file__))
+CONNECT_PATH = os.path.join(os.path.dirname(UTILITIES_PATH), 'ftrack-connect')
+
+sys.path.insert(0, UTILITIES_PATH)
+sys.path.insert(0, os.path.join(CONNECT_PATH, 'action-runtime'))
+
+from ftrack_mock import MockSession
+from synthetic_project import build_project
+from unex_runtime.guard import GUARD_VARIABLE, QueryGuard
+
+
+#: Default scales (tasks of the project or files of the tree)
+SCALES = (100, 1000, 10000, 100000)
+
+#: Hooks whose start-up is measured
+HOOKS = ('boilerplate', 'export-gantt-chart', 'export-to-todoist', 'open-asset-file', 'open-rendering')
+
+#: Imports a hook in a fresh process like ftrack-connect does it, then
+#: everything it imports lazily like its first launch does it
+STARTUP_SCRIPT = '''
+import imp, json, sys, time
+
+# ftrack-connect has imported these already when it loads the hooks
+import logging, ftrack_api
+from ftrack_action_handler.action import BaseAction
+
+modules = len(sys.modules)
+started = time.time()
+hook = imp.load_source('hook', sys.argv[1])
+imported = time.time()
+
+lazy = [value for value in vars(hook).values() if type(value).__name__ == 'LazyModule']
+for module in lazy:
+    module.__name__
+
+print(json.dumps({
+    'import_ms': round((imported - started) * 1000, 2),
+    'launch_import_ms': round((time.time() - imported) * 1000, 2),
+    'modules': len(sys.modules) - modules
+}))
+'''
+
+
+def load_hook(name):
+    '''Returns the hook module of the action *name* (the directory in ftrack-connect)'''
+    return imp.load_source(
+        'benchmark_' + name.replace('-', '_'),
+        os.path.join(CONNECT_PATH, name, 'hook', 'action.py')
+    )
+
+
+def peak_rss():
+    '''Returns the peak memory of this process in KB (or None, if unknown)'''
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux KB
+    if (sys.platform == 'darwin'):
+        peak = peak // 1024
+
+    return peak
+
+
+def touch(path):
+    '''Creates an empty file at *path* (and all directories above it)'''
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    open(path, 'wb').close()
+
+
+##############################################################################
+# Benchmarks
+#
+# Each one gets the scale and a temporary directory, prepares its data and
+# returns the session and a function running the action. That one returns
+# the written files.
+
+def gantt_benchmark(scale, workdir):
+    hook = load_hook('export-gantt-chart')
+    session = MockSession()
+    project = build_project(session, tasks=scale, milestones=max(scale // 100, 1))
+
+    settings = dict(hook.GanttChart.defaultSettings, show_assignees=True, show_status=True)
+    chart = hook.GanttChart(session, [('Project', project['id'])], settings)
+
+    return session, lambda: chart.write(os.path.join(workdir, 'gantt'))
+
+
+def publish_benchmark(scale, workdir):
+    '''Exports the Gantt Chart of a project within a job twice: uploaded first, then from the cache'''
+    hook = load_hook('export-gantt-chart')
+    session = MockSession()
+    project = build_project(session, tasks=scale, milestones=max(scale // 100, 1))
+    session.add('Location', {'name': 'ftrack.server'})
+    user = session.add('User', {'username': session.api_user})
+
+    settings = dict(hook.GanttChart.defaultSettings, formats=['html', 'svg'])
+
+    def run():
+        for attempt in ('upload', 'cache'):
+            job = hook.exportGanttChart(session, [('Project', project['id'])], settings, user_id=user['id'])
+            if (job.raw('status') != 'done'):
+                raise RuntimeError(u'Publishing ({0}) failed: {1}'.format(attempt, job.raw('data')))
+
+        session.close()
+        return []
+
+    return session, run
+
+
+def todoist_benchmark(scale, workdir):
+    hook = load_hook('export-to-todoist')
+    session = MockSession()
+    project = build_project(session, tasks=scale, milestones=0)
+
+    action = hook.unexExportToTodoist(session)
+
+    return session, lambda: [action.csvExporter(session, [('Project', project['id'])]).run()]
+
+
+def associated_task(session, filename):
+    '''Returns a single task whose associated file is *filename*'''
+    build_project(session, tasks=1, milestones=0)
+
+    task = session.store['Task'][0]
+    task.raw('custom_attributes')['associatedFile'] = filename
+
+    return task
+
+
+def rendering_benchmark(scale, workdir):
+    '''Looks up the rendering of a shot with *scale* frames spread over its passes and render directories'''
+    hook = load_hook('open-rendering')
+    action = hook.unexOpenRenderingAction
+
+    # Frames of several passes in three of the render directories
+    renderDirs = action.possibleRenderDirs[:3]
+    passes = (action.mainRenderpassName, 'diffuse', 'specular', 'depth')
+    for index in range(scale):
+        renderDir = renderDirs[index % len(renderDirs)]
+        renderPass = passes[(index // len(renderDirs)) % len(passes)]
+        touch(os.path.join(
+            workdir, action.renderDirectoryName, renderDir, 'shots', 'sh010', renderPass,
+            'sh010_{0}.{1:06d}.exr'.format(renderPass, index)
+        ))
+
+    # Entered on Windows, like most associated files
+    filename = os.path.join(workdir, '') + '\\'.join((action.workflowDirectoryName, 'maya', 'shots', 'sh010', 'sh010_v001.ma'))
+
+    session = MockSession()
+    task = associated_task(session, filename)
+    action = hook.unexOpenRenderingAction(session)
+
+    def run():
+        entities = [('TypedContext', task['id'])]
+        action.discover(session, entities, None)
+        action.findRendering(hook.local_path(hook.getRealEntityFromTypedContext(session, entities[0])['custom_attributes'][action.filePropertyName]))
+        return []
+
+    return session, run
+
+
+def asset_file_benchmark(scale, workdir):
+    '''Looks up the most recent of *scale* files in the associated directory'''
+    hook = load_hook('open-asset-file')
+
+    directory = os.path.join(workdir, 'assets', 'chair')
+    for index in range(scale):
+        touch(os.path.join(directory, 'chair_v{0:06d}.ma'.format(index)))
+        touch(os.path.join(directory, 'chair_v{0:06d}.json'.format(index)))
+
+    session = MockSession()
+    task = associated_task(session, directory)
+    action = hook.unexOpenFileAction(session)
+
+    def run():
+        entities = [('TypedContext', task['id'])]
+        action.discover(session, entities, None)
+        action.findFile(hook.local_path(hook.getRealEntityFromTypedContext(session, entities[0])['custom_attributes'][action.filePropertyName]))
+        return []
+
+    return session, run
+
+
+#: All benchmarks by the name of their action
+BENCHMARKS = {
+    'export-gantt-chart': gantt_benchmark,
+    'publish': publish_benchmark,
+    'export-to-todoist': todoist_benchmark,
+    'open-rendering': rendering_benchmark,
+    'open-asset-file': asset_file_benchmark
+}
+
+
+def run_benchmark(name, scale):
+    '''Runs the benchmark *name* at *scale* in this process and returns its result
+
+    With `UNEX_QUERY_GUARD` set, the lines causing N+1 round trips are listed in
+    `n_plus_one` (see `unex_runtime.guard`).
+    '''
+    workdir = tempfile.mkdtemp(prefix='unex_benchmark_')
+    paths = []
+    try:
+        started = time.time()
+        session, run = BENCHMARKS[name](scale, workdir)
+        setupTime = time.time() - started
+        setupRss = peak_rss()
+
+        guard = QueryGuard(name)
+        guard.watch(session)
+
+        started = time.time()
+        paths = run()
+        wallTime = time.time() - started
+
+        guard.release()
+
+        return {
+            'action': name,
+            'scale': scale,
+            'round_trips': session.stats()['calls'],
+            'wall_time': round(wallTime, 4),
+            'setup_time': round(setupTime, 4),
+            'peak_rss_kb': peak_rss(),
+            'setup_rss_kb': setupRss,
+            'output_bytes': sum(os.path.getsize(path) for path in paths),
+            'n_plus_one': [
+                u'{0}:{1} ({2} round trips)'.format(filename, line, count)
+                for count, (filename, line, code), example in guard.offenders()
+            ]
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+##############################################################################
+# Running all benchmarks
+
+def run_isolated(name, scale, python):
+    '''Runs the benchmark *name* at *scale* in a new process of *python*'''
+    output = subprocess.check_output([python, os.path.abspath(__file__), '--child', name, str(scale)])
+
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def measure_startup(hook, python, runs=5):
+    '''Returns the start-up of *hook* (see `STARTUP_SCRIPT`), the best of *runs* fresh processes'''
+    path = os.path.join(CONNECT_PATH, hook, 'hook', 'action.py')
+
+    measured = []
+    for run in range(runs):
+        output = subprocess.check_output([python, '-c', STARTUP_SCRIPT, path])
+        measured.append(json.loads(output.decode('utf-8').strip().splitlines()[-1]))
+
+    return dict(min(measured, key=lambda result: result['import_ms']), hook=hook)
+
+
+def percent(old, new):
+    '''Returns the change from *old* to *new* in percent as text'''
+    if (old and new is not None):
+        return u'{0:+.1f}%'.format((new - old) * 100.0 / old)
+    return u'-'
+
+
+def compare(results, previous):
+    '''Prints the changes of *results* against the *previous* ones'''
+    startups = dict((startup['hook'], startup) for startup in previous.get('startup', []))
+
+    print(u'\n{0:<20} {1:>14} {2:>14} {3:>14}'.format('hook', 'import_ms', 'launch_ms', 'modules'))
+    for startup in results['startup']:
+        old = startups.get(startup['hook'])
+        if old is not None:
+            print(u'{0:<20} {1:>14} {2:>14} {3:>14}'.format(
+                startup['hook'], *[percent(old[key], startup[key]) for key in ('import_ms', 'launch_import_ms', 'modules')]
+            ))
+
+    before = dict(((result['action'], result['scale']), result) for result in previous['results'])
+
+    print(u'\n{0:<20} {1:>7} {2:>14} {3:>14} {4:>14} {5:>14}'.format('action', 'scale', 'round_trips', 'wall_time', 'peak_rss_kb', 'output_bytes'))
+    for result in results['results']:
+        old = before.get((result['action'], result['scale']))
+        if old is None:
+            continue
+
+        changes = [percent(old.get(key), result.get(key)) for key in ('round_trips', 'wall_time', 'peak_rss_kb', 'output_bytes')]
+
+        print(u'{0:<20} {1:>7} {2:>14} {3:>14} {4:>14} {5:>14}'.format(result['action'], result['scale'], *changes))
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Benchmarks the actions against synthetic data')
+    parser.add_argument('--action', action='append', choices=sorted(BENCHMARKS), help='Action to run (repeat for more, default: all)')
+    parser.add_argument('--scale', action='append', type=int, help='Scale to run (repeat for more, default: {0})'.format(', '.join(str(scale) for scale in SCALES)))
+    parser.add_argument('--python', default=sys.executable, help='Python to run the actions with')
+    parser.add_argument('-o', '--output', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='Compare the results to this JSON file of an earlier run')
+    parser.add_argument('--startup-only', action='store_true', help='Only measure the start-up of the hooks')
+    parser.add_argument('--child', nargs=2, metavar=('ACTION', 'SCALE'), help=argparse.SUPPRESS)
+    namespace = parser.parse_args(arguments)
+
+    if namespace.child:
+        # Single run within its own process
+        print(json.dumps(run_benchmark(namespace.child[0], int(namespace.child[1]))))
+        return
+
+    results = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'startup': [],
+        'results': []
+    }
+
+    for hook in HOOKS:
+        startup = measure_startup(hook, namespace.python)
+        results['startup'].append(startup)
+        print(u'{hook:<20} {import_ms:>8.2f} ms import {launch_import_ms:>8.2f} ms on first launch {modules:>5} modules'.format(**startup))
+
+    for name in ([] if namespace.startup_only else namespace.action or sorted(BENCHMARKS)):
+        for scale in namespace.scale or SCALES:
+            result = run_isolated(name, scale, namespace.python)
+            results['results'].append(result)
+            print(u'{action:<20} {scale:>7} {round_trips:>8} round trips {wall_time:>9.3f}s {peak_rss_kb!s:>9} KB {output_bytes:>11} bytes'.format(**result))
+            for site in result['n_plus_one']:
+                print(u'    N+1: {0}'.format(site))
+
+    if namespace.output:
+        with open(namespace.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if namespace.compare:
+        with open(namespace.compare) as f:
+            compare(results, json.load(f))
+
+    # In CI, UNEX_QUERY_GUARD=fail makes any N+1 pattern fail the run
+    if (os.environ.get(GUARD_VARIABLE, '').lower() == 'fail' and any(result['n_plus_one'] for result in results['results'])):
+        return 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,310 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2019 c.arlt@unexpected.de
+# :license: GPL-3.0
+
+'''
+Regression checks of the actions against the stand-in for ftrack
+
+Each check builds a small synthetic project (see `synthetic_project`), runs
+a part of an action against it and raises an `AssertionError` if the result
+is wrong. Run it with the Python of ftrack-connect (the actions need Python 2.7):
+
+    python checks.py
+    python checks.py live-status
+
+It exits with 1 if any check failed, so it may be used in CI.
+'''
+
+import argparse
+import csv
+import io
+import os
+import sys
+import tempfile
+import traceback
+
+from benchmark import load_hook
+from ftrack_mock import MockSession, MockUploadServer, date
+from synthetic_project import build_project
+from unex_runtime import upload
+
+import todoist_mock_server
+
+
+def expect(condition, message):
+    '''Raises an `AssertionError` with *message*, unless *condition* holds'''
+    if not condition:
+        raise AssertionError(message)
+
+
+def updateEvent(entityType, entityId):
+    '''Returns an `ftrack.update` event for a change of a single entity'''
+    return {'data': {'entities': [{'entityType': entityType, 'entityId': entityId}]}}
+
+
+def received(client):
+    '''Returns all `(event, data)` a `LiveChart` client got so far'''
+    messages = []
+    while not client.empty():
+        messages.append(client.get())
+    return messages
+
+
+class LocalTodoist(object):
+    '''A `TodoistSync` client which applies the commands to the Todoist stand-in in this process'''
+
+    batchSize = 100
+
+    def __init__(self, token, url):
+        pass
+
+    def send(self, commands):
+        syncStatus = {}
+        tempIdMapping = {}
+        for command in commands:
+            syncStatus[command['uuid']], mapping = todoist_mock_server.apply_command(command)
+            tempIdMapping.update(mapping)
+        return syncStatus, tempIdMapping
+
+
+##############################################################################
+# Checks
+
+def check_load_alignment():
+    '''The load lanes count the same days as the bars, even if the chart starts during a day'''
+    hook = load_hook('export-gantt-chart')
+    session = MockSession()
+    taskType = session.add('Type', {'name': 'Animation', 'color': '#1abc9c'})
+    user = session.add('User', {'first_name': 'Anna', 'last_name': 'Arlt'})
+
+    def task(start, end):
+        entity = session.add('Task', {'name': 'task', 'start_date': start, 'end_date': end, 'type': taskType, 'assignments': []})
+        entity['assignments'].append(session.add('Appointment', {'type': 'assignment', 'context': entity, 'resource': user}))
+        return entity
+
+    # The first task starts in the afternoon, the second one at midnight three days later
+    tasks = [task(date(2019, 1, 7, 14, 30), date(2019, 1, 9)), task(date(2019, 1, 10), date(2019, 1, 12))]
+    layout = hook.layout.build_layout(tasks, 'Load', load=True)
+
+    expect(len(layout.loads) == 1, u'Expected one load lane, got {0}'.format(len(layout.loads)))
+    starts = [step[0] for step in layout.loads[0].steps if step[1] > 0]
+    bars = [int(round(bar.left * layout.daycount / 100.0)) for bar in layout.bars]
+    expect(starts == bars, u'The load lane starts on days {0}, the bars on days {1}'.format(starts, bars))
+
+
+def check_live_status():
+    '''A patched row of the live chart shows the new status and assignees of its task'''
+    hook = load_hook('export-gantt-chart')
+    session = MockSession()
+    project = build_project(session, tasks=50, milestones=1)
+
+    settings = dict(hook.GanttChart.defaultSettings, show_status=True, show_assignees=True)
+    live = hook.live.LiveChart(hook.GanttChart(session, [('Project', project['id'])], settings))
+    client = live.subscribe()
+
+    task = [task for task in session.store['Task'] if task.raw('start_date') is not None][0]
+    status = [status for status in session.store['Status'] if status is not task.raw('status')][0]
+    user = [user for user in session.store['User'] if user not in [assignment.raw('resource') for assignment in task.raw('assignments')]][0]
+    assignment = session.add('Appointment', {
+        'type': 'assignment', 'context': task, 'context_id': task['id'], 'resource': user, 'resource_id': user['id']
+    })
+    session.change(task, {'status': status, 'status_id': status['id'], 'assignments': [assignment]})
+
+    live.handleUpdate(updateEvent('task', task['id']))
+    live.flush()
+
+    rows = [data for event, data in received(client) if event == 'row' and task['id'] in data]
+    expect(len(rows) == 1, u'Expected one patched row, got {0}'.format(len(rows)))
+    expect(status['name'] in rows[0], u'The patched row does not show the new status "{0}"'.format(status['name']))
+    expect(user['last_name'] in rows[0], u'The patched row does not show the new assignee "{0}"'.format(user['last_name']))
+
+
+def check_cache_assignment():
+    '''Changing an assignment exports the chart again instead of reusing the cached one'''
+    hook = load_hook('export-gantt-chart')
+    session = MockSession()
+    project = build_project(session, tasks=50, milestones=1)
+    session.add('Location', {'name': 'ftrack.server'})
+    user = session.add('User', {'username': session.api_user})
+
+    settings = dict(hook.GanttChart.defaultSettings, show_assignees=True)
+
+    def export():
+        uploaded = len(session.store.get('FileComponent', []))
+        job = hook.exportGanttChart(session, [('Project', project['id'])], settings, user_id=user['id'])
+        expect(job.raw('status') == 'done', u'The export failed: {0}'.format(job.raw('data')))
+        return len(session.store.get('FileComponent', [])) - uploaded
+
+    try:
+        expect(export() == 1, 'The first export was not uploaded')
+        expect(export() == 0, 'The unchanged chart was not taken from the cache')
+
+        task = session.store['Task'][1]
+        assignee = [person for person in session.store['User'] if person not in [assignment.raw('resource') for assignment in task.raw('assignments')]][0]
+        assignment = session.add('Appointment', {
+            'type': 'assignment', 'context': task, 'context_id': task['id'], 'resource': assignee, 'resource_id': assignee['id']
+        })
+        session.change(task, {'assignments': task.raw('assignments') + [assignment]})
+
+        expect(export() == 1, 'The chart was taken from the cache although an assignment changed')
+    finally:
+        session.close()
+
+
+def check_upload_retry():
+    '''An interrupted upload is sent again as a whole, to a fresh url, and reports its progress per chunk'''
+    session = MockSession()
+    session.uploads = MockUploadServer(interrupt=300000)
+
+    handle, path = tempfile.mkstemp(suffix='.bin')
+    data = os.urandom(3 * upload.CHUNK_SIZE + 1000)
+    os.write(handle, data)
+    os.close(handle)
+
+    reports = []
+    try:
+        component = upload.upload_component(session, path, 'check', progress=lambda sent, total: reports.append(sent), backoff=0.0)
+
+        urls = [operation for operation in session.operations if operation['action'] == 'get_upload_metadata']
+        expect(session.uploads.files[component['id']] == data, 'The retried upload did not store the whole file')
+        expect(len(urls) == 2, u'Expected a fresh upload url for the retry, got {0} url(s)'.format(len(urls)))
+        expect(len(reports) <= 2 * 4, u'The progress was reported {0} times instead of once per chunk'.format(len(reports)))
+        expect(reports[-1] == len(data), 'The end of the upload was not reported')
+    finally:
+        session.close()
+        os.remove(path)
+
+
+def check_custom_css():
+    '''Actions do not inline custom CSS from local files or hosts which are not allowed'''
+    hook = load_hook('export-gantt-chart')
+    session = MockSession()
+
+    handle, path = tempfile.mkstemp(suffix='.css')
+    os.write(handle, b'body { color: red; }')
+    os.close(handle)
+
+    try:
+        def customCss(location, trusted=False):
+            settings = dict(hook.GanttChart.defaultSettings, custom_css=location, self_contained=True)
+            try:
+                return hook.GanttChart(session, [], settings, trusted=trusted).customCss()
+            except ValueError:
+                return None
+
+        os.environ.pop(hook.CSS_HOSTS_VARIABLE, None)
+        expect(customCss(path, trusted=True) == u'body { color: red; }', 'A trusted local file is not inlined')
+        for location in (path, 'file://' + path, 'http://127.0.0.1:8080/admin', 'https://example.com/style.css'):
+            expect(customCss(location) is None, u'Custom CSS was fetched from "{0}"'.format(location))
+
+        os.environ[hook.CSS_HOSTS_VARIABLE] = 'css.example.com'
+        expect(customCss('ftp://css.example.com/style.css') is None, 'Custom CSS was fetched by ftp')
+        expect(customCss('http://other.example.com/style.css') is None, 'Custom CSS was fetched from a host which is not allowed')
+    finally:
+        os.environ.pop(hook.CSS_HOSTS_VARIABLE, None)
+        os.remove(path)
+
+
+def check_todoist_csv():
+    '''Names and descriptions with commas, quotes and line breaks are quoted in the Todoist csv'''
+    hook = load_hook('export-to-todoist')
+    session = MockSession()
+    project = build_project(session, tasks=5, milestones=0)
+
+    task = session.store['Task'][0]
+    session.change(task, {'name': u'Layout, "final"', 'description': u'First line, "quoted"\nsecond line'})
+    context = session.store['Task'][1].raw('parent')
+    session.change(context, {'name': u'sh010, "hero"'})
+
+    path = hook.unexExportToTodoist(session).csvExporter(session, [('Project', project['id'])]).run()
+    try:
+        with io.open(path, 'rb') as csvFile:
+            rows = list(csv.reader(csvFile))
+    finally:
+        os.remove(path)
+
+    expect(all(len(row) == 9 for row in rows), u'Not all rows have 9 columns: {0}'.format([row for row in rows if len(row) != 9]))
+    contents = [row[1] for row in rows]
+    for name in (u'Layout, "final"', u'sh010, "hero"', u'First line, "quoted"\nsecond line'):
+        expect(name.encode('utf-8') in contents, u'"{0}" was not written as a single value'.format(name))
+
+
+def check_todoist_move():
+    '''An item synced below a context is moved to the project when it is synced on its own'''
+    hook = load_hook('export-to-todoist')
+    session = MockSession()
+    build_project(session, tasks=5, milestones=0)
+
+    task = [task for task in session.store['Task'] if task.raw('parent') is not None][0]
+    context = task.raw('parent')
+
+    handle, storePath = tempfile.mkstemp(suffix='.json')
+    os.close(handle)
+    os.remove(storePath)
+
+    original = hook.TodoistSync
+    hook.TodoistSync = LocalTodoist
+    try:
+        action = hook.unexExportToTodoist(session)
+        action.todoistToken = 'check'
+        action.syncStorePath = storePath
+        settings = {'todoist_project': 'project'}
+
+        action.syncTodoist(session, [('TypedContext', context['id'])], settings)
+        action.syncTodoist(session, [('TypedContext', task['id'])], settings)
+
+        known = hook.TodoistIdStore(storePath, 'check').get(task['id'])
+        item = todoist_mock_server.items[known['id']]
+        expect(known['parent'] is None, u'The store still knows the parent {0}'.format(known['parent']))
+        expect('parent_id' not in item and item.get('project_id') == 'project', u'The item was not moved to the project: {0}'.format(item))
+
+        # Without a project the item stays where it is, in Todoist and in the store
+        action.syncTodoist(session, [('TypedContext', context['id'])], settings)
+        action.syncTodoist(session, [('TypedContext', task['id'])], {})
+
+        known = hook.TodoistIdStore(storePath, 'check').get(task['id'])
+        item = todoist_mock_server.items[known['id']]
+        expect(known['parent'] == context['id'], 'The store lost the parent of an item which was not moved')
+        expect(item.get('parent_id') == hook.TodoistIdStore(storePath, 'check').get(context['id'])['id'], u'The item was moved: {0}'.format(item))
+    finally:
+        hook.TodoistSync = original
+        if os.path.exists(storePath):
+            os.remove(storePath)
+
+
+#: All checks by their name
+CHECKS = {
+    'cache-assignment': check_cache_assignment,
+    'custom-css': check_custom_css,
+    'live-status': check_live_status,
+    'load-alignment': check_load_alignment,
+    'todoist-csv': check_todoist_csv,
+    'todoist-move': check_todoist_move,
+    'upload-retry': check_upload_retry
+}
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Regression checks of the actions against synthetic data')
+    parser.add_argument('check', nargs='*', help='Checks to run (default: all of {0})'.format(', '.join(sorted(CHECKS))))
+    namespace = parser.parse_args(arguments)
+
+    unknown = [name for name in namespace.check if name not in CHECKS]
+    if unknown:
+        parser.error(u'Unknown check(s): {0}'.format(', '.join(unknown)))
+
+    failed = 0
+    for name in namespace.check or sorted(CHECKS):
+        try:
+            CHECKS[name]()
+            print(u'{0:<30} ok'.format(name))
+        except Exception:
+            failed += 1
+            print(u'{0:<30} FAILED'.format(name))
+            traceback.print_exc(file=sys.stdout)
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,885 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2019 c.arlt@unexpected.de
+# :license: GPL-3.0
+
+'''
+In-process stand-in for an ftrack server and `ftrack_api.Session`
+
+Actions may be run against it to measure or test them without a server:
+
+    from ftrack_mock import MockSession
+    from synthetic_project import build_project
+
+    session = MockSession(latency=0.02)
+    project = build_project(session, tasks=1000)
+    ...
+    print(session.stats())
+
+It behaves like the real session where it matters for performance:
+
+- Entities are shared (like the session's cache). Attributes which were not
+  fetched by a query are loaded when they are accessed, each one with a round
+  trip to the "server", just like the real session does it.
+- Changes made on the "server" (see `MockSession.change`) are only seen once
+  a query fetches the changed attributes again, like with the session's cache.
+- Query results without a limit are fetched in pages.
+- Every round trip goes through `call`, is counted and may be slowed down by
+  *latency* seconds.
+
+The query language covers what the actions use: `select ... from ... where
+... order by ... offset ... limit ...` with `and`, `or`, `not`, brackets,
+`is`, `is_not`, `in`, `not_in`, `like`, comparisons, `any`/`has` and dotted
+paths. Uploads go to a stand-in storage on localhost (see `MockUploadServer`),
+the event server is not emulated.
+'''
+
+import datetime
+import re
+import threading
+import time
+import uuid
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+try:
+    import arrow
+except ImportError:
+    arrow = None
+
+
+#: Parent type of each type (queries for a type include its sub types)
+TYPE_PARENTS = {
+    'Project': 'Context',
+    'TypedContext': 'Context',
+    'Task': 'TypedContext',
+    'Milestone': 'TypedContext',
+    'Folder': 'TypedContext',
+    'Episode': 'TypedContext',
+    'Sequence': 'TypedContext',
+    'Shot': 'TypedContext',
+    'AssetBuild': 'TypedContext',
+    'User': 'Resource',
+    'FileComponent': 'Component'
+}
+
+#: Entities returned per round trip if a query has no limit (like ftrack_api)
+PAGE_SIZE = 500
+
+#: Collections holding the created entities which point to another one (type, attribute: collection)
+BACK_REFERENCES = {
+    ('ComponentLocation', 'component'): 'component_locations'
+}
+
+
+class MockDate(datetime.datetime):
+    '''Datetime which also formats like arrow (`YYYY`, `MMMM`, `MMM`, `MM`, `DD`, `HH`, `mm`, `ss`)'''
+
+    # Longer tokens first, as `MM` is part of `MMM`
+    TOKENS = (('YYYY', '%Y'), ('MMMM', '%B'), ('MMM', '%b'), ('MM', '%m'), ('DD', '%d'), ('HH', '%H'), ('mm', '%M'), ('ss', '%S'))
+
+    def format(self, fmt='YYYY-MM-DD HH:mm:ss'):
+        for token, directive in self.TOKENS:
+            fmt = fmt.replace(token, directive)
+        return self.strftime(fmt)
+
+
+def date(year, month, day, hour=0, minute=0):
+    '''Returns a date like the ones of ftrack_api (an arrow date if arrow is there)'''
+    value = MockDate(year, month, day, hour, minute)
+    if arrow is not None:
+        return arrow.get(value)
+    return value
+
+
+def to_datetime(value):
+    '''Returns *value* (a date of an entity) as naive datetime for comparisons'''
+    if (arrow is not None and isinstance(value, arrow.Arrow)):
+        return value.naive
+    return value
+
+
+class MockEntity(dict):
+    '''
+    An entity of the stand-in
+
+    Its class is named after its entity type (like the ones of ftrack_api), so
+    `type(entity).__name__` works as usual. Reading an attribute which has not
+    been loaded yet costs a round trip. Attributes changed on the "server" keep
+    their old value in `stale` until they are fetched again.
+    '''
+
+    entity_type = 'Entity'
+
+    def __init__(self, session, data):
+        dict.__init__(self, data)
+        self.session = session
+        self.loaded = set(['id'])
+        self.stale = {}
+
+    def __getitem__(self, key):
+        if key not in self.loaded:
+            self.session.populate(self, key)
+        if key in self.stale:
+            return self.stale[key]
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        if key not in self:
+            return default
+        return self[key]
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        self.loaded.add(key)
+        self.stale.pop(key, None)
+        self.session.modified.add(self)
+
+    def fetched(self, key):
+        '''Marks *key* as loaded with its current value on the "server"'''
+        self.loaded.add(key)
+        self.stale.pop(key, None)
+
+    def raw(self, key, default=None):
+        '''Returns *key* without loading it (this is what the server sees)'''
+        return dict.get(self, key, default)
+
+    def __hash__(self):
+        return id(self)
+
+    def __eq__(self, other):
+        return self is other
+
+    def __ne__(self, other):
+        return self is not other
+
+    def __repr__(self):
+        return '<{0}({1})>'.format(self.entity_type, dict.get(self, 'id'))
+
+
+class MockQueryResult(object):
+    '''The lazy result of `MockSession.query`, fetched when it is first used'''
+
+    def __init__(self, session, expression):
+        self.session = session
+        self.expression = expression
+        self.entities = None
+
+    def fetch(self):
+        if self.entities is None:
+            self.entities = self.session.run(self.expression)
+        return self.entities
+
+    def __iter__(self):
+        return iter(self.fetch())
+
+    def __len__(self):
+        return len(self.fetch())
+
+    def __getitem__(self, index):
+        return self.fetch()[index]
+
+    def all(self):
+        return list(self.fetch())
+
+    def first(self):
+        if self.entities is None and ' limit ' not in self.expression:
+            entities = self.session.run(self.expression + ' limit 1')
+        else:
+            entities = self.fetch()
+        return entities[0] if entities else None
+
+    def one(self):
+        entities = self.fetch()
+        if (len(entities) != 1):
+            raise ValueError('Expected one result for "{0}", got {1}'.format(self.expression, len(entities)))
+        return entities[0]
+
+
+class MockEventHub(object):
+    '''Event hub which just hands published events to its subscribers'''
+
+    def __init__(self):
+        self.subscribers = []
+
+    def subscribe(self, subscription, callback):
+        topic = subscription.split('topic=')[-1].split(' ')[0]
+        self.subscribers.append((topic, callback))
+
+    def publish(self, event, on_reply=None):
+        for topic, callback in self.subscribers:
+            if (topic == event.get('topic')):
+                callback(event)
+
+    def publish_reply(self, source_event, data):
+        pass
+
+    def wait(self, duration=None):
+        if duration:
+            time.sleep(duration)
+
+
+class UploadHandler(BaseHTTPRequestHandler):
+    '''
+    Stores the data put to `/<component id>` (see `MockUploadServer`)
+
+    Like a presigned url, each put replaces the whole file. Parts and
+    resuming (`Content-Range`) are not supported and answered with 501.
+    '''
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_PUT(self):
+        uploads = self.server.uploads
+        key = self.path.lstrip('/')
+        length = int(self.headers.get('Content-Length') or 0)
+
+        with uploads.lock:
+            interrupt = uploads.interrupt
+            uploads.interrupt = None
+
+        if self.headers.get('Content-Range'):
+            return self.reply(501)
+
+        # Drop the connection once after some of the data, keeping what arrived
+        if (interrupt is not None and interrupt < length):
+            with uploads.lock:
+                uploads.files[key] = self.rfile.read(interrupt)
+            self.close_connection = True
+            return
+
+        data = self.rfile.read(length)
+        with uploads.lock:
+            uploads.files[key] = data
+
+        self.reply(200)
+
+
+class MockUploadServer(object):
+    '''
+    Storage on localhost accepting the uploads of a `MockSession` (like the one of ftrack.server)
+
+    Set *interrupt* to drop the connection of the next upload after that many bytes.
+    '''
+
+    def __init__(self, interrupt=None):
+        self.files = {}
+        self.interrupt = interrupt
+        self.lock = threading.Lock()
+
+        self.server = HTTPServer(('127.0.0.1', 0), UploadHandler)
+        self.server.uploads = self
+
+        # Clients may drop their upload (e.g. when it is cancelled)
+        self.server.handle_error = lambda request, address: None
+
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def url(self, component_id):
+        return 'http://127.0.0.1:{0}/{1}'.format(self.server.server_address[1], component_id)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class MockSession(object):
+    '''
+    Stand-in for `ftrack_api.Session` working on entities in memory
+
+    *latency* is added to every round trip (in seconds). See `stats()` for
+    what has been sent to the "server".
+    '''
+
+    def __init__(self, latency=0.0, api_user='mock.user', page_size=PAGE_SIZE):
+        self.latency = latency
+        self.api_user = api_user
+        self.page_size = page_size
+        self.event_hub = MockEventHub()
+
+        self.store = {}
+        self.modified = set()
+        self.created = []
+        self.deleted = []
+        self.classes = {}
+        self.results = {}
+        self.indexes = {}
+        self.uploads = None
+
+        self.calls = 0
+        self.operations = []
+        self.server_time = 0.0
+
+    ##########################################################################
+    # Data of the "server"
+
+    def entity_class(self, entity_type):
+        '''Returns the class of *entity_type* (created once)'''
+        if entity_type not in self.classes:
+            self.classes[entity_type] = type(str(entity_type), (MockEntity,), {'entity_type': entity_type})
+        return self.classes[entity_type]
+
+    def add(self, entity_type, data):
+        '''Adds an entity to the "server" (without any round trip) and returns it'''
+        data = dict(data)
+        data.setdefault('id', str(uuid.uuid4()))
+
+        entity = self.entity_class(entity_type)(self, data)
+        entity.loaded.update(data)
+        self.store.setdefault(entity_type, []).append(entity)
+        self.results = {}
+        self.indexes = {}
+
+        return entity
+
+    def change(self, entity, data):
+        '''
+        Changes *entity* on the "server" (like another user would), without any round trip
+
+        Attributes already loaded keep showing their old value until a query
+        fetches them again.
+        '''
+        for key, value in data.items():
+            if (key in entity.loaded and key not in entity.stale):
+                entity.stale[key] = dict.get(entity, key)
+            dict.__setitem__(entity, key, value)
+
+        self.results = {}
+        self.indexes = {}
+
+    def forget(self):
+        '''Forgets everything loaded so far (like a new session)'''
+        for entities in self.store.values():
+            for entity in entities:
+                entity.loaded = set(['id'])
+                entity.stale = {}
+
+    def entities_of(self, entity_type):
+        '''Returns all entities of *entity_type* and its sub types'''
+        entities = []
+        for storedType, stored in self.store.items():
+            current = storedType
+            while current is not None:
+                if (current == entity_type):
+                    entities.extend(stored)
+                    break
+                current = TYPE_PARENTS.get(current)
+
+        return entities
+
+    ##########################################################################
+    # Round trips
+
+    def call(self, data):
+        '''Sends *data* (a list of operations) to the "server" and returns the results'''
+        started = time.time()
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        results = []
+        for operation in data:
+            self.operations.append(operation)
+
+            # Populating only marks the attribute as loaded, see `populate`
+            if (operation['action'] == 'query' and not operation.get('populate')):
+                results.append({'data': self.evaluate(operation['expression'])})
+            else:
+                results.append({})
+
+        self.server_time += time.time() - started
+        return results
+
+    def stats(self):
+        '''Returns how many round trips and operations were sent'''
+        queries = [operation for operation in self.operations if operation['action'] == 'query']
+        return {
+            'calls': self.calls,
+            'operations': len(self.operations),
+            'queries': len(queries),
+            'populates': len([query for query in queries if query.get('populate')]),
+            'server_time': round(self.server_time, 4)
+        }
+
+    def reset_stats(self):
+        self.calls = 0
+        self.operations = []
+        self.server_time = 0.0
+
+    ##########################################################################
+    # ftrack_api.Session
+
+    def query(self, expression, page_size=None):
+        return MockQueryResult(self, expression)
+
+    def run(self, expression):
+        '''Fetches all results of *expression* (in pages, if it has no limit)'''
+        parsed = parse_query(expression)
+        if (parsed['limit'] is not None):
+            return self.call([{'action': 'query', 'expression': expression}])[0]['data']
+
+        entities = []
+        offset = parsed['offset'] or 0
+        while True:
+            page = self.call([{
+                'action': 'query',
+                'expression': u'{0} offset {1} limit {2}'.format(parsed['base'], offset, self.page_size)
+            }])[0]['data']
+            entities.extend(page)
+
+            if (len(page) < self.page_size):
+                return entities
+            offset += self.page_size
+
+    def get(self, entity_type, entity_id):
+        return self.query(u'{0} where id is "{1}"'.format(entity_type, entity_id)).first()
+
+    def populate(self, entity, attribute):
+        '''Loads *attribute* of *entity* with a round trip'''
+        self.call([{
+            'action': 'query',
+            'populate': True,
+            'expression': u'select {0} from {1} where id is "{2}"'.format(attribute, entity.entity_type, dict.get(entity, 'id'))
+        }])
+        entity.fetched(attribute)
+
+    def create(self, entity_type, data):
+        data = dict(data, id=data.get('id', str(uuid.uuid4())))
+        if entity_type.endswith('Component'):
+            data.setdefault('metadata', {})
+            data.setdefault('component_locations', [])
+
+        entity = self.entity_class(entity_type)(self, data)
+        entity.loaded.update(entity.keys())
+        self.created.append(entity)
+        return entity
+
+    def commit(self):
+        operations = [{'action': 'create', 'entity_type': entity.entity_type} for entity in self.created]
+        operations += [{'action': 'update', 'entity_type': entity.entity_type} for entity in self.modified if entity not in self.created]
+        operations += [{'action': 'delete', 'entity_type': entity.entity_type} for entity in self.deleted]
+        if operations:
+            self.call(operations)
+
+        for entity in self.created:
+            self.store.setdefault(entity.entity_type, []).append(entity)
+        for entity in self.created:
+            self.link(entity)
+        for entity in self.deleted:
+            if entity in self.store.get(entity.entity_type, []):
+                self.store[entity.entity_type].remove(entity)
+        self.results = {}
+        self.indexes = {}
+        self.created = []
+        self.modified = set()
+        self.deleted = []
+
+    def rollback(self):
+        self.created = []
+        self.modified = set()
+        self.deleted = []
+
+    def delete(self, entity):
+        self.deleted.append(entity)
+
+    def close(self):
+        if self.uploads is not None:
+            self.uploads.close()
+            self.uploads = None
+
+    def link(self, entity):
+        '''Sets the entities a created *entity* points to by their ids (e.g. `location` for `location_id`)'''
+        ids = dict((value, key[:-3]) for key, value in dict.items(entity) if key.endswith('_id'))
+        if not ids:
+            return
+
+        for entities in self.store.values():
+            for other in entities:
+                attribute = ids.get(dict.get(other, 'id'))
+                if attribute is None:
+                    continue
+
+                dict.__setitem__(entity, attribute, other)
+                entity.loaded.add(attribute)
+
+                collection = BACK_REFERENCES.get((entity.entity_type, attribute))
+                if collection is not None:
+                    dict.setdefault(other, collection, []).append(entity)
+
+    def get_upload_metadata(self, component_id, file_name, file_size, checksum=None):
+        '''Returns where to put the data of a component (on a `MockUploadServer`)'''
+        self.call([{'action': 'get_upload_metadata', 'component_id': component_id}])
+
+        if self.uploads is None:
+            self.uploads = MockUploadServer()
+
+        return {
+            'url': self.uploads.url(component_id),
+            'headers': {'Content-Type': 'application/octet-stream'}
+        }
+
+    ##########################################################################
+    # Queries
+
+    def indexed(self, entity_type, condition):
+        '''Returns the entities matching a *condition* like `parent_id in (...)` from an index (None for others)
+
+        Just like a server, this does not look at every entity for such a
+        condition. The index of an id attribute is built on first use.
+        '''
+        if (condition is None or condition[0] != 'compare' or condition[2] not in ('is', 'in')):
+            return None
+
+        path, operator, literal = condition[1:]
+        values = literal if operator == 'in' else Literals([literal])
+        if ('.' in path or not path.endswith('id') or not isinstance(values, Literals) or len(values.texts) != len(values)):
+            return None
+
+        index = self.indexes.get((entity_type, path))
+        if index is None:
+            index = {}
+            for position, entity in enumerate(self.entities_of(entity_type)):
+                index.setdefault(entity.raw(path), []).append((position, entity))
+            self.indexes[(entity_type, path)] = index
+
+        found = sorted(item for value in values.texts for item in index.get(value, []))
+        return [entity for position, entity in found]
+
+    def evaluate(self, expression):
+        '''Returns the entities matching *expression* and marks its projections as loaded'''
+        parsed = parse_query(expression)
+
+        # Pages of the same query are cut from one result (like a server's index would do)
+        entities = self.results.get(parsed['base'])
+        if entities is None:
+            entities = self.indexed(parsed['type'], parsed['where'])
+            if entities is None:
+                entities = [
+                    entity for entity in self.entities_of(parsed['type'])
+                    if parsed['where'] is None or matches(entity, parsed['where'])
+                ]
+
+            for attribute, descending in reversed(parsed['order']):
+                entities.sort(key=lambda entity: sort_key(resolve(entity, attribute)), reverse=descending)
+
+            self.results[parsed['base']] = entities
+
+        offset = parsed['offset'] or 0
+        if (parsed['limit'] is not None):
+            entities = entities[offset:offset + parsed['limit']]
+        else:
+            entities = entities[offset:]
+
+        for entity in entities:
+            load(entity, parsed['select'])
+
+        return entities
+
+
+##############################################################################
+# Parsing and evaluating the query language
+
+_QUERY = re.compile(
+    r'^\s*(?:select\s+(?P<select>.+?)\s+from\s+)?(?P<type>\w+)'
+    r'(?:\s+where\s+(?P<where>.+?))?'
+    r'(?:\s+order\s+by\s+(?P<order>.+?))?'
+    r'(?:\s+offset\s+(?P<offset>\d+))?'
+    r'(?:\s+limit\s+(?P<limit>\d+))?\s*$',
+    re.IGNORECASE | re.DOTALL
+)
+
+_TOKEN = re.compile(
+    r'\s*(?:(?P<string>"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\')|(?P<number>-?\d+(?:\.\d+)?)(?![\w.-])|'
+    r'(?P<operator>>=|<=|!=|=|>|<)|(?P<bracket>[(),])|(?P<word>[\w.]+))'
+)
+
+_parsed = {}
+
+
+def parse_query(expression):
+    '''Returns the parts of a query *expression* (cached, as the same ones come again and again)'''
+    if expression in _parsed:
+        return _parsed[expression]
+
+    match = _QUERY.match(expression)
+    if match is None:
+        raise ValueError(u'Cannot parse query "{0}"'.format(expression))
+
+    parts = match.groupdict()
+    order = []
+    for item in (parts['order'] or '').split(','):
+        words = item.split()
+        if words:
+            order.append((words[0], len(words) > 1 and words[1].lower() in ('desc', 'descending')))
+
+    base = expression
+    paging = re.search(r'(\s+offset\s+\d+)?(\s+limit\s+\d+)?\s*$', expression, re.IGNORECASE)
+    if paging is not None:
+        base = expression[:paging.start()]
+
+    parsed = {
+        'base': base,
+        'type': parts['type'],
+        'select': [item.strip() for item in parts['select'].split(',')] if parts['select'] else None,
+        'where': Condition(tokenize(parts['where'])).parse() if parts['where'] else None,
+        'order': order,
+        'offset': int(parts['offset']) if parts['offset'] else None,
+        'limit': int(parts['limit']) if parts['limit'] else None
+    }
+
+    _parsed[expression] = parsed
+    return parsed
+
+
+def tokenize(text):
+    tokens = []
+    position = 0
+    text = text.strip()
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if (match is None or match.end() == position):
+            raise ValueError(u'Cannot parse "{0}"'.format(text[position:]))
+
+        kind = match.lastgroup
+        value = match.group(kind)
+        if (kind == 'string'):
+            value = value[1:-1].replace('\\"', '"').replace("\\'", "'")
+        elif (kind == 'number'):
+            value = float(value) if '.' in value else int(value)
+        tokens.append((kind, value))
+        position = match.end()
+
+    return tokens
+
+
+class Condition(object):
+    '''Recursive descent parser for where-clauses, returns nested tuples'''
+
+    OPERATORS = ('is', 'is_not', 'in', 'not_in', 'like', 'not_like', 'after', 'before', '>', '<', '>=', '<=', '=', '!=')
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return (None, None)
+
+    def next(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def word(self, value):
+        kind, text = self.peek()
+        return kind == 'word' and text.lower() == value
+
+    def parse(self):
+        condition = self.disjunction()
+        if self.position != len(self.tokens):
+            raise ValueError('Unexpected {0}'.format(self.peek()))
+        return condition
+
+    def disjunction(self):
+        parts = [self.conjunction()]
+        while self.word('or'):
+            self.next()
+            parts.append(self.conjunction())
+        return parts[0] if len(parts) == 1 else ('or', parts)
+
+    def conjunction(self):
+        parts = [self.term()]
+        while self.word('and'):
+            self.next()
+            parts.append(self.term())
+        return parts[0] if len(parts) == 1 else ('and', parts)
+
+    def term(self):
+        if self.word('not'):
+            self.next()
+            return ('not', self.term())
+
+        kind, value = self.peek()
+        if (kind == 'bracket' and value == '('):
+            self.next()
+            condition = self.disjunction()
+            self.next()
+            return condition
+
+        kind, path = self.next()
+        kind, operator = self.next()
+        operator = operator.lower() if hasattr(operator, 'lower') else operator
+
+        if operator in ('any', 'has'):
+            self.next()
+            condition = self.disjunction()
+            self.next()
+            return ('any', path, condition)
+
+        if operator not in self.OPERATORS:
+            raise ValueError('Unknown operator {0}'.format(operator))
+
+        return ('compare', path, operator, self.value())
+
+    def value(self):
+        kind, value = self.next()
+        if (kind == 'bracket' and value == '('):
+            values = []
+            while True:
+                kind, item = self.peek()
+                if (kind == 'bracket' and item == ')'):
+                    self.next()
+                    return Literals(values)
+                if (kind == 'bracket' and item == ','):
+                    self.next()
+                    continue
+                values.append(self.value())
+
+        if (kind == 'word'):
+            lowered = value.lower()
+            if lowered in ('none', 'null'):
+                return None
+            if lowered == 'true':
+                return True
+            if lowered == 'false':
+                return False
+
+        return value
+
+
+class Literals(list):
+    '''Values of an `in` condition, the texts among them in a set (like the index of a server)'''
+
+    def __init__(self, values):
+        list.__init__(self, values)
+        self.texts = frozenset(value for value in values if hasattr(value, 'lower'))
+
+
+def raw_value(item, key):
+    if isinstance(item, MockEntity):
+        return item.raw(key)
+    if isinstance(item, dict):
+        return item.get(key)
+    return None
+
+
+def resolve(item, path):
+    '''Returns all values of a dotted *path* of *item* (collections are flattened)'''
+    values = [item]
+    for key in path.split('.'):
+        found = []
+        for value in values:
+            value = raw_value(value, key)
+            if isinstance(value, (list, tuple)):
+                found.extend(value)
+            elif isinstance(value, dict) and not isinstance(value, MockEntity) and key == 'metadata':
+                found.extend({'key': k, 'value': v} for k, v in value.items())
+            else:
+                found.append(value)
+        values = found
+
+    return values
+
+
+def comparable(value, literal):
+    '''Returns *value* and *literal* as something comparable to each other'''
+    value = to_datetime(value)
+    if isinstance(value, datetime.datetime):
+        if hasattr(literal, 'lower'):
+            literal = datetime.datetime(*[int(part) for part in re.findall(r'\d+', literal)[:6]])
+        return value, literal
+    if isinstance(value, bool) or isinstance(literal, bool):
+        return value, literal
+    if isinstance(value, (int, float)) and isinstance(literal, (int, float)):
+        return value, literal
+    if value is None or literal is None:
+        return value, literal
+    return u'{0}'.format(value), u'{0}'.format(literal)
+
+
+def compare(value, operator, literal):
+    if operator in ('in', 'not_in'):
+        if (hasattr(value, 'lower') and isinstance(literal, Literals) and len(literal.texts) == len(literal)):
+            found = value in literal.texts
+        else:
+            found = any(compare(value, 'is', item) for item in literal)
+        return found if operator == 'in' else not found
+
+    value, literal = comparable(value, literal)
+
+    if operator in ('is', '='):
+        return value == literal
+    if operator in ('is_not', '!='):
+        return value != literal
+    if operator in ('like', 'not_like'):
+        pattern = '^' + re.escape(u'{0}'.format(literal)).replace('\\%', '.*').replace('%', '.*') + '$'
+        found = re.match(pattern, u'{0}'.format(value), re.IGNORECASE) is not None
+        return found if operator == 'like' else not found
+    if value is None or literal is None:
+        return False
+    if operator in ('>', 'after'):
+        return value > literal
+    if operator in ('<', 'before'):
+        return value < literal
+    if operator == '>=':
+        return value >= literal
+    if operator == '<=':
+        return value <= literal
+
+
+def matches(item, condition):
+    '''Returns if *item* matches a parsed *condition*'''
+    kind = condition[0]
+
+    if (kind == 'and'):
+        return all(matches(item, part) for part in condition[1])
+    if (kind == 'or'):
+        return any(matches(item, part) for part in condition[1])
+    if (kind == 'not'):
+        return not matches(item, condition[1])
+    if (kind == 'any'):
+        return any(element is not None and matches(element, condition[2]) for element in resolve(item, condition[1]))
+
+    path, operator, literal = condition[1:]
+    values = resolve(item, path)
+
+    if operator in ('is_not', 'not_in', 'not_like'):
+        return all(compare(value, operator, literal) for value in values)
+    return any(compare(value, operator, literal) for value in values)
+
+
+def sort_key(values):
+    value = to_datetime(values[0]) if values else None
+    return (value is not None, value)
+
+
+def load(entity, select):
+    '''Marks the projected attributes (or all scalar ones) of *entity* as loaded'''
+    if select is None:
+        for key, value in dict.items(entity):
+            if not isinstance(value, (MockEntity, list, dict)):
+                entity.fetched(key)
+        return
+
+    for path in select:
+        items = [entity]
+        for key in path.split('.'):
+            found = []
+            for item in items:
+                if isinstance(item, MockEntity):
+                    item.fetched(key)
+                    value = item.raw(key)
+                    found.extend(value if isinstance(value, list) else [value])
+            items = found
+
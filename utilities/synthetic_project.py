@@ -0,0 +1,224 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2019 c.arlt@unexpected.de
+# :license: GPL-3.0
+
+'''
+Builds a synthetic project in a `ftrack_mock.MockSession`
+
+The project is the same for the same *seed*, also on Python 2 and 3, so runs
+can be compared:
+
+    session = MockSession()
+    project = build_project(session, tasks=10000, milestones=50, users=40)
+
+Run this file to print a summary of a project of the given size.
+'''
+
+import argparse
+import datetime
+import random
+
+from ftrack_mock import MockSession, date
+
+
+#: Task types and their colors
+TASK_TYPES = (
+    ('Animation', '#1abc9c'), ('Compositing', '#3498db'), ('Lighting', '#f1c40f'),
+    ('Modeling', '#9b59b6'), ('Rigging', '#e67e22'), ('Texture', '#e74c3c')
+)
+
+#: Statuses and their colors
+STATUSES = (
+    ('Not started', '#cccccc'), ('In progress', '#4a90d9'), ('Pending review', '#f5a623'),
+    ('Approved', '#7ed321'), ('On hold', '#d0021b')
+)
+
+#: Object types of the levels above the tasks (the first *depth* ones are used)
+LEVELS = ('Sequence', 'Shot', 'Folder', 'Folder')
+
+FIRST_NAMES = ('Anna', 'Ben', 'Clara', 'David', 'Eva', 'Felix', 'Greta', 'Hannes', 'Ida', 'Jonas')
+LAST_NAMES = ('Arlt', 'Becker', 'Conrad', 'Dietz', 'Engel', 'Fuchs', 'Graf', 'Hahn', 'Imhof', 'Jung')
+
+
+def pick(rand, count):
+    '''Returns a random index below *count*
+
+    Only `random()` gives the same numbers on Python 2 and 3 (`randrange`,
+    `randint`, `choice` and `sample` differ), so everything is drawn with it.
+    '''
+    return int(rand.random() * count)
+
+
+def sample(rand, population, count):
+    '''Returns *count* random elements of *population* (see `pick`)'''
+    pool = list(population)
+    for index in range(count):
+        other = index + pick(rand, len(pool) - index)
+        pool[index], pool[other] = pool[other], pool[index]
+
+    return pool[:count]
+
+
+def context(session, entityType, objectTypes, name, parent, project):
+    '''Adds a context below *parent* (None for the project's top level)'''
+    ancestors = (parent['ancestors'] + [parent]) if parent is not None else []
+    parent = parent if parent is not None else project
+
+    return session.add(entityType, {
+        'name': name,
+        'description': None,
+        'parent': parent,
+        'parent_id': parent['id'],
+        'project': project,
+        'project_id': project['id'],
+        'ancestors': ancestors,
+        'object_type': objectTypes[entityType],
+        'custom_attributes': {},
+        'children': []
+    })
+
+
+def build_project(session, tasks=1000, milestones=20, users=20, depth=2, days=365,
+                  assignees=2, name='synthetic', seed=1):
+    '''
+    Adds a project with *tasks* tasks and *milestones* milestones to *session*
+    and returns it
+
+    Tasks are spread over a hierarchy *depth* levels deep (like sequences and
+    shots), get dates within *days* days and up to *assignees* of the *users*.
+    Every 10th task has no start date, every 20th no dates at all.
+    The same *seed* gives the same project on Python 2 and 3.
+    '''
+    rand = random.Random(seed)
+    start = datetime.datetime(2019, 1, 7)
+
+    def day(offset):
+        moment = start + datetime.timedelta(days=offset)
+        return date(moment.year, moment.month, moment.day)
+
+    # Schema
+    objectTypes = dict(
+        (typeName, session.add('ObjectType', {'name': typeName}))
+        for typeName in ('Task', 'Milestone', 'Folder', 'Sequence', 'Shot')
+    )
+    taskTypes = [session.add('Type', {'name': typeName, 'color': color}) for typeName, color in TASK_TYPES]
+    milestoneType = session.add('Type', {'name': 'Milestone', 'color': '#555555'})
+    statuses = [session.add('Status', {'name': statusName, 'color': color}) for statusName, color in STATUSES]
+
+    people = []
+    for index in range(users):
+        firstName = FIRST_NAMES[index % len(FIRST_NAMES)]
+        lastName = LAST_NAMES[(index // len(FIRST_NAMES)) % len(LAST_NAMES)]
+        people.append(session.add('User', {
+            'username': u'{0}.{1}{2}'.format(firstName, lastName, index).lower(),
+            'first_name': firstName,
+            'last_name': lastName,
+            'is_active': True
+        }))
+
+    project = session.add('Project', {
+        'name': name,
+        'full_name': u'Synthetic project ({0} tasks)'.format(tasks),
+        'status': 'active',
+        'start_date': day(0),
+        'end_date': day(days),
+        'metadata': {},
+        'custom_attributes': {},
+        'children': []
+    })
+
+    # Hierarchy: about ten tasks per leaf, a branching factor which gives that many leaves
+    leafCount = max(1, tasks // 10)
+    branching = max(1, int(round(leafCount ** (1.0 / depth)))) if depth > 0 else 1
+
+    leaves = [None]
+    for level in range(depth):
+        entityType = LEVELS[level]
+        children = []
+        for parent in leaves:
+            for index in range(branching):
+                child = context(session, entityType, objectTypes, u'{0}{1:03d}'.format(entityType.lower(), index + 1), parent, project)
+                (parent or project)['children'].append(child)
+                children.append(child)
+        leaves = children
+
+    # Tasks
+    for index in range(tasks):
+        parent = leaves[index % len(leaves)]
+        taskType = taskTypes[pick(rand, len(taskTypes))]
+        status = statuses[pick(rand, len(statuses))]
+
+        offset = pick(rand, days)
+        length = 1 + pick(rand, 30)
+
+        task = context(session, 'Task', objectTypes, u'{0} {1}'.format(taskType['name'].lower(), index + 1), parent, project)
+        task.update({
+            'start_date': day(offset) if index % 10 != 0 else None,
+            'end_date': day(min(offset + length, days)) if index % 20 != 0 else None,
+            'description': u'Synthetic task number {0}'.format(index + 1) if index % 3 == 0 else None,
+            'type': taskType,
+            'type_id': taskType['id'],
+            'status': status,
+            'status_id': status['id'],
+            'assignments': [],
+            'custom_attributes': {'associatedFile': u'/projects/{0}/{1}/{2}_v001.ma'.format(
+                name, u'/'.join(ancestor['name'] for ancestor in task['ancestors']), task['name'].replace(' ', '_')
+            )}
+        })
+        (parent or project)['children'].append(task)
+
+        for user in sample(rand, people, min(pick(rand, assignees + 1), len(people))):
+            appointment = session.add('Appointment', {
+                'type': 'assignment',
+                'context': task,
+                'context_id': task['id'],
+                'resource': user,
+                'resource_id': user['id']
+            })
+            task['assignments'].append(appointment)
+
+    # Milestones
+    for index in range(milestones):
+        offset = (index + 1) * days // (milestones + 1)
+
+        milestone = context(session, 'Milestone', objectTypes, u'milestone {0}'.format(index + 1), None, project)
+        milestone.update({
+            'start_date': day(offset),
+            'end_date': day(offset),
+            'type': milestoneType,
+            'type_id': milestoneType['id'],
+            'status': statuses[0],
+            'status_id': statuses[0]['id'],
+            'assignments': []
+        })
+        project['children'].append(milestone)
+
+    # Building is free, everything has to be fetched again like in a new session
+    session.forget()
+    session.modified = set()
+    session.reset_stats()
+
+    return project
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Builds a synthetic ftrack project and prints its size')
+    parser.add_argument('--tasks', type=int, default=1000)
+    parser.add_argument('--milestones', type=int, default=20)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--depth', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=1)
+    namespace = parser.parse_args(arguments)
+
+    session = MockSession()
+    build_project(
+        session, tasks=namespace.tasks, milestones=namespace.milestones,
+        users=namespace.users, depth=namespace.depth, seed=namespace.seed
+    )
+
+    for entityType in sorted(session.store):
+        print(u'{0:<12} {1}'.format(entityType, len(session.store[entityType])))
+
+
+if __name__ == '__main__':
+    main()
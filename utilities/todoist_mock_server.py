@@ -0,0 +1,117 @@
+# :coding: utf-8
+# :copyright: Copyright (c) 2019 c.arlt@unexpected.de
+# :license: GPL-3.0
+
+'''
+Local stand-in for Todoist's sync endpoint
+
+Start it and point the Todoist action to it, e.g.:
+
+    python todoist_mock_server.py --port 8765
+    set TODOIST_SYNC_URL=http://localhost:8765/sync
+
+Every POST is answered like Todoist would for the commands `item_add`,
+`item_update` and `item_move`. A GET returns all items as JSON, so you can
+check what a sync has sent.
+'''
+
+import argparse
+import itertools
+import json
+import logging
+import threading
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from urlparse import parse_qs
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from urllib.parse import parse_qs
+
+
+#: All items the stand-in knows about (id: item)
+items = {}
+
+#: Amount of requests and commands received
+stats = {'requests': 0, 'commands': 0}
+
+#: Temporary ids of added items (temp_id: id)
+tempIds = {}
+
+_ids = itertools.count(1)
+_lock = threading.Lock()
+
+
+def apply_command(command):
+    '''Apply a single sync *command* and return `(status, temp_id_mapping)`'''
+    # References to added items may use their temp_id
+    args = dict(
+        (key, tempIds.get(value, value) if key in ('id', 'parent_id') else value)
+        for key, value in command.get('args', {}).items()
+    )
+
+    if command['type'] == 'item_add':
+        itemId = str(next(_ids))
+        items[itemId] = dict(args, id=itemId)
+        tempIds[command['temp_id']] = itemId
+        return 'ok', {command['temp_id']: itemId}
+
+    if command['type'] in ('item_update', 'item_move'):
+        if args.get('id') not in items:
+            return {'error_code': 22, 'error': 'Item not found'}, {}
+        if command['type'] == 'item_move' and 'project_id' in args:
+            items[args['id']].pop('parent_id', None)
+        items[args['id']].update(args)
+        return 'ok', {}
+
+    return {'error_code': 35, 'error': 'Unknown command {0}'.format(command['type'])}, {}
+
+
+class SyncHandler(BaseHTTPRequestHandler):
+    '''Answers sync requests like the Todoist API'''
+
+    def _reply(self, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        with _lock:
+            self._reply({'items': list(items.values()), 'stats': stats})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        form = parse_qs(self.rfile.read(length).decode('utf-8'))
+        commands = json.loads(form.get('commands', ['[]'])[0])
+
+        syncStatus = {}
+        tempIdMapping = {}
+        with _lock:
+            stats['requests'] += 1
+            stats['commands'] += len(commands)
+
+            for command in commands:
+                status, mapping = apply_command(command)
+                syncStatus[command['uuid']] = status
+                tempIdMapping.update(mapping)
+
+        logging.info('Received %d commands', len(commands))
+        self._reply({'sync_status': syncStatus, 'temp_id_mapping': tempIdMapping})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--port', type=int, default=8765)
+    namespace = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = HTTPServer(('localhost', namespace.port), SyncHandler)
+    logging.info('Todoist stand-in listening on http://localhost:%d/sync', namespace.port)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()